@@ -4,8 +4,13 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
+from app.chains.prompt_builder import build_inputs, with_company_profile
+from app.chains.registry import chain_registry
 from app.config import get_settings
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.services.agent_config import AgentConfig
+from app.services.guardrail_cache import guardrail_cache, prefilter_in_scope
+from app.utils.deadline import run_stage
+from app.utils.metrics import metrics
 
 settings = get_settings()
 
@@ -32,22 +37,45 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def run_guardrail(question: str, document_summary: str, company_profile: dict) -> GuardrailDecision:
-    config = await agent_config_service.get_agent_config("document_guardrail", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", config.system_prompt),
+            ("system", with_company_profile(config.system_prompt)),
             (
                 "human",
-                "Perfil da empresa:\n{company}\n\nResumo do documento:\n{document}\n\nPergunta do lead:\n{question}\n"
+                "Trechos do documento:\n{document}\n\nPergunta do lead:\n{question}\n"
                 "Responda em JSON indicando se deve permitir ou nao.",
             ),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
+    return prompt | llm.with_structured_output(schema=GuardrailDecision)
+
+
+async def run_guardrail(
+    question: str, document_summary: str, company_profile: dict, *, document_hash: str | None = None
+) -> GuardrailDecision:
+    """
+    Decide se a pergunta sobre o documento pode ser respondida. Casos obvios (pergunta e trecho
+    citam empreendimento/tema permitido) sao aprovados localmente; com `document_hash`, decisoes
+    do LLM ficam em cache por documento + pergunta normalizada.
+    """
+    if prefilter_in_scope(question, document_summary, company_profile):
+        metrics.incr("guardrail_decisions_total", source="prefilter")
+        return GuardrailDecision(allowed=True, reason="prefiltro_local")
+    chain, config = await chain_registry.get("document_guardrail", DEFAULT_CONFIG, _build)
+    key = guardrail_cache.key(config.version, company_profile, document_hash, question) if document_hash else None
+    if key:
+        cached = await guardrail_cache.get(key)
+        if cached is not None:
+            metrics.incr("guardrail_decisions_total", source="cache")
+            return GuardrailDecision(**cached)
+    decision = await run_stage(
+        "intent",
+        chain.ainvoke(
+            build_inputs(config, {"question": question, "company": company_profile}, sections=document_summary)
+        ),
     )
-    chain = prompt | llm.with_structured_output(schema=GuardrailDecision)
-    return await chain.ainvoke({"question": question, "document": document_summary, "company": company_profile})
+    metrics.incr("guardrail_decisions_total", source="llm")
+    if key:
+        await guardrail_cache.set(key, decision.model_dump())
+    return decision
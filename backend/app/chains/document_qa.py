@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+from typing import AsyncIterator
+
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 
 from app.config import get_settings
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.chains.prompt_builder import build_inputs, with_company_profile
+from app.chains.registry import chain_registry
+from app.services.agent_config import AgentConfig
+from app.utils.deadline import run_stage
 
 settings = get_settings()
 
@@ -22,30 +28,31 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def run_document_qa(question: str, document_markdown: str, company_profile: dict) -> str:
-    config = await agent_config_service.get_agent_config("document_qa", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", config.system_prompt),
+            ("system", with_company_profile(config.system_prompt)),
             (
                 "human",
-                "Perfil da empresa:\n{company}\n\nDocumento:\n{document}\n\nPergunta: {question}",
+                "Trechos relevantes do documento:\n{document}\n\nPergunta: {question}",
             ),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    chain = prompt | llm
-    response = await chain.ainvoke(
-        {
-            "company": company_profile,
-            "document": document_markdown,
-            "question": question,
-        }
-    )
-    if hasattr(response, "content"):
-        return response.content
-    return str(response)
+    return prompt | llm | StrOutputParser()
+
+
+async def _document_qa_chain(question: str, document_sections: str, company_profile: dict):
+    chain, config = await chain_registry.get("document_qa", DEFAULT_CONFIG, _build)
+    inputs = build_inputs(config, {"company": company_profile, "question": question}, sections=document_sections)
+    return chain, inputs
+
+
+async def run_document_qa(question: str, document_sections: str, company_profile: dict) -> str:
+    chain, inputs = await _document_qa_chain(question, document_sections, company_profile)
+    return await run_stage("generation", chain.ainvoke(inputs))
+
+
+async def stream_document_qa(question: str, document_sections: str, company_profile: dict) -> AsyncIterator[str]:
+    chain, inputs = await _document_qa_chain(question, document_sections, company_profile)
+    async for token in chain.astream(inputs):
+        yield token
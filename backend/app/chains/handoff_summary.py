@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 
+from app.chains.prompt_builder import build_inputs, with_company_profile
+from app.chains.registry import chain_registry
 from app.config import get_settings
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.services.agent_config import AgentConfig
 
 settings = get_settings()
 
@@ -23,23 +26,16 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def generate_handoff_summary(history_text: str, company_profile: dict) -> str:
-    config = await agent_config_service.get_agent_config("handoff_summary", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", config.system_prompt),
-            (
-                "human",
-                "Perfil da empresa:\n{company}\n\nHistorico da conversa:\n{history}\n\nResuma para o corretor:",
-            ),
+            ("system", with_company_profile(config.system_prompt)),
+            ("human", "Historico da conversa:\n{history}\n\nResuma para o corretor:"),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    response = await (prompt | llm).ainvoke({"history": history_text, "company": company_profile})
-    if hasattr(response, "content"):
-        return response.content
-    return str(response)
+    return prompt | llm | StrOutputParser()
+
+
+async def generate_handoff_summary(history_text: str, company_profile: dict) -> str:
+    chain, config = await chain_registry.get("handoff_summary", DEFAULT_CONFIG, _build)
+    return await chain.ainvoke(build_inputs(config, {"company": company_profile}, history=history_text))
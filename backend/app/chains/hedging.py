@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, AsyncIterator
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from app.config import get_settings
+from app.services.agent_config import AgentConfig
+from app.utils.metrics import metrics
+
+
+def _consume_error(task: asyncio.Task) -> None:
+    # a requisicao perdedora pode falhar depois de descartada; evita aviso no log do event loop
+    if not task.cancelled():
+        task.exception()
+
+
+def hedge_enabled(config: AgentConfig) -> bool:
+    return bool((config.metadata or {}).get("hedge"))
+
+
+def hedge_delay(agent_key: str, percentile: float) -> float:
+    """
+    Espera antes da requisicao duplicada: o percentil (p95 por padrao) da latencia recente do
+    agente, com piso em `HEDGE_MIN_DELAY_SECONDS`. Sem amostras suficientes usa o valor padrao.
+    """
+    settings = get_settings()
+    calls = metrics.counter("llm_hedge_calls_total", agent=agent_key)
+    observed = metrics.percentile("llm_hedge_latency_seconds", percentile, agent=agent_key)
+    if observed is None or calls < settings.hedge_min_samples:
+        return settings.hedge_default_delay_seconds
+    return max(settings.hedge_min_delay_seconds, observed)
+
+
+class HedgedRunnable(Runnable):
+    """
+    Chain com requisicao duplicada (hedge): se a principal nao responde ate `hedge_delay`, dispara
+    a reserva (mesma chain ou o modelo de `metadata.hedge_fallback_model`), fica com a primeira
+    resposta valida e cancela a outra. Streaming segue so pela principal.
+    """
+
+    def __init__(self, agent_key: str, primary: Runnable, backup: Runnable, percentile: float = 0.95) -> None:
+        self.agent_key = agent_key
+        self.primary = primary
+        self.backup = backup
+        self.percentile = percentile
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        return self.primary.invoke(input, config, **kwargs)
+
+    async def astream(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        async for chunk in self.primary.astream(input, config, **kwargs):
+            yield chunk
+
+    def _record(self, started: float, outcome: str) -> None:
+        metrics.incr("llm_hedge_calls_total", agent=self.agent_key)
+        metrics.observe("llm_hedge_latency_seconds", time.perf_counter() - started, agent=self.agent_key)
+        calls = metrics.counter("llm_hedge_calls_total", agent=self.agent_key)
+        fired = metrics.counter("llm_hedge_fired_total", agent=self.agent_key)
+        metrics.set_gauge("llm_hedge_rate", fired / calls, agent=self.agent_key)
+        if outcome in {"primary", "hedge"}:
+            metrics.incr("llm_hedge_wins_total", agent=self.agent_key, winner=outcome)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        primary = asyncio.create_task(self.primary.ainvoke(input, config, **kwargs))
+        primary.add_done_callback(_consume_error)
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay(self.agent_key, self.percentile))
+            if done:
+                # latencia so da principal, inclusive as que falham: base do proximo percentil
+                self._record(started, "primary_only")
+                return primary.result()
+            metrics.incr("llm_hedge_fired_total", agent=self.agent_key)
+            backup = asyncio.create_task(self.backup.ainvoke(input, config, **kwargs))
+            backup.add_done_callback(_consume_error)
+            tasks.add(backup)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # quando a reserva vence, o tempo ate aqui e um limite inferior da principal
+                        self._record(started, "primary" if task is primary else "hedge")
+                        return task.result()
+            # as duas falharam: propaga o erro da principal
+            self._record(started, "failed")
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
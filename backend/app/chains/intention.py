@@ -2,9 +2,11 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
+from app.chains.registry import chain_registry
 from app.config import get_settings
 from app.prompts.templates import MAIN_SYSTEM_PROMPT
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.services.agent_config import AgentConfig
+from app.utils.deadline import run_stage
 
 settings = get_settings()
 
@@ -25,18 +27,16 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def detect_intention(text: str) -> IntentOutput:
-    config = await agent_config_service.get_agent_config("intention", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", config.system_prompt),
             ("human", "{input}"),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    chain = prompt | llm.with_structured_output(schema=IntentOutput)
-    return await chain.ainvoke({"input": text})
+    return prompt | llm.with_structured_output(schema=IntentOutput)
+
+
+async def detect_intention(text: str) -> IntentOutput:
+    chain, _ = await chain_registry.get("intention", DEFAULT_CONFIG, _build)
+    return await run_stage("intent", chain.ainvoke({"input": text}))
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+from functools import lru_cache
+from typing import Any
+
+from app.config import get_settings
+from app.services.agent_config import AgentConfig
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# campos do perfil que nunca vao ao prompt (integracao/segredos)
+PROFILE_PRIVATE_FIELDS = {"handoff_webhook_url", "handoff_webhook_secret"}
+PROFILE_LABELS = (
+    ("nome", "Empresa"),
+    ("descricao", "Descricao"),
+    ("allowed_topics", "Temas permitidos"),
+    ("empreendimentos", "Empreendimentos"),
+    ("contatos", "Contatos"),
+    ("policy_text", "Politica"),
+)
+# mensagens antigas sao encurtadas antes de serem descartadas; as mais recentes ficam inteiras
+HISTORY_KEEP_RECENT = 4
+HISTORY_COMPRESSED_CHARS = 160
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as exc:  # pragma: no cover - sem tiktoken ou sem acesso ao arquivo BPE
+        logger.warning("Tokenizer local indisponivel, usando estimativa por caracteres error=%s", exc)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens do texto pelo tokenizer local (cl100k); sem ele, ~4 caracteres por token."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def compact_company_profile(profile: dict[str, Any]) -> str:
+    """Perfil da empresa em linhas `Rotulo: valor`, sem campos vazios nem dados de integracao."""
+    lines: list[str] = []
+    for field, label in PROFILE_LABELS:
+        value = profile.get(field)
+        if not value or field in PROFILE_PRIVATE_FIELDS:
+            continue
+        if isinstance(value, dict):
+            value = "; ".join(f"{key}: {item}" for key, item in sorted(value.items()) if item)
+        elif isinstance(value, (list, tuple)):
+            value = ", ".join(str(item) for item in value)
+        lines.append(f"{label}: {' '.join(str(value).split())}")
+    return "\n".join(lines)
+
+
+def with_company_profile(system_prompt: str) -> str:
+    """
+    System prompt seguido do perfil da empresa: os dois formam um prefixo estavel e identico entre
+    chamadas (o perfil e serializado de forma deterministica), o que permite o cache de prompt do
+    provedor. O conteudo variavel vai sempre na mensagem do usuario, depois desse prefixo.
+    """
+    return f"{system_prompt}\n\nPerfil da empresa:\n{{company}}"
+
+
+def trim_history(history: str, max_tokens: int) -> str:
+    """
+    Ajusta o historico (`autor: conteudo`, uma mensagem por linha, da mais antiga para a mais
+    recente) ao orcamento: primeiro encurta as mensagens antigas, depois descarta a partir da mais
+    antiga, indicando quantas foram omitidas. As mensagens mais recentes nunca sao encurtadas.
+    """
+    if count_tokens(history) <= max_tokens:
+        return history
+    lines = [line for line in history.splitlines() if line.strip()]
+    old = len(lines) - HISTORY_KEEP_RECENT
+    for i in range(max(0, old)):
+        if len(lines[i]) > HISTORY_COMPRESSED_CHARS:
+            lines[i] = lines[i][:HISTORY_COMPRESSED_CHARS].rstrip() + "..."
+    costs = [count_tokens(line) + 1 for line in lines]
+    total = sum(costs)
+    dropped = 0
+    while dropped < len(lines) - 1 and total > max_tokens:
+        total -= costs[dropped]
+        dropped += 1
+    kept = lines[dropped:]
+    if dropped:
+        kept.insert(0, f"[{dropped} mensagens anteriores omitidas]")
+    return "\n".join(kept)
+
+
+def trim_sections(sections: str, max_tokens: int) -> str:
+    """Descarta trechos (separados por ---) do fim ate caber; o primeiro trecho sempre fica."""
+    parts = sections.split(SECTION_SEPARATOR)
+    while len(parts) > 1 and count_tokens(SECTION_SEPARATOR.join(parts)) > max_tokens:
+        parts.pop()
+    return SECTION_SEPARATOR.join(parts)
+
+
+def input_budget(config: AgentConfig) -> int:
+    """Orcamento de entrada do agente: `metadata.max_input_tokens` ou `PROMPT_MAX_INPUT_TOKENS`."""
+    value = (config.metadata or {}).get("max_input_tokens")
+    try:
+        return int(value) if value else get_settings().prompt_max_input_tokens
+    except (TypeError, ValueError):
+        return get_settings().prompt_max_input_tokens
+
+
+def build_inputs(
+    config: AgentConfig,
+    inputs: dict[str, Any],
+    *,
+    history: str | None = None,
+    sections: str | None = None,
+) -> dict[str, Any]:
+    """
+    Monta as variaveis do prompt dentro do orcamento de tokens do agente.
+
+    `company` (perfil da empresa em dict) e serializado de forma compacta; o texto variavel
+    (`history` ou `sections`, passado a parte) fica com o que sobra do orcamento depois do
+    system prompt e dos demais campos. Os tokens economizados em relacao ao prompt sem ajuste
+    vao para `prompt_tokens_saved_total{agent}`.
+    """
+    prepared = dict(inputs)
+    baseline = 0
+    if "company" in prepared and isinstance(prepared["company"], dict):
+        baseline += count_tokens(str(prepared["company"]))
+        prepared["company"] = compact_company_profile(prepared["company"])
+        baseline -= count_tokens(prepared["company"])
+    fixed = count_tokens(config.system_prompt) + sum(count_tokens(str(value)) for value in prepared.values())
+    available = max(0, input_budget(config) - fixed)
+    if history is not None:
+        prepared["history"] = trim_history(history, available)
+        baseline += count_tokens(history) - count_tokens(prepared["history"])
+    if sections is not None:
+        prepared["document"] = trim_sections(sections, available)
+        baseline += count_tokens(sections) - count_tokens(prepared["document"])
+    if baseline > 0:
+        metrics.incr("prompt_tokens_saved_total", baseline, agent=config.agent_key)
+    metrics.observe(
+        "prompt_input_tokens",
+        fixed + count_tokens(prepared.get("history", "")) + count_tokens(prepared.get("document", "")),
+        agent=config.agent_key,
+    )
+    return prepared
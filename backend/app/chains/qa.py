@@ -1,16 +1,36 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.vectorstores import SupabaseVectorStore
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 
+from app.chains.registry import chain_registry
 from app.config import get_settings
 from app.prompts.templates import QA_SYSTEM_PROMPT
 from app.services.agent_config import AgentConfig, agent_config_service
+from app.services.answer_cache import answer_cache
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.lexical_index import lexical_index, reciprocal_rank_fusion
+from app.services.vector_index import vector_index
 from app.utils.db import get_supabase_client
+from app.utils.deadline import run_stage
+from app.utils.metrics import metrics
+from app.utils.openai_client import build_openai_embeddings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-embeddings = OpenAIEmbeddings(model=settings.embeddings_model)
+embeddings = CachedEmbeddings(
+    lambda: build_openai_embeddings(model=settings.embeddings_model), settings.embeddings_model
+)
 supabase_client = get_supabase_client()
 
 vector_store = SupabaseVectorStore(
@@ -20,7 +40,7 @@ vector_store = SupabaseVectorStore(
     query_name="match_documents",
 )
 
-retriever = vector_store.as_retriever(search_kwargs={"k": 5})
+RETRIEVER_K = 5
 
 DEFAULT_CONFIG = AgentConfig(
     agent_key="qa",
@@ -32,20 +52,136 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def run_qa(question: str) -> str:
-    docs = await retriever.aget_relevant_documents(question)
-    context = "\n\n".join(doc.page_content for doc in docs)
+@dataclass
+class QARetrieval:
+    """
+    Embedding da pergunta e documentos recuperados; o embedding pode ser reaproveitado.
+    `cached_answer` vem do cache semantico (sem busca vetorial nem geracao).
+    """
+
+    embedding: list[float]
+    docs: list[Document]
+    cached_answer: str | None = None
+    cache_namespace: str | None = None
+
+
+async def _retrieve(question: str, embedding: list[float] | None) -> QARetrieval:
     config = await agent_config_service.get_agent_config("qa", DEFAULT_CONFIG)
+    namespace = await answer_cache.namespace(config.version)
+    if namespace and embedding is None:
+        cached = await answer_cache.get_exact(namespace, question)
+        if cached is not None:
+            return QARetrieval(embedding=[], docs=[], cached_answer=cached, cache_namespace=namespace)
+    if embedding is None:
+        embedding = await embeddings.aembed_query(question)
+    if namespace:
+        cached = await answer_cache.get_similar(namespace, question, embedding)
+        if cached is not None:
+            return QARetrieval(embedding=embedding, docs=[], cached_answer=cached, cache_namespace=namespace)
+    docs = await search_documents(question, embedding)
+    return QARetrieval(embedding=embedding, docs=docs, cache_namespace=namespace)
+
+
+async def _vector_search(embedding: list[float], k: int, empreendimento: str | None = None) -> list[Document]:
+    """Snapshot local (VECTOR_INDEX_ENABLED) quando pronto; senao o RPC `match_documents` (sem filtro)."""
+    if settings.vector_index_enabled and vector_index.ready:
+        return vector_index.search(embedding, k=k, empreendimento=empreendimento)
+    if settings.vector_index_enabled:
+        vector_index.maybe_refresh()  # carrega em background; ate la segue pelo RPC
+    return await vector_store.asimilarity_search_by_vector(embedding, k=k)
+
+
+async def search_documents(
+    question: str, embedding: list[float], mode: str | None = None, empreendimento: str | None = None
+) -> list[Document]:
+    """
+    Busca os chunks da pergunta. `vector` usa apenas a busca vetorial; `hybrid` funde o vetorial
+    com o BM25 local (RRF) e, se o vetorial passar de HYBRID_VECTOR_TIMEOUT_SECONDS, responde so
+    com o lexical. `empreendimento` filtra no indice vetorial local.
+    """
+    mode = mode or settings.retrieval_mode
+    started = time.perf_counter()
+    if mode != "hybrid":
+        docs = await _vector_search(embedding, RETRIEVER_K, empreendimento)
+        metrics.observe("retrieval_seconds", time.perf_counter() - started, path="vector")
+        return docs
+    lexical = lexical_index.search(question, k=settings.hybrid_candidates)
+    vector_task = asyncio.create_task(_vector_search(embedding, settings.hybrid_candidates, empreendimento))
+    # sem resultado lexical nao ha alternativa: espera o vetorial (limitado pelo prazo do estagio)
+    timeout = settings.hybrid_vector_timeout_seconds if lexical else None
+    try:
+        done, _ = await asyncio.wait({vector_task}, timeout=timeout)
+    finally:
+        if not vector_task.done():
+            vector_task.cancel()
+            # consome eventual erro da busca descartada para nao poluir o log do event loop
+            vector_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if not done:
+        path, docs = "lexical_only", lexical[:RETRIEVER_K]
+    elif vector_task.exception() is not None and lexical:
+        logger.warning("Busca vetorial falhou, usando so o lexical error=%s", vector_task.exception())
+        path, docs = "lexical_only", lexical[:RETRIEVER_K]
+    elif not lexical:
+        path, docs = "vector_only", vector_task.result()[:RETRIEVER_K]
+    else:
+        path = "fused"
+        docs = reciprocal_rank_fusion([vector_task.result(), lexical], k=settings.hybrid_rrf_k, limit=RETRIEVER_K)
+    metrics.incr("hybrid_retrieval_total", path=path)
+    metrics.observe("retrieval_seconds", time.perf_counter() - started, path=path)
+    return docs
+
+
+async def retrieve_context(question: str, embedding: list[float] | None = None) -> QARetrieval:
+    return await run_stage("retrieval", _retrieve(question, embedding))
+
+
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", config.system_prompt),
             ("human", "Contexto:\n{context}\n\nPergunta: {input}"),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    chain = prompt | llm | StrOutputParser()
-    return await chain.ainvoke({"context": context, "input": question})
+    return prompt | llm | StrOutputParser()
+
+
+async def _qa_chain(question: str, retrieval: QARetrieval):
+    context = "\n\n".join(doc.page_content for doc in retrieval.docs)
+    chain, _ = await chain_registry.get("qa", DEFAULT_CONFIG, _build)
+    return chain, {"context": context, "input": question}
+
+
+async def _remember(question: str, retrieval: QARetrieval, answer: str) -> None:
+    # respostas sem documentos ("nao encontrei") nao entram no cache
+    if retrieval.cache_namespace and retrieval.docs and retrieval.embedding:
+        await answer_cache.store(retrieval.cache_namespace, question, retrieval.embedding, answer)
+
+
+async def run_qa(question: str, retrieval: QARetrieval | None = None) -> str:
+    """Responde com base nos documentos. `retrieval` evita repetir embedding/busca ja feitos."""
+    started = time.perf_counter()
+    if retrieval is None:
+        retrieval = await retrieve_context(question)
+    if retrieval.cached_answer is not None:
+        metrics.observe("qa_answer_seconds", time.perf_counter() - started, source="cache")
+        return retrieval.cached_answer
+    chain, inputs = await _qa_chain(question, retrieval)
+    answer = await run_stage("generation", chain.ainvoke(inputs))
+    metrics.observe("qa_answer_seconds", time.perf_counter() - started, source="llm")
+    await _remember(question, retrieval, answer)
+    return answer
+
+
+async def stream_qa(question: str, retrieval: QARetrieval | None = None) -> AsyncIterator[str]:
+    """Mesma resposta de `run_qa`, entregue token a token."""
+    if retrieval is None:
+        retrieval = await retrieve_context(question)
+    if retrieval.cached_answer is not None:
+        yield retrieval.cached_answer
+        return
+    chain, inputs = await _qa_chain(question, retrieval)
+    parts: list[str] = []
+    async for token in chain.astream(inputs):
+        parts.append(token)
+        yield token
+    await _remember(question, retrieval, "".join(parts))
@@ -1,9 +1,14 @@
+from typing import AsyncIterator
+
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 
 from app.config import get_settings
 from app.prompts.templates import MAIN_SYSTEM_PROMPT
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.chains.prompt_builder import build_inputs
+from app.chains.registry import chain_registry
+from app.services.agent_config import AgentConfig
 
 settings = get_settings()
 
@@ -19,18 +24,22 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def build_reengagement_message(history: str, base_prompt: str) -> str:
-    config = await agent_config_service.get_agent_config("reengagement", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", config.system_prompt),
-            ("human", "Historico recente:\n{history}\nBase sugerida:\n{base_prompt}\nGere a mensagem:"),
+            ("human", "Base sugerida:\n{base_prompt}\nHistorico recente:\n{history}\nGere a mensagem:"),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    result = await (prompt | llm).ainvoke({"history": history, "base_prompt": base_prompt})
-    return result.content
+    return prompt | llm | StrOutputParser()
+
+
+async def build_reengagement_message(history: str, base_prompt: str) -> str:
+    chain, config = await chain_registry.get("reengagement", DEFAULT_CONFIG, _build)
+    return await chain.ainvoke(build_inputs(config, {"base_prompt": base_prompt}, history=history))
+
+
+async def stream_reengagement_message(history: str, base_prompt: str) -> AsyncIterator[str]:
+    chain, config = await chain_registry.get("reengagement", DEFAULT_CONFIG, _build)
+    async for token in chain.astream(build_inputs(config, {"base_prompt": base_prompt}, history=history)):
+        yield token
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Any, Callable
+
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+
+from app.chains.hedging import HedgedRunnable, hedge_enabled
+from app.services.agent_config import AgentConfig, agent_config_service
+from app.utils.llm_usage import LLMUsageCallback
+from app.utils.metrics import metrics
+from app.utils.openai_client import get_openai_http_client
+
+ChainBuilder = Callable[[AgentConfig, ChatOpenAI], Runnable]
+
+
+def build_llm(config: AgentConfig) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=config.model,
+        temperature=config.temperature,
+        max_tokens=config.max_tokens,
+        http_async_client=get_openai_http_client(),
+        callbacks=[LLMUsageCallback(config.agent_key)],
+    )
+
+
+class ChainRegistry:
+    """
+    Compila cada chain uma vez por versao de `AgentConfig` e reaproveita entre chamadas.
+    Chains ficam por event loop porque o cliente HTTP compartilhado e preso ao loop.
+    """
+
+    def __init__(self) -> None:
+        self._chains: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], tuple[str, Runnable]]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def get(
+        self, agent_key: str, fallback: AgentConfig, build: ChainBuilder, kind: str = "default"
+    ) -> tuple[Runnable, AgentConfig]:
+        """Retorna a chain do agente (reconstruida so se a config mudou) e a config usada."""
+        config = await agent_config_service.get_agent_config(agent_key, fallback)
+        loop = asyncio.get_running_loop()
+        chains = self._chains.setdefault(loop, {})
+        key = (agent_key, kind)
+        cached = chains.get(key)
+        if cached is not None and cached[0] == config.version:
+            metrics.incr("chain_registry_total", result="hit")
+            return cached[1], config
+        chain = build(config, build_llm(config))
+        if hedge_enabled(config):
+            fallback = config.metadata.get("hedge_fallback_model")
+            backup = build(config, build_llm(config.model_copy(update={"model": fallback}))) if fallback else chain
+            chain = HedgedRunnable(
+                agent_key, chain, backup, percentile=float(config.metadata.get("hedge_percentile") or 0.95)
+            )
+        chains[key] = (config.version, chain)
+        metrics.incr("chain_registry_total", result="build")
+        return chain, config
+
+    def clear(self) -> None:
+        self._chains.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {"loops": len(self._chains), "chains": sum(len(c) for c in self._chains.values())}
+
+
+chain_registry = ChainRegistry()
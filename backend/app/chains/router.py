@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from app.chains.qa import QARetrieval
+from app.chains.registry import chain_registry
+from app.config import get_settings
+from app.prompts.templates import MAIN_SYSTEM_PROMPT, QA_SYSTEM_PROMPT
+from app.services.agent_config import AgentConfig, agent_config_service
+from app.utils.deadline import run_stage
+
+settings = get_settings()
+
+
+class RouterOutput(BaseModel):
+    label: str
+    answer: str | None = None
+
+
+DEFAULT_CONFIG = AgentConfig(
+    agent_key="router",
+    system_prompt=MAIN_SYSTEM_PROMPT
+    + " Classifique a intencao do lead em seguir, encerrar, pergunta ou ruido (campo label). "
+    "Somente se label=pergunta, preencha answer seguindo as regras abaixo; caso contrario deixe answer vazio."
+    + QA_SYSTEM_PROMPT
+    + " Use apenas informacoes do contexto e limite-se a respostas curtas (max 4 frases e 400 caracteres).",
+    model=settings.llm_model,
+    temperature=0.0,
+    max_tokens=450,
+    # desligado ate ser habilitado em ai_agent_configs.metadata
+    metadata={"enabled": False},
+)
+
+
+async def router_enabled() -> bool:
+    config = await agent_config_service.get_agent_config("router", DEFAULT_CONFIG)
+    return bool(config.metadata.get("enabled"))
+
+
+def _build(config: AgentConfig, llm: ChatOpenAI):
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", config.system_prompt),
+            ("human", "Contexto:\n{context}\n\nMensagem do lead: {input}"),
+        ]
+    )
+    return prompt | llm.with_structured_output(schema=RouterOutput)
+
+
+async def run_router(question: str, retrieval: QARetrieval) -> RouterOutput:
+    """Classifica a intencao e, para perguntas, ja responde com o contexto recuperado."""
+    context = "\n\n".join(doc.page_content for doc in retrieval.docs)
+    chain, _ = await chain_registry.get("router", DEFAULT_CONFIG, _build)
+    return await run_stage("generation", chain.ainvoke({"context": context, "input": question}))
@@ -1,8 +1,11 @@
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 
+from app.chains.prompt_builder import build_inputs
+from app.chains.registry import chain_registry
 from app.config import get_settings
-from app.services.agent_config import AgentConfig, agent_config_service
+from app.services.agent_config import AgentConfig
 
 settings = get_settings()
 
@@ -15,18 +18,16 @@ DEFAULT_CONFIG = AgentConfig(
 )
 
 
-async def summarize_text(text: str) -> str:
-    config = await agent_config_service.get_agent_config("summarizer", DEFAULT_CONFIG)
+def _build(config: AgentConfig, llm: ChatOpenAI):
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", config.system_prompt),
-            ("human", "{texto}"),
+            ("human", "{history}"),
         ]
     )
-    llm = ChatOpenAI(
-        model=config.model,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens,
-    )
-    result = await (prompt | llm).ainvoke({"texto": text})
-    return result.content
+    return prompt | llm | StrOutputParser()
+
+
+async def summarize_text(text: str) -> str:
+    chain, config = await chain_registry.get("summarizer", DEFAULT_CONFIG, _build)
+    return await chain.ainvoke(build_inputs(config, {}, history=text))
@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     evolution_token: str = ""
     evolution_instance: str = ""
     evolution_webhook_secret: str = ""
+    metrics_token: str = ""
     supabase_url: str = ""
     supabase_key: str = ""
     openai_api_key: str = ""
@@ -19,14 +20,99 @@ class Settings(BaseSettings):
     llm_model: str = "gpt-4o-mini"
     redis_url: str = "redis://localhost:6379/0"
     webhook_rate_limit_per_minute: int = 120
+    webhook_rate_limit_instance_per_minute: int = 1200
+    webhook_rate_limit_contact_per_minute: int = 30
+    rate_limit_window_seconds: int = 60
+    rate_limit_local_cache_size: int = 10_000
+    trust_forwarded_for: bool = False
+    webhook_ack_first: bool = False
+    dedupe_ttl_seconds: int = 24 * 60 * 60
+    dedupe_local_max_entries: int = 10_000
+    dedupe_db_batch_size: int = 200
+    dedupe_db_flush_interval_ms: int = 500
+    ingest_stream_shards: int = 16
+    ingest_stream_maxlen: int = 100_000
+    ingest_lease_ttl_seconds: int = 15
+    ingest_read_count: int = 10
+    ingest_block_ms: int = 2000
+    ingest_max_attempts: int = 5
+    ingest_retry_backoff_seconds: float = 2.0
+    document_max_concurrency: int = 4
+    document_queue_size: int = 32
+    document_drain_timeout_seconds: float = 25.0
+    document_extraction_threads: int = 2
+    document_chunk_chars: int = 1200
+    document_max_chunks: int = 400
+    document_embed_batch_size: int = 100
+    document_top_k: int = 8
+    document_qa_token_budget: int = 2500
+    document_guardrail_token_budget: int = 600
+    document_index_ttl_seconds: int = 7 * 24 * 60 * 60
+    document_followup_ttl_seconds: int = 30 * 60
+    document_followup_min_similarity: float = 0.3
+    guardrail_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    prompt_max_input_tokens: int = 6000
+    intent_local_enabled: bool = True
+    intent_local_threshold: float = 0.9
+    intent_local_max_chars: int = 60
+    intent_model_min_samples: int = 200
+    intent_model_max_samples: int = 5000
+    intent_model_refresh_seconds: int = 3600
+    speculative_retrieval: bool = False
+    conversation_cache_ttl_seconds: int = 900
+    reply_streaming: bool = False
+    reply_chunk_max_chars: int = 600
+    reply_chunk_min_chars: int = 120
+    reply_deadline_seconds: float = 30.0
+    document_deadline_seconds: float = 90.0
+    stage_budget_intent_seconds: float = 8.0
+    stage_budget_retrieval_seconds: float = 5.0
+    stage_budget_generation_seconds: float = 20.0
+    stage_budget_send_seconds: float = 10.0
+    stage_budget_indexing_seconds: float = 45.0
+    openai_timeout_seconds: float = 60.0
+    openai_max_connections: int = 50
+    llm_governor_background_share: float = 0.6
+    llm_governor_max_wait_seconds: float = 30.0
+    hedge_min_samples: int = 20
+    hedge_default_delay_seconds: float = 3.0
+    hedge_min_delay_seconds: float = 0.5
+    embedding_cache_local_size: int = 2048
+    embedding_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    retrieval_mode: str = "vector"
+    hybrid_candidates: int = 10
+    hybrid_rrf_k: int = 60
+    hybrid_vector_timeout_seconds: float = 0.8
+    lexical_index_refresh_seconds: int = 60
+    vector_index_enabled: bool = False
+    vector_index_dtype: str = "float32"
+    vector_index_snapshot_dir: str = "/tmp/sdr-vector-index"
+    vector_index_refresh_seconds: int = 60
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.95
+    answer_cache_ttl_seconds: int = 24 * 60 * 60
+    answer_cache_max_entries: int = 2000
+    answer_cache_sync_seconds: int = 30
+    answer_cache_corpus_check_seconds: int = 15
     trusted_media_hosts_raw: str = Field(default="", alias="TRUSTED_MEDIA_HOSTS")
     text_buffer_delay_seconds: int = 4
+    text_buffer_max_messages: int = 20
+    text_buffer_ttl_seconds: int = 60 * 60
+    text_buffer_poll_interval_ms: int = 500
+    text_buffer_visibility_seconds: int = 300
+    text_buffer_max_attempts: int = 3
+    conversation_max_parallel: int = 64
+    conversation_mailbox_size: int = 20
+    conversation_lease_ttl_seconds: int = 30
+    conversation_lease_wait_seconds: int = 120
     attachments_bucket: str = "attachments"
     document_max_bytes: int = 15 * 1024 * 1024
     config_cache_ttl_seconds: int = 60
     company_config_ttl_seconds: int = 300
     handoff_webhook_timeout_seconds: int = 5
 
+    llm_governor_limits_raw: str = Field(default="", alias="LLM_GOVERNOR_LIMITS")
+
     reengagement_minutes_raw: str = Field(
         default="30,180,360", alias="REENGAGEMENT_MINUTES"
     )
@@ -50,6 +136,20 @@ class Settings(BaseSettings):
                 return [30, 180, 360]
         return [30, 180, 360]
 
+    @property
+    def llm_governor_limits(self) -> dict[str, tuple[int, int]]:
+        """`modelo=rpm/tpm` separados por virgula (ex.: `gpt-4o-mini=5000/2000000,whisper-1=50/0`); 0 = sem limite."""
+        limits: dict[str, tuple[int, int]] = {}
+        for item in self.llm_governor_limits_raw.split(","):
+            model, _, values = item.partition("=")
+            rpm, _, tpm = values.partition("/")
+            try:
+                limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+            except ValueError:
+                continue
+        limits.pop("", None)
+        return limits
+
     @property
     def trusted_media_hosts(self) -> list[str]:
         if not self.trusted_media_hosts_raw:
@@ -4,11 +4,12 @@ import uuid
 from zoneinfo import ZoneInfo
 
 from app.config import get_settings
-from app.chains.reengagement import build_reengagement_message
+from app.chains.reengagement import build_reengagement_message, stream_reengagement_message
 from app.prompts.templates import REENGAGEMENT_PROMPTS
 from app.repos.conversations import ConversationsRepository
 from app.services.evolution import EvolutionClient, EvolutionSendError
 from app.services.handoff import handoff_service
+from app.services.llm_governor import BACKGROUND, priority_scope
 from app.utils.cache import get_redis_client
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,12 @@ def _mask_contact(number: str) -> str:
 
 
 async def run_reengagement(conversas_repo=None) -> None:
+    # mensagens e resumos do job cedem o orcamento de LLM ao trafego interativo
+    with priority_scope(BACKGROUND):
+        await _run_reengagement(conversas_repo)
+
+
+async def _run_reengagement(conversas_repo=None) -> None:
     settings = get_settings()
     evo = EvolutionClient()
     repo = conversas_repo or ConversationsRepository()
@@ -53,12 +60,11 @@ async def run_reengagement(conversas_repo=None) -> None:
                 if await repo.has_reengagement_after(c["id"], minutes, last_touch):
                     continue
                 history = await repo.get_history_text(c["id"], limit=20)
-                msg = await build_reengagement_message(history, base_prompt)
                 contato = (c.get("leads") or {}).get("contato", "")
                 if not contato:
                     continue
                 try:
-                    await evo.send_text(contato, msg)
+                    await _send_reengagement(evo, contato, history, base_prompt)
                 except EvolutionSendError as exc:
                     logger.error(
                         "Falha ao enviar reengajamento minutos=%s conversa=%s destino=%s error=%s",
@@ -80,28 +86,27 @@ async def run_reengagement(conversas_repo=None) -> None:
                 continue
             resumo = await repo.build_summary(c["id"], status="sem_resposta_24h")
             await repo.send_to_broker(resumo)
-        history = await repo.get_history_text(c["id"], limit=20)
-        msg = await build_reengagement_message(history, REENGAGEMENT_PROMPTS["24h_handoff"])
-        contato = (c.get("leads") or {}).get("contato", "")
-        if not contato:
-            continue
+            history = await repo.get_history_text(c["id"], limit=20)
+            contato = (c.get("leads") or {}).get("contato", "")
+            if not contato:
+                continue
             try:
-                await evo.send_text(contato, msg)
-        except EvolutionSendError as exc:
-            logger.error(
-                "Falha ao enviar handoff 24h conversa=%s destino=%s error=%s",
-                c["id"],
-                _mask_contact(contato),
-                exc,
+                await _send_reengagement(evo, contato, history, REENGAGEMENT_PROMPTS["24h_handoff"])
+            except EvolutionSendError as exc:
+                logger.error(
+                    "Falha ao enviar handoff 24h conversa=%s destino=%s error=%s",
+                    c["id"],
+                    _mask_contact(contato),
+                    exc,
+                )
+                continue
+            await handoff_service.dispatch_handoff(
+                conversa_id=c["id"],
+                history_text=history,
+                lead={"nome": (c.get("leads") or {}).get("nome"), "contato": contato},
+                status="sem_resposta_24h",
             )
-            continue
-        await handoff_service.dispatch_handoff(
-            conversa_id=c["id"],
-            history_text=history,
-            lead={"nome": (c.get("leads") or {}).get("nome"), "contato": contato},
-            status="sem_resposta_24h",
-        )
-        await repo.mark_reengaged(c["id"], 1440)
+            await repo.mark_reengaged(c["id"], 1440)
             if not await _renew_lock(redis_client, lock_value):
                 logger.warning("Lock de reengajamento perdido (24h), abortando execucao.")
                 return
@@ -109,6 +114,16 @@ async def run_reengagement(conversas_repo=None) -> None:
         await _release_lock(redis_client, lock_value)
 
 
+async def _send_reengagement(evo: EvolutionClient, contato: str, history: str, base_prompt: str) -> str:
+    if get_settings().reply_streaming:
+        return await evo.send_text_stream(
+            contato, stream_reengagement_message(history, base_prompt), agent="reengagement"
+        )
+    msg = await build_reengagement_message(history, base_prompt)
+    await evo.send_text(contato, msg)
+    return msg
+
+
 async def _release_lock(redis_client, lock_value: str) -> None:
     try:
         current_value = await redis_client.get(REENGAGEMENT_LOCK_KEY)
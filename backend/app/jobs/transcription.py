@@ -14,7 +14,9 @@ from app.config import get_settings
 from app.orchestrator import process_message
 from app.repos.conversations import ConversationsRepository
 from app.schemas.evolution import EvolutionMessage
+from app.services.conversation_executor import conversation_executor
 from app.services.evolution import EvolutionClient, EvolutionMediaError
+from app.utils.openai_client import get_openai_http_client
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -48,7 +50,7 @@ async def _process_transcription(payload: dict, conversa_id: str, mensagem_id: s
         return
 
     repo = ConversationsRepository()
-    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    client = AsyncOpenAI(api_key=settings.openai_api_key, http_client=get_openai_http_client())
 
     try:
         tmp_path = await _prepare_audio_file(message)
@@ -71,12 +73,16 @@ async def _process_transcription(payload: dict, conversa_id: str, mensagem_id: s
             pass
 
     texto = transcript or ""
-    await repo.log_message(conversa_id=conversa_id, autor="lead", tipo="texto", conteudo=f"[transcricao] {texto}")
     message.conteudo = texto
     message.tipo = "texto"
     message.conversa_id = conversa_id
-    logger.info("Transcricao concluida conversa=%s mensagem=%s", conversa_id, mensagem_id)
-    await process_message(message, override_text=texto)
+
+    async def _reply() -> None:
+        await repo.record_turn(conversa_id, "lead", "texto", f"[transcricao] {texto}")
+        logger.info("Transcricao concluida conversa=%s mensagem=%s", conversa_id, mensagem_id)
+        await process_message(message, override_text=texto)
+
+    await conversation_executor.run(conversa_id, _reply)
 
 
 def _validate_audio_url(audio_url: str) -> None:
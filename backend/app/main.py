@@ -1,14 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.config import get_settings
 from app.routes import webhook
 from app.routes import health
+from app.services.dedupe import webhook_dedupe_service
+from app.services.lexical_index import lexical_index
+from app.services.text_buffer import text_buffer_service
+from app.services.vector_index import vector_index
+from app.utils.tasks import document_tasks
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_event = asyncio.Event()
+    background: list[asyncio.Task] = [asyncio.create_task(webhook_dedupe_service.run_writer(stop_event))]
+    if text_buffer_service.enabled:
+        background.append(asyncio.create_task(text_buffer_service.run_flusher(webhook.flush_text_buffer, stop_event)))
+    if get_settings().retrieval_mode == "hybrid":
+        # carrega o indice BM25 antes da primeira pergunta
+        background.append(asyncio.create_task(lexical_index.refresh()))
+    if get_settings().vector_index_enabled:
+        # abre o snapshot local (memmap) e sincroniza o que mudou desde a ultima gravacao
+        background.append(asyncio.create_task(vector_index.refresh()))
+    try:
+        yield
+    finally:
+        stop_event.set()
+        await document_tasks.drain(get_settings().document_drain_timeout_seconds)
+        await asyncio.gather(*background, return_exceptions=True)
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="SDR-IA")
+    app = FastAPI(title="SDR-IA", lifespan=lifespan)
     app.include_router(webhook.router, prefix="/webhook", tags=["webhook"])
     app.include_router(health.router, tags=["health"])
     return app
 
 
-app = create_app()
\ No newline at end of file
+app = create_app()
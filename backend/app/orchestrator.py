@@ -1,14 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any
+import time
+from typing import Any, AsyncIterator
 
+from app.chains.document_guardrail import run_guardrail
+from app.chains.document_qa import run_document_qa, stream_document_qa
 from app.chains.intention import detect_intention
-from app.chains.qa import run_qa
+from app.chains.qa import QARetrieval, retrieve_context, run_qa, stream_qa
+from app.chains.router import router_enabled, run_router
+from app.config import get_settings
+from app.prompts.templates import DEADLINE_FALLBACKS
 from app.repos.conversations import ConversationsRepository
-from app.services.conversations import ConversationService
+from app.services.company import company_config_service
+from app.services.conversations import ConversationContext, ConversationService
+from app.services.document_index import AttachmentIndex, document_index_service
 from app.services.evolution import EvolutionClient
 from app.services.events import conversation_events_service
+from app.services.intent_classifier import intent_classifier
+from app.utils.deadline import DeadlineExceeded, deadline_scope, run_stage
+from app.utils.metrics import metrics
 
 evolution_client = EvolutionClient()
 conversation_service = ConversationService()
@@ -16,22 +28,225 @@ conversations_repo = ConversationsRepository()
 logger = logging.getLogger(__name__)
 
 
-async def process_message(message: Any, override_text: str | None = None) -> dict[str, Any]:
+async def process_message(
+    message: Any, override_text: str | None = None, context: ConversationContext | None = None
+) -> dict[str, Any]:
     """
     Orquestra a mensagem: detectar intencao, responder QA ou seguir checklist,
-    enviar midia se relevante e acionar reengajamento.
+    enviar midia se relevante e acionar reengajamento. `context` (lead + conversa ja
+    resolvidos pelo webhook) evita repetir as consultas de conversa.
     """
-    conversa = await conversation_service.ensure_active_conversation(
-        contato=message.contato, canal=message.canal, conversa_id=message.conversa_id
+    started = time.perf_counter()
+    settings = get_settings()
+    mode = "speculative" if settings.speculative_retrieval else "sequential"
+    with deadline_scope(settings.reply_deadline_seconds):
+        if context is None:
+            context = await conversation_service.resolve_context(
+                contato=message.contato, canal=message.canal, conversa_id=message.conversa_id
+            )
+        try:
+            result = await _process_message(message, override_text, context, speculative=mode == "speculative")
+        except DeadlineExceeded as exc:
+            result = await _send_deadline_fallback(message, context.conversa, exc.stage, exc.partial)
+    metrics.observe("reply_latency_seconds", time.perf_counter() - started, mode=mode, intent=result["intent"])
+    return result
+
+
+async def _send_deadline_fallback(
+    message: Any, conversa: dict[str, Any], stage: str, partial: str | None = None
+) -> dict[str, Any]:
+    """
+    Envia a resposta pronta do estagio que estourou o prazo (exceto quando o envio falhou). Se
+    parte da resposta ja foi enviada (`partial`), nao manda o fallback: so registra o que chegou.
+    """
+    logger.warning("Prazo da resposta estourado estagio=%s conversa=%s", stage, conversa["id"])
+    if partial:
+        metrics.incr("reply_partial_total", stage=stage)
+        await conversations_repo.record_turn(
+            conversa["id"],
+            "sdr",
+            "texto",
+            partial,
+            status="aguardando_resposta",
+            event_type="deadline_exceeded",
+            event_payload={"stage": stage, "partial": True},
+        )
+        return {"intent": "timeout", "answer": partial, "conversa_id": conversa["id"]}
+    fallback = DEADLINE_FALLBACKS.get(stage)
+    result = {"intent": "timeout", "answer": fallback, "conversa_id": conversa["id"]}
+    if fallback:
+        try:
+            await run_stage("send", evolution_client.send_text(message.contato, fallback), ignore_deadline=True)
+        except DeadlineExceeded:
+            fallback = None
+            result["answer"] = None
+    if fallback:
+        await conversations_repo.record_turn(
+            conversa["id"],
+            "sdr",
+            "texto",
+            fallback,
+            status="aguardando_resposta",
+            event_type="deadline_exceeded",
+            event_payload={"stage": stage},
+        )
+    else:
+        await conversation_events_service.record(conversa["id"], "deadline_exceeded", payload={"stage": stage})
+    return result
+
+
+async def _stream_reply(contato: str, tokens: AsyncIterator[str], agent: str) -> str:
+    """
+    Envia uma resposta em streaming no estagio `generation`. Se o prazo estourar depois de algum
+    trecho enviado, o `DeadlineExceeded` leva o texto parcial em `partial`.
+    """
+    delivered: list[str] = []
+    try:
+        return await run_stage(
+            "generation", evolution_client.send_text_stream(contato, tokens, agent=agent, delivered=delivered)
+        )
+    except DeadlineExceeded as exc:
+        if delivered:
+            exc.partial = " ".join(delivered)
+        raise
+
+
+async def answer_document_question(
+    contato: str,
+    conversa_id: str,
+    question: str,
+    index: AttachmentIndex,
+    *,
+    min_similarity: float | None = None,
+    embedding: list[float] | None = None,
+) -> str | None:
+    """
+    Responde sobre um anexo usando so os trechos relevantes do indice (guardrail + QA, cada um
+    com seu orcamento de tokens), envia e registra. Com `min_similarity`, retorna None sem enviar
+    nada quando o documento nao trata do assunto (pergunta segue para o QA geral). `embedding`
+    reaproveita o embedding da pergunta ja calculado pela busca do QA geral.
+    """
+    settings = get_settings()
+    query = await run_stage("retrieval", document_index_service.embed_question(question, embedding))
+    document, best = document_index_service.sections(
+        index, query, token_budget=settings.document_qa_token_budget, purpose="qa"
+    )
+    if min_similarity is not None and best < min_similarity:
+        return None
+    excerpt, _ = document_index_service.sections(
+        index, query, token_budget=settings.document_guardrail_token_budget, purpose="guardrail"
+    )
+    company = (await company_config_service.get_profile()).model_dump()
+    decision = await run_guardrail(question, excerpt, company, document_hash=index.sha256)
+    if not decision.allowed:
+        policy_message = decision.policy_message or "Consigo ajudar apenas com assuntos relacionados aos nossos empreendimentos."
+        await run_stage("send", evolution_client.send_text(contato, policy_message))
+        await conversations_repo.record_turn(
+            conversa_id,
+            "sdr",
+            "texto",
+            policy_message,
+            event_type="document_blocked",
+            event_payload={"reason": decision.reason},
+        )
+        return policy_message
+
+    if settings.reply_streaming:
+        answer = await _stream_reply(contato, stream_document_qa(question, document, company), agent="document_qa")
+    else:
+        answer = await run_document_qa(question, document, company)
+        await run_stage("send", evolution_client.send_text(contato, answer))
+    await conversations_repo.record_turn(
+        conversa_id,
+        "sdr",
+        "texto",
+        answer,
+        event_type="document_answer",
+        event_payload={"question": question, "sha256": index.sha256},
+        agent_key="document_qa",
     )
+    return answer
+
+
+async def _detect_with_speculation(texto: str) -> tuple[Any, QARetrieval | None]:
+    """
+    Roda a deteccao de intencao junto com embedding + busca vetorial. A busca so e aproveitada
+    quando a intencao for `pergunta`; nos demais casos e cancelada.
+    """
+    retrieval_task = asyncio.create_task(retrieve_context(texto))
+    try:
+        intent = await detect_intention(texto)
+    except BaseException:
+        retrieval_task.cancel()
+        raise
+    label = getattr(intent, "label", None)
+    if label == "pergunta" or (label not in {"seguir", "encerrar", "ruido"} and "?" in texto):
+        metrics.incr("speculative_retrieval_total", outcome="used")
+        return intent, await retrieval_task
+    retrieval_task.cancel()
+    # consome eventual erro da busca descartada para nao poluir o log do event loop
+    retrieval_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    metrics.incr("speculative_retrieval_total", outcome="cancelled")
+    return intent, None
+
+
+async def _route_single_call(texto: str) -> tuple[str, QARetrieval, str | None] | None:
+    """
+    Agente combinado (intencao + resposta em uma chamada). Retorna None quando desabilitado ou
+    em falha, e o orquestrador segue o fluxo em duas etapas.
+    """
+    if not await router_enabled():
+        return None
+    try:
+        retrieval = await retrieve_context(texto)
+        if retrieval.cached_answer is not None:
+            # pergunta ja respondida (cache semantico do QA): dispensa o router
+            return "pergunta", retrieval, retrieval.cached_answer
+        output = await run_router(texto, retrieval)
+    except (DeadlineExceeded, asyncio.CancelledError):
+        # sem tempo para o fluxo em duas etapas: o prazo segue para o fallback da resposta
+        raise
+    except Exception as exc:
+        metrics.incr("router_fallback_total", reason="error")
+        logger.warning("Router falhou, usando fluxo em duas etapas error=%s", exc)
+        return None
+    answer = (output.answer or "").strip() or None
+    if output.label == "pergunta" and answer is None:
+        metrics.incr("router_fallback_total", reason="missing_answer")
+    metrics.incr("router_calls_total", label=output.label)
+    return output.label, retrieval, answer if output.label == "pergunta" else None
+
+
+async def _process_message(
+    message: Any, override_text: str | None, context: ConversationContext, *, speculative: bool
+) -> dict[str, Any]:
+    conversa = context.conversa
     texto = (override_text or message.conteudo or "").strip()
-    intent = await detect_intention(texto)
-    label = getattr(intent, "label", None) or intent.dict().get("label", "ruido")
-    logger.info("Intent detectada=%s conversa=%s", label, conversa["id"])
+    retrieval: QARetrieval | None = None
+    answer_text: str | None = None
+    routed = None
+    local = intent_classifier.classify(texto)
+    if local is None:
+        routed = await _route_single_call(texto)
+    if local is not None:
+        label, source, confidence = local.label, local.source, local.confidence
+    elif routed is not None:
+        label, retrieval, answer_text = routed
+        source, confidence = "router", None
+        intent_classifier.record_llm()
+    else:
+        if speculative:
+            intent, retrieval = await _detect_with_speculation(texto)
+        else:
+            intent = await detect_intention(texto)
+        label = getattr(intent, "label", None) or intent.dict().get("label", "ruido")
+        source, confidence = "llm", None
+        intent_classifier.record_llm()
+    logger.info("Intent detectada=%s fonte=%s conversa=%s", label, source, conversa["id"])
     await conversation_events_service.record(
         conversa["id"],
         "intent_detected",
-        payload={"label": label},
+        payload={"label": label, "source": source, "confidence": confidence, "text": texto[:500]},
         agent_key="intention",
         mensagem_id=getattr(message, "mensagem_id", None),
     )
@@ -39,49 +254,79 @@ async def process_message(message: Any, override_text: str | None = None) -> dic
         label = "pergunta" if "?" in texto else "seguir"
 
     if label == "pergunta":
-        answer_text = await run_qa(texto)
-        await evolution_client.send_text(message.contato, answer_text)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", answer_text)
-        await conversation_service.touch_conversation(conversa["id"], status="respondendo_pergunta")
-        await conversation_events_service.record(
+        document = await document_index_service.active(conversa["id"])
+        if document is not None and not document.mentions(texto):
+            # nenhum termo em comum com o anexo: vai direto ao QA geral, sem embedding
+            metrics.incr("document_followup_total", outcome="no_overlap")
+        elif document is not None:
+            # documento enviado ha pouco: perguntas sobre ele reaproveitam o indice do anexo
+            answer = await answer_document_question(
+                message.contato,
+                conversa["id"],
+                texto,
+                document,
+                min_similarity=get_settings().document_followup_min_similarity,
+                embedding=retrieval.embedding if retrieval is not None and retrieval.embedding else None,
+            )
+            metrics.incr("document_followup_total", outcome="answered" if answer is not None else "not_relevant")
+            if answer is not None:
+                return {"intent": label, "answer": answer, "conversa_id": conversa["id"]}
+        answer_agent = "router" if answer_text is not None and retrieval.cached_answer is None else "qa"
+        if answer_text is None and get_settings().reply_streaming:
+            answer_text = await _stream_reply(message.contato, stream_qa(texto, retrieval=retrieval), agent="qa")
+        else:
+            if answer_text is None:
+                answer_text = await run_qa(texto, retrieval=retrieval)
+            await run_stage("send", evolution_client.send_text(message.contato, answer_text))
+        await conversations_repo.record_turn(
             conversa["id"],
-            "answer_sent",
-            payload={"answer": answer_text},
-            agent_key="qa",
+            "sdr",
+            "texto",
+            answer_text,
+            status="respondendo_pergunta",
+            event_type="answer_sent",
+            event_payload={"answer": answer_text},
+            agent_key=answer_agent,
         )
         return {"intent": label, "answer": answer_text, "conversa_id": conversa["id"]}
 
     if label == "seguir":
         prompt = "Posso seguir com algumas perguntas rapidas?"
-        await evolution_client.send_text(message.contato, prompt)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", prompt)
-        await conversation_service.touch_conversation(conversa["id"], status="qualificando")
-        await conversation_events_service.record(
+        await run_stage("send", evolution_client.send_text(message.contato, prompt))
+        await conversations_repo.record_turn(
             conversa["id"],
-            "qualifier_prompt",
-            payload={"message": prompt},
+            "sdr",
+            "texto",
+            prompt,
+            status="qualificando",
+            event_type="qualifier_prompt",
+            event_payload={"message": prompt},
         )
         return {"intent": label, "answer": prompt, "conversa_id": conversa["id"]}
 
     if label == "encerrar":
         closing = "Tudo bem, obrigado pelo retorno. Se mudar de ideia, e so chamar."
-        await evolution_client.send_text(message.contato, closing)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", closing)
-        await conversation_service.touch_conversation(conversa["id"], status="encerrar")
-        await conversation_events_service.record(
+        await run_stage("send", evolution_client.send_text(message.contato, closing))
+        await conversations_repo.record_turn(
             conversa["id"],
-            "encerrar",
-            payload={"message": closing},
+            "sdr",
+            "texto",
+            closing,
+            status="encerrar",
+            event_type="encerrar",
+            event_payload={"message": closing},
         )
         return {"intent": label, "answer": closing, "conversa_id": conversa["id"]}
 
     reform = "Nao captei bem. Prefere saber sobre preco, plantas ou localizacao?"
-    await evolution_client.send_text(message.contato, reform)
-    await conversations_repo.log_message(conversa["id"], "sdr", "texto", reform)
-    await conversation_service.touch_conversation(conversa["id"], status="aguardando_resposta")
-    await conversation_events_service.record(
+    await run_stage("send", evolution_client.send_text(message.contato, reform))
+    await conversations_repo.record_turn(
         conversa["id"],
-        "ruido",
-        payload={"message": reform},
+        "sdr",
+        "texto",
+        reform,
+        status="aguardando_resposta",
+        event_type="ruido",
+        event_payload={"message": reform},
     )
     return {"intent": label, "answer": reform, "conversa_id": conversa["id"]}
@@ -31,3 +31,11 @@ QUALIFIER_TONE_HINT = """
 Use tom casual e variado. Nunca liste muitas perguntas na mesma mensagem.
 Reconheca a resposta anterior antes de seguir para a proxima pergunta.
 """
+
+# Respostas prontas quando um estagio estoura o prazo (ver app/utils/deadline.py)
+DEADLINE_FALLBACKS = {
+    "intent": "Recebi sua mensagem! Estou verificando aqui e ja te retorno.",
+    "retrieval": "Boa pergunta! Vou confirmar essa informacao e te retorno em instantes.",
+    "generation": "Boa pergunta! Vou confirmar essa informacao e te retorno em instantes.",
+    "document": "Recebi o documento e ainda estou analisando. Te retorno assim que terminar.",
+}
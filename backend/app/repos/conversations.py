@@ -5,6 +5,7 @@ from typing import Any
 from postgrest import APIError
 
 from app.chains.summarizer import summarize_text
+from app.services.conversation_cache import conversation_cache
 from app.utils.db import get_supabase_client
 
 
@@ -53,6 +54,56 @@ class ConversationsRepository:
         res = await self._run(_insert)
         return res.data[0]
 
+    async def record_turns(self, turns: list[dict[str, Any]]) -> list[Any]:
+        """
+        Registra turnos (mensagem + toque/status da conversa + evento opcional) em uma unica
+        chamada transacional (`record_turns`). Cada turno aceita: conversa_id, autor, tipo,
+        conteudo, evolution_mensagem_id, status, event_type, event_payload e agent_key.
+        Retorna as mensagens inseridas, na ordem recebida. Idempotente por
+        `evolution_mensagem_id`: numa reentrega devolve a mensagem ja gravada, sem novo evento.
+        """
+        if not turns:
+            return []
+
+        def _rpc():
+            return self.client.rpc("record_turns", {"turns": turns}).execute()
+
+        res = await self._run(_rpc)
+        status_changes = {t["conversa_id"]: t["status"] for t in turns if t.get("status")}
+        for conversa_id, status in status_changes.items():
+            await conversation_cache.invalidate_status(conversa_id, status)
+        return res.data or []
+
+    async def record_turn(
+        self,
+        conversa_id: str,
+        autor: str,
+        tipo: str,
+        conteudo: str | None,
+        *,
+        status: str | None = None,
+        event_type: str | None = None,
+        event_payload: dict[str, Any] | None = None,
+        agent_key: str | None = None,
+        evolution_mensagem_id: str | None = None,
+    ) -> Any:
+        rows = await self.record_turns(
+            [
+                {
+                    "conversa_id": conversa_id,
+                    "autor": autor,
+                    "tipo": tipo,
+                    "conteudo": conteudo,
+                    "evolution_mensagem_id": evolution_mensagem_id,
+                    "status": status,
+                    "event_type": event_type,
+                    "event_payload": event_payload or {},
+                    "agent_key": agent_key,
+                }
+            ]
+        )
+        return rows[0] if rows else None
+
     async def register_incoming_message(self, mensagem_id: str) -> bool:
         if not mensagem_id:
             return True
@@ -72,6 +123,29 @@ class ConversationsRepository:
                 return False
             raise
 
+    async def register_incoming_messages(self, mensagem_ids: list[str]) -> set[str]:
+        """
+        Versao em lote de `register_incoming_message`: um upsert ignorando duplicados.
+        Retorna os ids efetivamente inseridos (os demais ja tinham sido recebidos).
+        """
+        ids = list(dict.fromkeys(m for m in mensagem_ids if m))
+        if not ids:
+            return set()
+
+        def _upsert():
+            return (
+                self.client.table("evolution_webhook_events")
+                .upsert(
+                    [{"mensagem_id": m} for m in ids],
+                    on_conflict="mensagem_id",
+                    ignore_duplicates=True,
+                )
+                .execute()
+            )
+
+        res = await self._run(_upsert)
+        return {row["mensagem_id"] for row in res.data or []}
+
     async def release_incoming_message(self, mensagem_id: str) -> None:
         if not mensagem_id:
             return
@@ -86,6 +160,21 @@ class ConversationsRepository:
 
         await self._run(_delete)
 
+    async def release_incoming_messages(self, mensagem_ids: list[str]) -> None:
+        ids = [m for m in mensagem_ids if m]
+        if not ids:
+            return
+
+        def _delete():
+            return (
+                self.client.table("evolution_webhook_events")
+                .delete()
+                .in_("mensagem_id", ids)
+                .execute()
+            )
+
+        await self._run(_delete)
+
     async def list_inactive(self, minutes: int | None = None, hours: int | None = None) -> list[Any]:
         delta = timedelta(minutes=minutes) if minutes else timedelta(hours=hours or 0)
         threshold = _now_utc() - delta
@@ -1,4 +1,9 @@
-from fastapi import APIRouter
+import hmac
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app.config import get_settings
+from app.utils.metrics import metrics
 
 router = APIRouter()
 
@@ -7,3 +12,15 @@ router = APIRouter()
 @router.get("/health", tags=["health"])
 async def health():
     return {"status": "ok"}
+
+
+@router.get("/metrics", tags=["health"])
+async def metrics_snapshot(request: Request):
+    # desligado por padrao: os rotulos expoem instancias, escopos e agentes
+    settings = get_settings()
+    if not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="not_found")
+    provided = request.headers.get("authorization", "")
+    if not hmac.compare_digest(provided.encode(), f"Bearer {settings.metrics_token}".encode()):
+        raise HTTPException(status_code=401, detail="invalid_token")
+    return metrics.snapshot()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
 import uuid
 from typing import Any
@@ -8,19 +9,24 @@ from urllib.parse import urlparse
 
 from fastapi import APIRouter, HTTPException, Request
 
-from app.chains.document_guardrail import run_guardrail
-from app.chains.document_qa import run_document_qa
 from app.config import get_settings
 from app.jobs.transcription import enqueue_transcription
-from app.orchestrator import process_message
+from app.orchestrator import answer_document_question, process_message
+from app.prompts.templates import DEADLINE_FALLBACKS
 from app.repos.conversations import ConversationsRepository
 from app.schemas.evolution import EvolutionMedia, EvolutionMessage
 from app.services.attachments import AttachmentProcessingError, attachment_service
-from app.services.company import company_config_service
-from app.services.conversations import ConversationService
+from app.services.conversation_executor import conversation_executor
+from app.services.conversations import ConversationContext, ConversationService
+from app.services.dedupe import webhook_dedupe_service
+from app.services.document_index import document_index_service
 from app.services.evolution import EvolutionClient
 from app.services.events import conversation_events_service
-from app.utils.cache import delete_key, get_redis_client, set_if_absent
+from app.services.rate_limit import Bucket, rate_limiter
+from app.services.ingestion import ingestion_queue
+from app.services.text_buffer import BufferedText, text_buffer_service
+from app.utils.deadline import DeadlineExceeded, deadline_scope, run_stage
+from app.utils.tasks import document_tasks
 
 router = APIRouter()
 evolution_client = EvolutionClient()
@@ -29,11 +35,6 @@ conversations_repo = ConversationsRepository()
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-DEDUP_TTL_SECONDS = 60 * 60
-TEXT_BUFFER_DATA: dict[str, dict[str, Any]] = {}
-TEXT_BUFFER_TASKS: dict[str, asyncio.Task] = {}
-TEXT_BUFFER_LOCK = asyncio.Lock()
-
 
 def _mask_contact(contact: str) -> str:
     if not contact:
@@ -100,24 +101,57 @@ def _extract_media_payload(message_type: str, message: dict[str, Any]) -> tuple[
     return "texto", None, None
 
 
-async def _enforce_rate_limit(request: Request) -> None:
-    identifier = request.client.host or "unknown"
-    key = f"evolution:webhook:rate:{identifier}"
-    client = get_redis_client()
-    try:
-        count = await client.incr(key)
-        if count == 1:
-            await client.expire(key, 60)
-        if count > settings.webhook_rate_limit_per_minute:
-            logger.warning("Rate limit exceeded ip=%s count=%s", identifier, count)
-            raise HTTPException(status_code=429, detail="rate_limited")
-    except Exception as exc:  # pragma: no cover - best effort
-        logger.warning("Falha ao aplicar rate limit redis_error=%s", exc)
+def _client_ip(request: Request) -> str:
+    if settings.trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        first = forwarded.split(",")[0].strip()
+        if first:
+            return first
+    return (request.client.host if request.client else None) or "unknown"
+
+
+async def _enforce_rate_limit(request: Request, messages: list[EvolutionMessage]) -> list[EvolutionMessage]:
+    """
+    Aplica os limites por IP, instancia e contato em uma unica chamada. Estouro de IP/instancia
+    rejeita a requisicao (429); estouro de contato descarta apenas as mensagens daquele contato.
+    """
+    window = settings.rate_limit_window_seconds
+    identifier = _client_ip(request)
+    instance = next((m.instancia for m in messages if m.instancia), None) or settings.evolution_instance or "default"
+    per_contact: dict[str, int] = {}
+    for message in messages:
+        per_contact[message.contato] = per_contact.get(message.contato, 0) + 1
+    decision = await rate_limiter.check(
+        required=[
+            Bucket("ip", identifier, settings.webhook_rate_limit_per_minute, window),
+            Bucket("instance", instance, settings.webhook_rate_limit_instance_per_minute, window),
+        ],
+        optional=[
+            Bucket("contact", contato, settings.webhook_rate_limit_contact_per_minute, window, cost=count)
+            for contato, count in per_contact.items()
+        ],
+    )
+    if not decision.allowed:
+        logger.warning(
+            "Rate limit exceeded scope=%s ip=%s instance=%s retry_after=%.1fs",
+            decision.blocked_scope,
+            identifier,
+            instance,
+            decision.retry_after,
+        )
+        raise HTTPException(
+            status_code=429,
+            detail="rate_limited",
+            headers={"Retry-After": str(max(1, int(decision.retry_after + 0.999)))},
+        )
+    if not decision.blocked_buckets:
+        return messages
+    for contato in decision.blocked_buckets:
+        logger.warning("Rate limit por contato contato=%s", _mask_contact(contato))
+    return [m for m in messages if m.contato not in decision.blocked_buckets]
 
 
 def parse_evolution_payload(raw: Any) -> EvolutionMessage:
-    if isinstance(raw, list) and raw:
-        raw = raw[0]
     if isinstance(raw, dict) and all(k in raw for k in ["mensagem_id", "contato", "tipo"]):
         return EvolutionMessage(**raw)
 
@@ -134,6 +168,7 @@ def parse_evolution_payload(raw: Any) -> EvolutionMessage:
     mensagem_id = key.get("id") or data.get("id") or ""
     message_type = data.get("messageType") or ""
     nome = data.get("pushName") or raw.get("pushName") or None
+    instancia = raw.get("instance") or raw.get("instanceName") or None
 
     tipo, media_url, media_payload = _extract_media_payload(message_type, message)
     conteudo = media_url if media_url else _extract_text(message, data)
@@ -154,9 +189,40 @@ def parse_evolution_payload(raw: Any) -> EvolutionMessage:
         nome=nome,
         conversa_id=None,
         media=media_model,
+        instancia=instancia if isinstance(instancia, str) else None,
     )
 
 
+def _expand_payload(raw: Any) -> list[Any]:
+    if isinstance(raw, list):
+        items: list[Any] = []
+        for item in raw:
+            items.extend(_expand_payload(item))
+        return items
+    if isinstance(raw, dict) and isinstance(raw.get("data"), list):
+        return [{**raw, "data": item} for item in raw["data"]]
+    return [raw]
+
+
+def parse_evolution_batch(raw: Any) -> list[EvolutionMessage]:
+    """
+    Aceita um evento unico ou lotes (lista de eventos ou `data` em lista) e devolve todas as
+    mensagens validas, na ordem de entrega. Itens invalidos sao descartados com log.
+    """
+    items = _expand_payload(raw)
+    if len(items) == 1:
+        return [parse_evolution_payload(items[0])]
+    messages: list[EvolutionMessage] = []
+    for index, item in enumerate(items):
+        try:
+            messages.append(parse_evolution_payload(item))
+        except HTTPException as exc:
+            logger.warning("Item de lote invalido descartado indice=%s reason=%s", index, exc.detail)
+    if not messages:
+        raise HTTPException(status_code=422, detail="Lote sem mensagens validas")
+    return messages
+
+
 @router.post("/evolution")
 async def evolution_webhook(request: Request):
     if settings.evolution_webhook_secret:
@@ -165,8 +231,6 @@ async def evolution_webhook(request: Request):
             logger.warning("Invalid webhook secret ip=%s", request.client.host)
             raise HTTPException(status_code=401, detail="invalid_signature")
 
-    await _enforce_rate_limit(request)
-
     try:
         payload = await request.json()
     except Exception as exc:
@@ -175,168 +239,313 @@ async def evolution_webhook(request: Request):
         return {"status": "ignored", "reason": "json_invalid"}
 
     try:
-        evo_msg = parse_evolution_payload(payload)
+        messages = parse_evolution_batch(payload)
     except HTTPException as exc:
         logger.warning("Payload invalido reason=%s", exc.detail)
         return {"status": "ignored", "reason": exc.detail}
     except Exception as exc:
         logger.exception("Erro inesperado ao parsear payload: %s", exc)
         return {"status": "ignored", "reason": "parse_error"}
+    is_batch = isinstance(payload, list) or len(messages) > 1
 
-    dedupe_key: str | None = None
-    db_lock_acquired = False
-    if evo_msg.mensagem_id:
-        dedupe_key = f"evolution:webhook:msg:{evo_msg.mensagem_id}"
-        try:
-            is_new = await set_if_absent(dedupe_key, "1", ttl_seconds=DEDUP_TTL_SECONDS)
-        except Exception as exc:  # pragma: no cover - best effort
-            logger.warning("Falha ao registrar dedupe redis_error=%s", exc)
-            is_new = True
-        if not is_new:
-            logger.info(
-                "Mensagem duplicada ignorada contato=%s mensagem_id=%s",
-                _mask_contact(evo_msg.contato),
-                evo_msg.mensagem_id,
-            )
-            return {"status": "ignored", "reason": "duplicate"}
+    allowed = await _enforce_rate_limit(request, messages)
+    claimed = await webhook_dedupe_service.claim([m.mensagem_id for m in allowed]) if allowed else set()
+    fresh = _first_claims(allowed, claimed)
+    allowed_ids = {m.mensagem_id for m in allowed}
+
+    def _skipped(message: EvolutionMessage) -> dict[str, Any]:
+        reason = "duplicate" if message.mensagem_id in allowed_ids else "rate_limited"
+        return {"status": "ignored", "reason": reason}
+
+    if not fresh:
+        if not is_batch:
+            return _skipped(messages[0])
+        return {"status": "ok", "results": [_skipped(m) for m in messages]}
+
+    if settings.webhook_ack_first:
         try:
-            inserted = await conversations_repo.register_incoming_message(evo_msg.mensagem_id)
-        except Exception:
-            if dedupe_key:
-                await delete_key(dedupe_key)
-            raise
-        if not inserted:
-            logger.info(
-                "Mensagem duplicada (db) ignorada contato=%s mensagem_id=%s",
-                _mask_contact(evo_msg.contato),
-                evo_msg.mensagem_id,
-            )
-            return {"status": "ignored", "reason": "duplicate"}
-        db_lock_acquired = True
+            entry_ids = await ingestion_queue.enqueue_many(fresh)
+        except Exception as exc:
+            logger.error("Falha ao enfileirar lote tamanho=%s error=%s", len(fresh), exc)
+            await webhook_dedupe_service.release([m.mensagem_id for m in fresh])
+            raise HTTPException(status_code=503, detail="ingestion_unavailable") from exc
+        if not is_batch:
+            return {"status": "ack", "queued": "ingestion", "entry_id": entry_ids[0]}
+        return {"status": "ack", "queued": "ingestion", "entry_ids": entry_ids}
+
+    try:
+        with deadline_scope(settings.reply_deadline_seconds):
+            results = await handle_inbound_batch(fresh)
+    except Exception as exc:  # pragma: no cover - observability hook
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    if not is_batch:
+        return results[0]
+    by_id = {m.mensagem_id: r for m, r in zip(fresh, results)}
+    return {"status": "ok", "results": [by_id.get(m.mensagem_id) or _skipped(m) for m in messages]}
+
+
+def _first_claims(messages: list[EvolutionMessage], claimed: set[str]) -> list[EvolutionMessage]:
+    """Mantem a primeira ocorrencia de cada mensagem reivindicada, na ordem recebida."""
+    fresh: list[EvolutionMessage] = []
+    seen: set[str] = set()
+    for message in messages:
+        if message.mensagem_id in claimed and message.mensagem_id not in seen:
+            seen.add(message.mensagem_id)
+            fresh.append(message)
+            continue
+        logger.info(
+            "Mensagem duplicada ignorada contato=%s mensagem_id=%s",
+            _mask_contact(message.contato),
+            message.mensagem_id,
+        )
+    return fresh
+
+
+async def handle_inbound_message(evo_msg: EvolutionMessage) -> dict[str, Any]:
+    """
+    Processa uma mensagem ja deduplicada. Usado pelos consumidores da fila de ingestao.
+    """
+    results = await handle_inbound_batch([evo_msg])
+    return results[0]
+
+
+def _group_by_contact(messages: list[EvolutionMessage]) -> dict[str, list[EvolutionMessage]]:
+    groups: dict[str, list[EvolutionMessage]] = {}
+    for message in messages:
+        groups.setdefault(message.contato, []).append(message)
+    return groups
 
-    conversa = await conversation_service.ensure_active_conversation(
-        contato=evo_msg.contato, canal=evo_msg.canal, conversa_id=evo_msg.conversa_id, nome=evo_msg.nome
-    )
-    evo_msg.conversa_id = conversa["id"]
 
+async def _release_messages(messages: list[EvolutionMessage]) -> None:
+    await webhook_dedupe_service.release([m.mensagem_id for m in messages])
+
+
+async def handle_inbound_batch(messages: list[EvolutionMessage]) -> list[dict[str, Any]]:
+    """
+    Processa mensagens ja deduplicadas (`webhook_dedupe_service.claim`): registra e encaminha.
+
+    Mensagens e eventos vao em um insert em lote cada; as mensagens sao agrupadas por contato,
+    de modo que textos do mesmo lead chegam juntos ao orquestrador. Em caso de falha libera o
+    dedupe das mensagens afetadas e propaga a excecao para permitir nova tentativa. Devolve um
+    resultado por mensagem, na ordem recebida.
+    """
+    results: dict[str, dict[str, Any]] = {}
+    groups = _group_by_contact(messages)
+    pending_texts: dict[str, list[EvolutionMessage]] = {}
+    shed: list[tuple[EvolutionMessage, dict[str, Any]]] = []
     try:
-        logged = await conversations_repo.log_message(
-            conversa_id=evo_msg.conversa_id,
-            autor="lead",
-            tipo=evo_msg.tipo,
-            conteudo=evo_msg.conteudo,
-            evolution_mensagem_id=evo_msg.mensagem_id,
+        contexts = await asyncio.gather(
+            *(
+                conversation_service.resolve_context(
+                    contato=group[0].contato,
+                    canal=group[0].canal,
+                    conversa_id=group[0].conversa_id,
+                    nome=next((m.nome for m in group if m.nome), None),
+                )
+                for group in groups.values()
+            )
         )
-        await conversation_service.touch_conversation(conversa["id"])
-        await conversation_events_service.record(
-            conversa["id"],
-            "incoming_message",
-            payload={"tipo": evo_msg.tipo},
-            mensagem_id=logged["id"],
+        context_by_contact = dict(zip(groups, contexts))
+        conversa_by_contact = {contato: ctx.conversa for contato, ctx in context_by_contact.items()}
+        for message in messages:
+            message.conversa_id = conversa_by_contact[message.contato]["id"]
+
+        # mensagem + toque da conversa + evento incoming_message em uma unica transacao
+        logged_rows = await conversations_repo.record_turns(
+            [
+                {
+                    "conversa_id": m.conversa_id,
+                    "autor": "lead",
+                    "tipo": m.tipo,
+                    "conteudo": m.conteudo,
+                    "evolution_mensagem_id": m.mensagem_id,
+                    "event_type": "incoming_message",
+                    "event_payload": {"tipo": m.tipo},
+                }
+                for m in messages
+            ]
         )
-        if evo_msg.tipo == "audio":
-            enqueue_transcription.delay(evo_msg.model_dump(), conversa["id"], logged["id"])
-            logger.info(
-                "Audio recebido contato=%s conversa=%s mensagem=%s",
-                _mask_contact(evo_msg.contato),
-                conversa["id"],
-                logged["id"],
-            )
-            return {
-                "status": "ack",
-                "queued": "transcription",
-                "conversa_id": conversa["id"],
-                "mensagem_id": logged["id"],
-            }
-        if evo_msg.tipo == "documento":
-            asyncio.create_task(_process_document_message(evo_msg, conversa, logged["id"]))
-            return {
-                "status": "ack",
-                "queued": "document_processing",
-                "conversa_id": conversa["id"],
-                "mensagem_id": logged["id"],
-            }
-        if evo_msg.tipo == "texto" and await _buffer_text_message(evo_msg, conversa["id"]):
-            return {
-                "status": "buffered",
-                "conversa_id": conversa["id"],
-                "mensagem_id": logged["id"],
-            }
-        response = await process_message(evo_msg, override_text=evo_msg.conteudo)
-    except Exception as exc:  # pragma: no cover - observability hook
-        if dedupe_key:
-            await delete_key(dedupe_key)
-        if db_lock_acquired and evo_msg.mensagem_id:
-            await conversations_repo.release_incoming_message(evo_msg.mensagem_id)
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        logged = {row["evolution_mensagem_id"]: row for row in logged_rows}
+
+        events: list[dict[str, Any]] = []
+        for contato, group in groups.items():
+            conversa = conversa_by_contact[contato]
+            for message in group:
+                mensagem_id = logged[message.mensagem_id]["id"]
+                base = {"conversa_id": conversa["id"], "mensagem_id": mensagem_id}
+                if message.tipo == "audio":
+                    enqueue_transcription.delay(message.model_dump(), conversa["id"], mensagem_id)
+                    logger.info(
+                        "Audio recebido contato=%s conversa=%s mensagem=%s",
+                        _mask_contact(message.contato),
+                        conversa["id"],
+                        mensagem_id,
+                    )
+                    results[message.mensagem_id] = {"status": "ack", "queued": "transcription", **base}
+                elif message.tipo == "documento":
+                    accepted = document_tasks.submit(
+                        functools.partial(
+                            conversation_executor.run,
+                            conversa["id"],
+                            functools.partial(_process_document_message, message, conversa, mensagem_id),
+                        )
+                    )
+                    if accepted:
+                        results[message.mensagem_id] = {"status": "ack", "queued": "document_processing", **base}
+                    else:
+                        logger.warning(
+                            "Documento recusado por sobrecarga conversa=%s depth=%s",
+                            conversa["id"],
+                            document_tasks.depth,
+                        )
+                        events.append(
+                            {
+                                "conversa_id": conversa["id"],
+                                "event_type": "document_shed",
+                                "payload": {"depth": document_tasks.depth},
+                                "mensagem_id": mensagem_id,
+                            }
+                        )
+                        shed.append((message, conversa))
+                        results[message.mensagem_id] = {"status": "shed", **base}
+                elif message.tipo == "texto" and (count := await _buffer_text_message(message, conversa["id"])):
+                    events.append(
+                        {
+                            "conversa_id": conversa["id"],
+                            "event_type": "text_buffered",
+                            "payload": {"count": count},
+                            "mensagem_id": mensagem_id,
+                        }
+                    )
+                    results[message.mensagem_id] = {"status": "buffered", **base}
+                else:
+                    pending_texts.setdefault(contato, []).append(message)
+        await conversation_events_service.record_many(events)
+    except Exception:  # pragma: no cover - observability hook
+        await _release_messages(messages)
+        raise
 
+    if shed:
+        await asyncio.gather(*(_notify_document_shed(m, c) for m, c in shed), return_exceptions=True)
+    contacts = list(pending_texts)
+    outcomes = await asyncio.gather(
+        *(_process_grouped_texts(pending_texts[c], context_by_contact[c], logged) for c in contacts),
+        return_exceptions=True,
+    )
+    failure: BaseException | None = None
+    for contato, outcome in zip(contacts, outcomes):
+        group = pending_texts[contato]
+        if isinstance(outcome, BaseException):
+            await _release_messages(group)
+            failure = failure or outcome
+            continue
+        results.update(outcome)
+    if failure:
+        raise failure
+    return [results[m.mensagem_id] for m in messages]
+
+
+async def _process_grouped_texts(
+    group: list[EvolutionMessage],
+    context: ConversationContext,
+    logged: dict[str, dict[str, Any]],
+) -> dict[str, dict[str, Any]]:
+    """Junta os textos nao bufferizados de um contato e chama o orquestrador uma unica vez."""
+    conversa = context.conversa
+    last = group[-1]
+    aggregated = " ".join((m.conteudo or "").strip() for m in group if (m.conteudo or "").strip()).strip()
+    if len(group) > 1:
+        last = last.model_copy(update={"conteudo": aggregated})
+    response = await conversation_executor.run(
+        conversa["id"], lambda: process_message(last, override_text=aggregated or last.conteudo, context=context)
+    )
     logger.info(
         "Mensagem encaminhada contato=%s conversa=%s intent=%s",
-        _mask_contact(evo_msg.contato),
+        _mask_contact(last.contato),
         conversa["id"],
         response.get("intent"),
     )
-    return {"status": "ok", "response": response, "conversa_id": conversa["id"], "mensagem_id": logged["id"]}
-
-
-async def _buffer_text_message(evo_msg: EvolutionMessage, conversa_id: str) -> bool:
-    if settings.text_buffer_delay_seconds <= 0:
-        return False
+    results: dict[str, dict[str, Any]] = {}
+    for message in group[:-1]:
+        results[message.mensagem_id] = {
+            "status": "grouped",
+            "conversa_id": conversa["id"],
+            "mensagem_id": logged[message.mensagem_id]["id"],
+        }
+    results[group[-1].mensagem_id] = {
+        "status": "ok",
+        "response": response,
+        "conversa_id": conversa["id"],
+        "mensagem_id": logged[group[-1].mensagem_id]["id"],
+    }
+    return results
+
+
+async def _buffer_text_message(evo_msg: EvolutionMessage, conversa_id: str) -> int:
+    """Acrescenta o texto ao buffer e retorna o tamanho atual (0 quando nao bufferizado)."""
+    if not text_buffer_service.enabled:
+        return 0
     texto = (evo_msg.conteudo or "").strip()
     if not texto:
-        return False
-
-    async with TEXT_BUFFER_LOCK:
-        data = TEXT_BUFFER_DATA.get(conversa_id)
-        if not data:
-            data = {"texts": [], "payload": evo_msg.model_dump()}
-            TEXT_BUFFER_DATA[conversa_id] = data
-        else:
-            data["payload"] = evo_msg.model_dump()
-        data["texts"].append(texto)
-        task = TEXT_BUFFER_TASKS.get(conversa_id)
-        if task:
-            task.cancel()
-        TEXT_BUFFER_TASKS[conversa_id] = asyncio.create_task(_flush_text_buffer(conversa_id))
-        count = len(data["texts"])
-    await conversation_events_service.record(
-        conversa_id,
-        "text_buffered",
-        payload={"count": count},
-        mensagem_id=evo_msg.mensagem_id,
-    )
-    return True
+        return 0
+    return await text_buffer_service.append(conversa_id, texto, evo_msg.model_dump())
 
 
-async def _flush_text_buffer(conversa_id: str) -> None:
+async def flush_text_buffer(item: BufferedText) -> None:
     try:
-        await asyncio.sleep(settings.text_buffer_delay_seconds)
-        async with TEXT_BUFFER_LOCK:
-            data = TEXT_BUFFER_DATA.pop(conversa_id, None)
-            TEXT_BUFFER_TASKS.pop(conversa_id, None)
-        if not data:
-            return
-        texts = data["texts"]
-        payload = data["payload"]
-        aggregated = " ".join(t.strip() for t in texts if t.strip()).strip()
+        aggregated = " ".join(t.strip() for t in item.texts if t.strip()).strip()
         if not aggregated:
             return
         await conversation_events_service.record(
-            conversa_id,
+            item.conversa_id,
             "text_buffer_flushed",
-            payload={"count": len(texts)},
+            payload={"count": len(item.texts)},
         )
-        evo_data = payload.copy()
+        evo_data = item.payload.copy()
         evo_data["conteudo"] = aggregated
         evo_msg = EvolutionMessage(**evo_data)
-        await process_message(evo_msg, override_text=aggregated)
+        await conversation_executor.run(
+            item.conversa_id, lambda: process_message(evo_msg, override_text=aggregated)
+        )
     except asyncio.CancelledError:
         raise
     except Exception as exc:  # pragma: no cover
-        logger.exception("Erro ao processar buffer da conversa=%s error=%s", conversa_id, exc)
+        logger.exception("Erro ao processar buffer da conversa=%s error=%s", item.conversa_id, exc)
+        # o flusher mantem o buffer nas chaves de processamento para nova tentativa
+        raise
+
+
+async def _notify_document_shed(evo_msg: EvolutionMessage, conversa: dict[str, Any]) -> None:
+    msg = "Recebi seu documento, mas estou com muitas analises no momento. Pode reenviar em alguns minutos?"
+    try:
+        await evolution_client.send_text(evo_msg.contato, msg)
+        await conversations_repo.record_turn(conversa["id"], "sdr", "texto", msg)
+    except Exception as exc:  # pragma: no cover - best effort
+        logger.warning("Falha ao avisar documento recusado conversa=%s error=%s", conversa["id"], exc)
 
 
 async def _process_document_message(evo_msg: EvolutionMessage, conversa: dict[str, Any], mensagem_id: str) -> None:
+    # roda em background: prazo proprio, independente do prazo da requisicao do webhook
+    with deadline_scope(settings.document_deadline_seconds, inherit=False):
+        try:
+            await _answer_document(evo_msg, conversa, mensagem_id)
+        except DeadlineExceeded as exc:
+            logger.warning("Prazo do documento estourado estagio=%s conversa=%s", exc.stage, conversa["id"])
+            # resposta ja comecou a chegar ao lead: registra o trecho enviado em vez do fallback
+            fallback = exc.partial or DEADLINE_FALLBACKS["document"]
+            if not exc.partial:
+                await evolution_client.send_text(evo_msg.contato, fallback)
+            await conversations_repo.record_turn(
+                conversa["id"],
+                "sdr",
+                "texto",
+                fallback,
+                event_type="deadline_exceeded",
+                event_payload={"stage": exc.stage, "origem": "documento", "partial": bool(exc.partial)},
+            )
+
+
+async def _answer_document(evo_msg: EvolutionMessage, conversa: dict[str, Any], mensagem_id: str) -> None:
     try:
         extraction = await attachment_service.process_document(
             conversa_id=conversa["id"],
@@ -348,45 +557,33 @@ async def _process_document_message(evo_msg: EvolutionMessage, conversa: dict[st
     except AttachmentProcessingError as exc:
         msg = "Nao consegui abrir o documento. Pode reenviar em PDF (ate 15MB) ou em formato DOCX?"
         await evolution_client.send_text(evo_msg.contato, msg)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", msg)
-        await conversation_events_service.record(
+        await conversations_repo.record_turn(
             conversa["id"],
-            "document_error",
-            payload={"error": str(exc)},
+            "sdr",
+            "texto",
+            msg,
+            event_type="document_error",
+            event_payload={"error": str(exc)},
         )
         return
 
+    index = await run_stage(
+        "indexing", document_index_service.get_or_build(extraction.sha256, extraction.markdown)
+    )
+    await document_index_service.set_active(conversa["id"], extraction.sha256)
+
     question = (extraction.caption or "").strip()
     if not question:
         follow_up = "Recebi o documento! Me conta qual duvida devo analisar nele."
         await evolution_client.send_text(evo_msg.contato, follow_up)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", follow_up)
-        await conversation_events_service.record(
+        await conversations_repo.record_turn(
             conversa["id"],
-            "document_missing_question",
-            payload={},
+            "sdr",
+            "texto",
+            follow_up,
+            event_type="document_missing_question",
+            event_payload={},
         )
         return
 
-    company = await company_config_service.get_profile()
-    decision = await run_guardrail(question, extraction.summary, company.model_dump())
-    if not decision.allowed:
-        policy_message = decision.policy_message or "Consigo ajudar apenas com assuntos relacionados aos nossos empreendimentos."
-        await evolution_client.send_text(evo_msg.contato, policy_message)
-        await conversations_repo.log_message(conversa["id"], "sdr", "texto", policy_message)
-        await conversation_events_service.record(
-            conversa["id"],
-            "document_blocked",
-            payload={"reason": decision.reason},
-        )
-        return
-
-    answer = await run_document_qa(question, extraction.markdown, company.model_dump())
-    await evolution_client.send_text(evo_msg.contato, answer)
-    await conversations_repo.log_message(conversa["id"], "sdr", "texto", answer)
-    await conversation_events_service.record(
-        conversa["id"],
-        "document_answer",
-        payload={"question": question},
-        agent_key="document_qa",
-    )
+    await answer_document_question(evo_msg.contato, conversa["id"], question, index)
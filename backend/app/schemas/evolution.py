@@ -19,3 +19,4 @@ class EvolutionMessage(BaseModel):
     conversa_id: str | None = None
     nome: str | None = None
     media: EvolutionMedia | None = None
+    instancia: str | None = None
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import json
 import time
 from dataclasses import dataclass
 from typing import Any
@@ -19,6 +21,12 @@ class AgentConfig(BaseModel):
     max_tokens: int | None = None
     metadata: dict[str, Any] = {}
 
+    @property
+    def version(self) -> str:
+        """Hash do conteudo; muda sempre que prompt, modelo, parametros ou metadata mudam."""
+        raw = json.dumps(self.model_dump(), sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
 
 @dataclass
 class _CacheEntry:
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.intent_classifier import normalize_text
+from app.utils.cache import get_redis_client
+from app.utils.db import get_supabase_client
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ANSWER_KEY_PREFIX = "qa:answers:"
+INITIAL_CAPACITY = 64
+
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def _numbers(question: str) -> frozenset[str]:
+    """Numeros da pergunta ("3 quartos", "100m2"): perguntas com numeros diferentes nao se respondem."""
+    return frozenset(_NUMBER_RE.findall(question))
+
+
+@dataclass
+class _LocalIndex:
+    """
+    Espelho local de um namespace: embeddings normalizados (float32), respostas, instante de
+    gravacao (epoch) e numeros de cada pergunta. A matriz e preallocada e cresce dobrando; so as
+    primeiras `len(fields)` linhas sao validas.
+    """
+
+    namespace: str
+    fields: list[str] = field(default_factory=list)
+    answers: list[str] = field(default_factory=list)
+    stored_at: list[float] = field(default_factory=list)
+    numbers: list[frozenset[str]] = field(default_factory=list)
+    matrix: np.ndarray | None = None
+    synced_at: float | None = None
+    # expiracao do hash no Redis (relogio monotonic); None = sem TTL conhecido
+    expires_at: float | None = None
+
+    @property
+    def vectors(self) -> np.ndarray | None:
+        return None if self.matrix is None else self.matrix[: len(self.fields)]
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+    def add(self, key: str, embedding: np.ndarray, answer: str, stored_at: float, numbers: frozenset[str]) -> None:
+        size = len(self.fields)
+        if self.matrix is None:
+            self.matrix = np.empty((INITIAL_CAPACITY, embedding.shape[0]), dtype=np.float32)
+        elif size == self.matrix.shape[0]:
+            grown = np.empty((size * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:size] = self.matrix
+            self.matrix = grown
+        self.matrix[size] = embedding
+        self.fields.append(key)
+        self.answers.append(answer)
+        self.stored_at.append(stored_at)
+        self.numbers.append(numbers)
+
+    def retain(self, keys: set[str]) -> None:
+        """Descarta as linhas cujas chaves nao estao em `keys`."""
+        keep = [i for i, key in enumerate(self.fields) if key in keys]
+        if len(keep) == len(self.fields):
+            return
+        if self.matrix is not None:
+            self.matrix[: len(keep)] = self.matrix[keep]
+        self.fields = [self.fields[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.stored_at = [self.stored_at[i] for i in keep]
+        self.numbers = [self.numbers[i] for i in keep]
+
+
+def _unit(embedding: list[float] | np.ndarray) -> np.ndarray | None:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else None
+
+
+class SemanticAnswerCache:
+    """
+    Cache semantico de respostas do QA: embedding da pergunta -> resposta, no Redis.
+
+    O namespace combina a versao da config do agente `qa` com a versao do corpus
+    (`corpus_versions`, incrementada por trigger a cada escrita em documentos/embeddings), entao
+    mudar prompt/modelo ou documentos invalida tudo sem varrer chaves. Perguntas identicas
+    (normalizadas) sao resolvidas antes do embedding; as demais comparam por cosseno contra um
+    espelho local do namespace, sincronizado incrementalmente. Cada entrada guarda quando foi
+    gravada e deixa de ser servida apos `ANSWER_CACHE_TTL_SECONDS` (o TTL do hash so recolhe
+    namespaces abandonados); um acerto exige os mesmos numeros na pergunta. Falhas nunca quebram
+    o QA.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.client = get_supabase_client()
+        self._corpus_version: str | None = None
+        self._corpus_checked_at: float | None = None
+        self._index: _LocalIndex | None = None
+
+    def _key(self, namespace: str) -> str:
+        return f"{ANSWER_KEY_PREFIX}{namespace}"
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.time() - stored_at < self.settings.answer_cache_ttl_seconds
+
+    def _field(self, question: str) -> str:
+        return hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()[:16]
+
+    async def namespace(self, config_version: str) -> str | None:
+        """Namespace atual ou None (cache desligado ou versao do corpus indisponivel)."""
+        if not self.settings.answer_cache_enabled:
+            return None
+        corpus = await self.corpus_version()
+        if corpus is None:
+            return None
+        return f"{config_version[:12]}:{corpus}"
+
+    async def corpus_version(self) -> str | None:
+        """Versao atual de `corpus_versions` (relida a cada ANSWER_CACHE_CORPUS_CHECK_SECONDS)."""
+        now = time.monotonic()
+        if self._corpus_checked_at is not None and (
+            now - self._corpus_checked_at < self.settings.answer_cache_corpus_check_seconds
+        ):
+            return self._corpus_version
+        self._corpus_checked_at = now
+        try:
+            self._corpus_version = await asyncio.to_thread(self._fetch_corpus_version)
+        except Exception as exc:  # pragma: no cover - best effort
+            # sem versao confiavel o cache fica desligado (nunca serve resposta desatualizada)
+            logger.warning("Falha ao ler versao do corpus error=%s", exc)
+            self._corpus_version = None
+        return self._corpus_version
+
+    def _fetch_corpus_version(self) -> str | None:
+        res = self.client.table("corpus_versions").select("versao").eq("nome", "documentos").limit(1).execute()
+        rows = res.data or []
+        return str(rows[0]["versao"]) if rows else None
+
+    def _record(self, result: str, started: float) -> None:
+        metrics.incr("answer_cache_total", result=result)
+        metrics.observe("answer_cache_lookup_seconds", time.perf_counter() - started, result=result)
+        hits = metrics.counter("answer_cache_total", result="exact") + metrics.counter(
+            "answer_cache_total", result="semantic"
+        )
+        total = hits + metrics.counter("answer_cache_total", result="miss")
+        metrics.set_gauge("answer_cache_hit_rate", hits / total if total else 0.0)
+
+    async def get_exact(self, namespace: str, question: str) -> str | None:
+        """Resposta para a mesma pergunta normalizada (dispensa o embedding)."""
+        started = time.perf_counter()
+        try:
+            raw = await get_redis_client().hget(self._key(namespace), self._field(question))
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler cache de respostas redis_error=%s", exc)
+            return None
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        # a normalizacao colapsa digitos repetidos ("1000" -> "10"): confere os numeros originais
+        if not self._fresh(entry.get("stored_at", 0)) or _numbers(entry.get("question", "")) != _numbers(question):
+            return None
+        self._record("exact", started)
+        return entry["answer"]
+
+    async def get_similar(self, namespace: str, question: str, embedding: list[float]) -> str | None:
+        """
+        Resposta da pergunta mais proxima que passe do limiar, ainda dentro do TTL e com os mesmos
+        numeros da pergunta atual.
+        """
+        started = time.perf_counter()
+        query = _unit(embedding)
+        try:
+            index = await self._sync(namespace)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao sincronizar cache de respostas redis_error=%s", exc)
+            return None
+        vectors = index.vectors
+        if query is None or vectors is None or not len(vectors) or vectors.shape[1] != query.shape[0]:
+            self._record("miss", started)
+            return None
+        scores = vectors @ query
+        numbers = _numbers(question)
+        candidates = np.flatnonzero(scores >= self.settings.answer_cache_similarity)
+        for i in candidates[np.argsort(-scores[candidates])]:
+            if index.numbers[i] == numbers and self._fresh(index.stored_at[i]):
+                self._record("semantic", started)
+                return index.answers[i]
+        self._record("miss", started)
+        return None
+
+    async def store(self, namespace: str, question: str, embedding: list[float], answer: str) -> None:
+        vector = _unit(embedding)
+        if vector is None or not answer.strip():
+            return
+        index = self._index if self._index is not None and self._index.namespace == namespace else None
+        if index is not None and len(index.fields) >= self.settings.answer_cache_max_entries:
+            return
+        key = self._field(question)
+        stored_at = time.time()
+        value = json.dumps(
+            {
+                "question": question[:500],
+                "answer": answer,
+                "embedding": base64.b64encode(vector.astype(np.float16).tobytes()).decode("ascii"),
+                "stored_at": stored_at,
+            }
+        )
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            # HSET sobrescreve: uma entrada vencida da mesma pergunta volta a valer com a resposta nova
+            pipe.hset(self._key(namespace), key, value)
+            pipe.expire(self._key(namespace), self.settings.answer_cache_ttl_seconds)
+            await pipe.execute()
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao gravar cache de respostas redis_error=%s", exc)
+            return
+        if index is not None:
+            # o EXPIRE acima renova o TTL do hash inteiro
+            index.expires_at = time.monotonic() + self.settings.answer_cache_ttl_seconds
+            if key in index.fields:
+                index.retain(set(index.fields) - {key})
+            index.add(key, vector, answer, stored_at, _numbers(question))
+
+    async def _sync(self, namespace: str) -> _LocalIndex:
+        index = self._index
+        if index is None or index.namespace != namespace:
+            index = self._index = _LocalIndex(namespace=namespace)
+        now = time.monotonic()
+        if (
+            index.synced_at is not None
+            and now - index.synced_at < self.settings.answer_cache_sync_seconds
+            and not index.expired(now)
+        ):
+            return index
+        index.synced_at = now
+        client = get_redis_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.hkeys(self._key(namespace))
+        pipe.pttl(self._key(namespace))
+        keys, ttl_ms = await pipe.execute()
+        index.expires_at = now + ttl_ms / 1000 if ttl_ms > 0 else None
+        # entradas apagadas no Redis ou vencidas pelo proprio TTL saem do espelho
+        stale = {key for key, stored_at in zip(index.fields, index.stored_at) if not self._fresh(stored_at)}
+        index.retain(set(keys) - stale)
+        known = set(index.fields)
+        room = self.settings.answer_cache_max_entries - len(index.fields)
+        missing = [key for key in keys if key not in known and key not in stale][: max(room, 0)]
+        if missing:
+            for key, raw in zip(missing, await client.hmget(self._key(namespace), missing)):
+                if not raw:
+                    continue
+                entry: dict[str, Any] = json.loads(raw)
+                if not self._fresh(entry.get("stored_at", 0)):
+                    stale.add(key)
+                    continue
+                vector = np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float16).astype(np.float32)
+                index.add(key, vector, entry["answer"], entry["stored_at"], _numbers(entry.get("question", "")))
+        if stale:
+            # recolhe do hash o que venceu (o EXPIRE do hash e renovado a cada gravacao)
+            await client.hdel(self._key(namespace), *stale)
+        return index
+
+
+answer_cache = SemanticAnswerCache()
@@ -6,6 +6,7 @@ import logging
 import mimetypes
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 from urllib.parse import urlparse
@@ -33,6 +34,7 @@ class AttachmentProcessingError(Exception):
 
 class AttachmentExtractionResult(BaseModel):
     attachment_id: str | None = None
+    sha256: str
     markdown: str
     metadata: dict[str, Any] = {}
     summary: str
@@ -45,6 +47,11 @@ class AttachmentService:
         self.client = get_supabase_client()
         self.evolution = EvolutionClient()
         self.bucket = self.settings.attachments_bucket
+        # pool dedicado: PDFs grandes nao disputam o executor padrao usado pelo supabase/redis
+        self._extract_executor = ThreadPoolExecutor(
+            max_workers=self.settings.document_extraction_threads,
+            thread_name_prefix="doc-extract",
+        )
 
     async def process_document(
         self,
@@ -68,11 +75,14 @@ class AttachmentService:
                 sha256=sha256,
                 temp_path=temp_path,
             )
-            markdown, metadata = await asyncio.to_thread(self._extract_markdown, temp_path, mime_type)
+            markdown, metadata = await asyncio.get_running_loop().run_in_executor(
+                self._extract_executor, self._extract_markdown, temp_path, mime_type
+            )
             summary = (markdown[:800] + "...") if len(markdown) > 800 else markdown
             await self._store_extraction(attachment_id, markdown, metadata)
             return AttachmentExtractionResult(
                 attachment_id=attachment_id,
+                sha256=sha256,
                 markdown=markdown,
                 metadata=metadata,
                 summary=summary,
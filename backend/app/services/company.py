@@ -16,6 +16,7 @@ class CompanyProfile(BaseModel):
     contatos: dict[str, Any] | None = None
     policy_text: str | None = None
     allowed_topics: list[str] | None = None
+    empreendimentos: list[str] | None = None
     handoff_webhook_url: str | None = None
     handoff_webhook_secret: str | None = None
 
@@ -36,6 +37,7 @@ class CompanyConfigService:
                 return self._cache
             data = await asyncio.to_thread(self._fetch_profile)
             profile = CompanyProfile(**data) if data else CompanyProfile()
+            profile.empreendimentos = await asyncio.to_thread(self._fetch_empreendimentos)
             self._cache = profile
             self._expires_at = time.monotonic() + self.settings.company_config_ttl_seconds
             return profile
@@ -60,5 +62,11 @@ class CompanyConfigService:
         row["allowed_topics"] = allowed_topics
         return row
 
+    def _fetch_empreendimentos(self) -> list[str]:
+        """Nomes distintos de `documentos.empreendimento` (base de conhecimento)."""
+        res = self.client.table("documentos").select("empreendimento").execute()
+        names = {(row.get("empreendimento") or "").strip() for row in res.data or []}
+        return sorted(name for name in names if name)
+
 
 company_config_service = CompanyConfigService()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+from app.config import get_settings
+from app.utils.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CONTACT_KEY_PREFIX = "conversation:contact:"
+CONVERSA_KEY_PREFIX = "conversation:contact-of:"
+
+
+class ConversationCache:
+    """
+    Cache Redis de `contato` -> lead + conversa ativa, com indice reverso `conversa_id` -> contato
+    para invalidar quando o status da conversa muda. Falhas de Redis nunca quebram o fluxo.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+
+    def _contact_key(self, contato: str) -> str:
+        return f"{CONTACT_KEY_PREFIX}{contato}"
+
+    def _conversa_key(self, conversa_id: str) -> str:
+        return f"{CONVERSA_KEY_PREFIX}{conversa_id}"
+
+    async def get(self, contato: str) -> dict[str, Any] | None:
+        try:
+            raw = await get_redis_client().get(self._contact_key(contato))
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler cache de conversa redis_error=%s", exc)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, contato: str, lead: dict[str, Any], conversa: dict[str, Any]) -> None:
+        ttl = self.settings.conversation_cache_ttl_seconds
+        value = json.dumps({"lead": lead, "conversa": conversa}, default=str)
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            pipe.set(self._contact_key(contato), value, ex=ttl)
+            pipe.set(self._conversa_key(conversa["id"]), contato, ex=ttl)
+            await pipe.execute()
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao gravar cache de conversa redis_error=%s", exc)
+
+    async def invalidate_status(self, conversa_id: str, status: str) -> None:
+        """Remove a entrada da conversa se o status em cache for diferente de `status`."""
+        client = get_redis_client()
+        try:
+            contato = await client.get(self._conversa_key(conversa_id))
+            if not contato:
+                return
+            raw = await client.get(self._contact_key(contato))
+            cached = json.loads(raw) if raw else None
+            if cached and cached["conversa"].get("id") == conversa_id and cached["conversa"].get("status") == status:
+                return
+            await client.delete(self._contact_key(contato), self._conversa_key(conversa_id))
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao invalidar cache da conversa=%s redis_error=%s", conversa_id, exc)
+
+
+conversation_cache = ConversationCache()
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Awaitable, Callable, TypeVar
+from uuid import uuid4
+
+from app.config import get_settings
+from app.utils.cache import acquire_lease, release_lease, renew_lease
+from app.utils.deadline import deadline_scope, remaining
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_LEASE_PREFIX = "conversation:lease:"
+
+T = TypeVar("T")
+
+
+async def _run_with_budget(fn: Callable[[], Awaitable[T]], expires_at: float | None) -> T:
+    """Roda `fn` com o prazo reaberto ate `expires_at` (relogio monotonic), se houver."""
+    if expires_at is None:
+        return await fn()
+    with deadline_scope(max(0.0, expires_at - time.monotonic()), inherit=False):
+        return await fn()
+
+
+class ConversationBusyError(Exception):
+    """Mailbox da conversa cheia ou lease ocupado alem do tempo de espera."""
+
+
+class ConversationExecutor:
+    """
+    Executor estilo ator por `conversa_id`: no maximo um pipeline em execucao por conversa
+    (mailbox FIFO limitada) e paralelismo entre conversas. Um lease no Redis estende a garantia
+    para outras replicas e workers Celery enquanto a mailbox local tiver trabalho.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._mailboxes: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._slots: asyncio.Semaphore | None = None
+        self._slots_loop: asyncio.AbstractEventLoop | None = None
+
+    def _lease_key(self, conversa_id: str) -> str:
+        return f"{CONVERSATION_LEASE_PREFIX}{conversa_id}"
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.settings.conversation_max_parallel)
+            self._slots_loop = loop
+        return self._slots
+
+    async def run(self, conversa_id: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Enfileira `fn` na mailbox da conversa e aguarda o resultado. Nao chame `run` para a mesma
+        conversa de dentro de `fn` (a chamada interna esperaria a externa terminar).
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        mailbox = self._mailboxes.get(conversa_id)
+        if mailbox is None:
+            mailbox = asyncio.Queue(maxsize=self.settings.conversation_mailbox_size)
+            self._mailboxes[conversa_id] = mailbox
+            self._workers[conversa_id] = asyncio.create_task(self._drain(conversa_id, mailbox))
+        try:
+            # o contexto de quem chamou acompanha o trabalho; o que resta do prazo da resposta e
+            # reaberto quando o trabalho sai da fila (a espera na mailbox nao consome o orcamento)
+            mailbox.put_nowait((fn, future, contextvars.copy_context(), remaining(), loop.time()))
+        except asyncio.QueueFull as exc:
+            metrics.incr("conversation_mailbox_rejected_total")
+            raise ConversationBusyError(f"mailbox_cheia:{conversa_id}") from exc
+        return await future
+
+    async def _drain(self, conversa_id: str, mailbox: asyncio.Queue) -> None:
+        token = uuid4().hex
+        leased = False
+        lost = asyncio.Event()
+        keep_alive: asyncio.Task | None = None
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    fn, future, ctx, budget, enqueued_at = mailbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if future.done():
+                    continue
+                # espera pelo lease e o trabalho dividem o orcamento de quem enfileirou
+                expires_at = None if budget is None else time.monotonic() + budget
+                if not leased or lost.is_set():
+                    # lease obtido (ou recuperado apos expirar) sem ocupar vaga de execucao
+                    if keep_alive:
+                        keep_alive.cancel()
+                        keep_alive = None
+                    lost.clear()
+                    try:
+                        leased = await self._acquire(conversa_id, token, budget)
+                    except ConversationBusyError as exc:
+                        future.set_exception(exc)
+                        raise
+                    if leased:
+                        keep_alive = asyncio.create_task(self._keep_alive(conversa_id, token, lost))
+                async with self._get_slots():
+                    metrics.observe("conversation_queue_wait_seconds", loop.time() - enqueued_at)
+                    try:
+                        result = await ctx.run(asyncio.ensure_future, _run_with_budget(fn, expires_at))
+                    except Exception as exc:
+                        if not future.done():
+                            future.set_exception(exc)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+        except Exception as exc:
+            while not mailbox.empty():
+                _, future, _, _, _ = mailbox.get_nowait()
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            # remove a mailbox antes de qualquer await: novos `run` criam outro worker
+            if self._mailboxes.get(conversa_id) is mailbox:
+                self._mailboxes.pop(conversa_id, None)
+                self._workers.pop(conversa_id, None)
+            if keep_alive:
+                keep_alive.cancel()
+            if leased:
+                try:
+                    await release_lease(self._lease_key(conversa_id), token)
+                except Exception as exc:  # pragma: no cover - best effort
+                    logger.warning("Falha ao liberar lease da conversa=%s error=%s", conversa_id, exc)
+
+    async def _acquire(self, conversa_id: str, token: str, deadline_left: float | None = None) -> bool:
+        """
+        Espera o lease da conversa por ate `CONVERSATION_LEASE_WAIT_SECONDS`, limitado ao que resta
+        do prazo de quem enfileirou (`deadline_left`). Retorna False se o Redis estiver indisponivel
+        (segue sem lease, best effort) e levanta ConversationBusyError se nao for liberado a tempo.
+        """
+        key = self._lease_key(conversa_id)
+        ttl_ms = self.settings.conversation_lease_ttl_seconds * 1000
+        loop = asyncio.get_running_loop()
+        wait = self.settings.conversation_lease_wait_seconds
+        if deadline_left is not None:
+            wait = min(wait, max(0.0, deadline_left))
+        deadline = loop.time() + wait
+        delay = 0.05
+        waited = False
+        while True:
+            try:
+                if await acquire_lease(key, token, ttl_ms):
+                    if waited:
+                        metrics.incr("conversation_lease_contended_total")
+                    return True
+            except Exception as exc:  # pragma: no cover - best effort
+                logger.warning("Falha ao obter lease da conversa=%s redis_error=%s", conversa_id, exc)
+                return False
+            waited = True
+            if loop.time() >= deadline:
+                metrics.incr("conversation_lease_timeout_total")
+                raise ConversationBusyError(f"lease_ocupado:{conversa_id}")
+            await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+            delay = min(delay * 2, 1.0)
+
+    async def _keep_alive(self, conversa_id: str, token: str, lost: asyncio.Event) -> None:
+        """Renova o lease; se ele expirou (ou mudou de dono), sinaliza `lost` e o proximo item o recupera."""
+        key = self._lease_key(conversa_id)
+        ttl_ms = self.settings.conversation_lease_ttl_seconds * 1000
+        while True:
+            await asyncio.sleep(self.settings.conversation_lease_ttl_seconds / 3)
+            try:
+                if not await renew_lease(key, token, ttl_ms):
+                    logger.warning("Lease da conversa=%s expirou durante o processamento", conversa_id)
+                    metrics.incr("conversation_lease_lost_total")
+                    lost.set()
+                    return
+            except Exception as exc:  # pragma: no cover - best effort
+                logger.warning("Falha ao renovar lease da conversa=%s error=%s", conversa_id, exc)
+
+
+conversation_executor = ConversationExecutor()
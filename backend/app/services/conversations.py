@@ -1,8 +1,25 @@
 import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Any
 
+from app.services.conversation_cache import conversation_cache
 from app.utils.db import get_supabase_client
+from app.utils.metrics import metrics
+
+
+@dataclass
+class ConversationContext:
+    """Lead e conversa ativa resolvidos uma vez por mensagem recebida."""
+
+    contato: str
+    canal: str
+    lead: dict[str, Any]
+    conversa: dict[str, Any]
+
+    @property
+    def conversa_id(self) -> str:
+        return self.conversa["id"]
 
 
 class ConversationService:
@@ -33,6 +50,7 @@ class ConversationService:
                 # atualiza nome se estava vazio e recebemos agora
                 if nome and not lead.get("nome"):
                     self.client.table("leads").update({"nome": nome}).eq("id", lead["id"]).execute()
+                    lead["nome"] = nome
                 return lead
             created = (
                 self.client.table("leads")
@@ -83,12 +101,33 @@ class ConversationService:
         res = await self._run(_create)
         return res.data[0]
 
-    async def ensure_active_conversation(
+    def _cached_usable(self, cached: dict[str, Any], conversa_id: str | None, nome: str | None) -> bool:
+        conversa = cached.get("conversa") or {}
+        if conversa.get("status") in self.CLOSED_STATUSES:
+            return False
+        if conversa_id and conversa.get("id") != conversa_id:
+            return False
+        # nome novo precisa ser gravado no lead
+        return not (nome and not (cached.get("lead") or {}).get("nome"))
+
+    async def resolve_context(
         self, contato: str, canal: str = "whatsapp", conversa_id: str | None = None, nome: str | None = None
-    ) -> Any:
+    ) -> ConversationContext:
+        """
+        Resolve lead + conversa ativa do contato, consultando primeiro o cache Redis.
+        """
+        cached = await conversation_cache.get(contato)
+        if cached and self._cached_usable(cached, conversa_id, nome):
+            metrics.incr("conversation_cache_total", result="hit")
+            return ConversationContext(contato=contato, canal=canal, lead=cached["lead"], conversa=cached["conversa"])
+        metrics.incr("conversation_cache_total", result="miss")
+
         lead = await self.get_or_create_lead(contato, canal, nome)
-        lead_id = lead["id"]
+        conversa = await self._active_conversation(lead["id"], conversa_id)
+        await conversation_cache.set(contato, lead, conversa)
+        return ConversationContext(contato=contato, canal=canal, lead=lead, conversa=conversa)
 
+    async def _active_conversation(self, lead_id: str, conversa_id: str | None) -> Any:
         if conversa_id:
             existing = await self.get_conversation_by_id(conversa_id)
             if existing and existing.get("status") not in self.CLOSED_STATUSES:
@@ -100,6 +139,12 @@ class ConversationService:
             return await self.create_conversation(lead_id)
         return latest
 
+    async def ensure_active_conversation(
+        self, contato: str, canal: str = "whatsapp", conversa_id: str | None = None, nome: str | None = None
+    ) -> Any:
+        context = await self.resolve_context(contato, canal, conversa_id, nome)
+        return context.conversa
+
     async def touch_conversation(self, conversa_id: str, status: str | None = None) -> None:
         now = datetime.now(timezone.utc).isoformat()
 
@@ -115,3 +160,5 @@ class ConversationService:
             )
 
         await self._run(_update)
+        if status:
+            await conversation_cache.invalidate_status(conversa_id, status)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from app.config import get_settings
+from app.repos.conversations import ConversationsRepository
+from app.utils.cache import get_redis_client
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_KEY_PREFIX = "evolution:webhook:msg:"
+
+
+class WebhookDedupeService:
+    """
+    Dedupe em camadas para o webhook Evolution:
+    1. LRU local com as mensagens reivindicadas por este processo (rejeita reentregas sem rede);
+    2. SET NX por mensagem no Redis, em um pipeline para o lote inteiro (fonte de verdade entre
+       replicas); cada chave leva o `{mensagem_id}` como hash tag e nenhum comando cruza slots;
+    3. registro em `evolution_webhook_events` gravado em lote, fora do caminho critico.
+
+    Sem Redis, o registro no banco volta a decidir de forma sincrona (insert ignorando
+    duplicados). Com `WEBHOOK_ACK_FIRST` a liberacao acontece no consumidor da fila, em outro
+    processo, entao o LRU local fica desligado para nao rejeitar ids ja liberados.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.repo = ConversationsRepository()
+        self._recent: OrderedDict[str, float] = OrderedDict()
+        self._pending_db: dict[str, None] = {}
+        # lote sendo gravado pelo flush e ids liberados enquanto a gravacao estava em curso
+        self._inflight: set[str] = set()
+        self._released_inflight: set[str] = set()
+        self._flush_task: asyncio.Task | None = None
+
+    def key_for(self, mensagem_id: str) -> str:
+        return f"{DEDUPE_KEY_PREFIX}{{{mensagem_id}}}"
+
+    @property
+    def _local_enabled(self) -> bool:
+        return not self.settings.webhook_ack_first
+
+    def _seen_locally(self, mensagem_id: str, now: float) -> bool:
+        if not self._local_enabled:
+            return False
+        expires_at = self._recent.get(mensagem_id)
+        if expires_at is None:
+            return False
+        if expires_at <= now:
+            self._recent.pop(mensagem_id, None)
+            return False
+        self._recent.move_to_end(mensagem_id)
+        return True
+
+    def _remember(self, mensagem_id: str, now: float) -> None:
+        if not self._local_enabled:
+            return
+        self._recent[mensagem_id] = now + self.settings.dedupe_ttl_seconds
+        self._recent.move_to_end(mensagem_id)
+        while len(self._recent) > self.settings.dedupe_local_max_entries:
+            self._recent.popitem(last=False)
+
+    async def claim(self, mensagem_ids: list[str]) -> set[str]:
+        """
+        Reivindica as mensagens e retorna os ids novos. Repetidos (inclusive dentro do lote)
+        ficam de fora. Se o Redis falhar, o lote e registrado no banco na hora e so os ids
+        inseridos contam como novos; se o banco tambem falhar, a excecao sobe (o Evolution reenvia).
+        """
+        now = time.monotonic()
+        candidates = [m for m in dict.fromkeys(mensagem_ids) if m and not self._seen_locally(m, now)]
+        if not candidates:
+            return set()
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for mensagem_id in candidates:
+                pipe.set(self.key_for(mensagem_id), "1", nx=True, ex=self.settings.dedupe_ttl_seconds)
+            flags = await pipe.execute()
+        except Exception as exc:
+            logger.warning("Falha ao registrar dedupe no Redis, usando o banco redis_error=%s", exc)
+            metrics.incr("dedupe_db_fallback_total")
+            claimed = await self.repo.register_incoming_messages(candidates)
+            for mensagem_id in claimed:
+                self._remember(mensagem_id, now)
+            return claimed
+        claimed = {m for m, flag in zip(candidates, flags) if flag}
+        for mensagem_id in claimed:
+            self._remember(mensagem_id, now)
+            self._pending_db[mensagem_id] = None
+        if len(self._pending_db) >= self.settings.dedupe_db_batch_size:
+            self._schedule_flush()
+        return claimed
+
+    async def release(self, mensagem_ids: list[str]) -> None:
+        """
+        Desfaz a reivindicacao apos falha de processamento, liberando reentregas do Evolution.
+        Ids ainda na fila do flush saem dela; ids no lote em gravacao sao removidos do banco pelo
+        proprio flush quando o insert terminar, para a liberacao nao correr contra ele.
+        """
+        ids = [m for m in mensagem_ids if m]
+        if not ids:
+            return
+        persisted: list[str] = []
+        for mensagem_id in ids:
+            self._recent.pop(mensagem_id, None)
+            if mensagem_id in self._pending_db:
+                self._pending_db.pop(mensagem_id)
+            elif mensagem_id in self._inflight:
+                self._released_inflight.add(mensagem_id)
+            else:
+                persisted.append(mensagem_id)
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for mensagem_id in ids:
+                pipe.delete(self.key_for(mensagem_id))
+            await pipe.execute()
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao liberar dedupe redis_error=%s", exc)
+        if persisted:
+            await self.repo.release_incoming_messages(persisted)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        if not self._pending_db:
+            return
+        batch = list(self._pending_db)[: self.settings.dedupe_db_batch_size]
+        for mensagem_id in batch:
+            self._pending_db.pop(mensagem_id, None)
+        self._inflight.update(batch)
+        try:
+            inserted = await self.repo.register_incoming_messages(batch)
+        except Exception as exc:
+            logger.warning("Falha ao gravar dedupe no banco tamanho=%s error=%s", len(batch), exc)
+            for mensagem_id in batch:
+                if mensagem_id not in self._released_inflight:
+                    self._pending_db.setdefault(mensagem_id, None)
+            return
+        finally:
+            self._inflight.difference_update(batch)
+            released = self._released_inflight.intersection(batch)
+            self._released_inflight.difference_update(batch)
+        if released:
+            # liberados durante o insert: so agora a remocao no banco nao corre contra ele
+            try:
+                await self.repo.release_incoming_messages([m for m in batch if m in released])
+            except Exception as exc:
+                logger.warning("Falha ao liberar dedupe no banco tamanho=%s error=%s", len(released), exc)
+        repeated = len(batch) - len(inserted)
+        if repeated:
+            # o Redis expirou antes de uma reentrega tardia; fica apenas registrado
+            logger.info("Dedupe no banco encontrou mensagens ja recebidas quantidade=%s", repeated)
+
+    async def run_writer(self, stop_event: asyncio.Event) -> None:
+        interval = self.settings.dedupe_db_flush_interval_ms / 1000
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            while self._pending_db:
+                before = len(self._pending_db)
+                await self.flush()
+                if len(self._pending_db) >= before:
+                    break
+
+
+webhook_dedupe_service = WebhookDedupeService()
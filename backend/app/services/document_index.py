@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.lexical_index import tokenize
+from app.utils.cache import get_redis_client
+from app.utils.metrics import metrics
+from app.utils.openai_client import build_openai_embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY_PREFIX = "doc:index:"
+ACTIVE_KEY_PREFIX = "conversation:document:"
+LOCAL_INDEXES = 16
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+settings = get_settings()
+# chunks vao direto ao provedor em lotes; a pergunta passa pelo cache de embeddings
+embeddings = CachedEmbeddings(
+    lambda: build_openai_embeddings(model=settings.embeddings_model, chunk_size=settings.document_embed_batch_size),
+    settings.embeddings_model,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token em portugues)."""
+    return max(1, len(text) // 4)
+
+
+def chunk_markdown(markdown: str, max_chars: int) -> list[str]:
+    """Agrupa paragrafos ate `max_chars`; paragrafos maiores sao quebrados por frase (ou no limite)."""
+    pieces: list[str] = []
+    for paragraph in _PARAGRAPH_RE.split(markdown):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence.strip():
+                pieces.append(sentence.strip())
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class AttachmentIndex:
+    sha256: str
+    chunks: list[str]
+    matrix: np.ndarray
+    terms: frozenset[str] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.terms = frozenset(term for chunk in self.chunks for term in tokenize(chunk))
+
+    def mentions(self, text: str) -> bool:
+        """Filtro lexical barato: a pergunta tem algum termo que aparece no documento."""
+        return not self.terms.isdisjoint(tokenize(text))
+
+    def select(self, query: np.ndarray, *, k: int, token_budget: int) -> tuple[list[str], float]:
+        """
+        Trechos mais relevantes (ate `k`) que cabem em `token_budget`, na ordem do documento,
+        e a maior similaridade encontrada.
+        """
+        if not self.chunks:
+            return [], 0.0
+        scores = self.matrix @ query
+        ranked = np.argsort(-scores)[:k]
+        chosen: list[int] = []
+        used = 0
+        for i in ranked:
+            tokens = estimate_tokens(self.chunks[i])
+            if chosen and used + tokens > token_budget:
+                continue
+            chosen.append(int(i))
+            used += tokens
+        return [self.chunks[i] for i in sorted(chosen)], float(scores[ranked[0]])
+
+
+class DocumentIndexService:
+    """
+    Indice por anexo para o QA de documentos: o markdown extraido vira chunks com embeddings
+    (em lotes), guardados no Redis por `attachments.sha256` e em um LRU local. O mesmo arquivo
+    reenviado, ou perguntas seguintes sobre ele, reaproveitam o indice sem novo embedding.
+    """
+
+    def __init__(self) -> None:
+        self.settings = settings
+        self._local: OrderedDict[str, AttachmentIndex] = OrderedDict()
+
+    def _key(self, sha256: str) -> str:
+        return f"{INDEX_KEY_PREFIX}{sha256}"
+
+    def _remember(self, index: AttachmentIndex) -> None:
+        self._local[index.sha256] = index
+        self._local.move_to_end(index.sha256)
+        while len(self._local) > LOCAL_INDEXES:
+            self._local.popitem(last=False)
+
+    async def get_or_build(self, sha256: str, markdown: str) -> AttachmentIndex:
+        index = await self.load(sha256)
+        if index is not None:
+            metrics.incr("document_index_total", result="reused")
+            return index
+        started = time.perf_counter()
+        chunks = chunk_markdown(markdown, self.settings.document_chunk_chars)
+        if len(chunks) > self.settings.document_max_chunks:
+            logger.info("Documento truncado para indice sha256=%s chunks=%s", sha256[:12], len(chunks))
+            chunks = chunks[: self.settings.document_max_chunks]
+        vectors = await embeddings.aembed_uncached(chunks) if chunks else []
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        index = AttachmentIndex(sha256=sha256, chunks=chunks, matrix=matrix / norms)
+        self._remember(index)
+        await self._store(index)
+        metrics.incr("document_index_total", result="built")
+        metrics.observe("document_index_build_seconds", time.perf_counter() - started)
+        return index
+
+    async def load(self, sha256: str) -> AttachmentIndex | None:
+        index = self._local.get(sha256)
+        if index is not None:
+            self._local.move_to_end(sha256)
+            return index
+        try:
+            raw = await get_redis_client().get(self._key(sha256))
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler indice do documento redis_error=%s", exc)
+            return None
+        if not raw:
+            return None
+        data = json.loads(raw)
+        vectors = np.frombuffer(base64.b64decode(data["matrix"]), dtype=np.float16).astype(np.float32)
+        index = AttachmentIndex(
+            sha256=sha256,
+            chunks=data["chunks"],
+            matrix=vectors.reshape(len(data["chunks"]), -1),
+        )
+        self._remember(index)
+        return index
+
+    async def _store(self, index: AttachmentIndex) -> None:
+        value = json.dumps(
+            {
+                "chunks": index.chunks,
+                "matrix": base64.b64encode(index.matrix.astype(np.float16).tobytes()).decode("ascii"),
+            }
+        )
+        try:
+            await get_redis_client().set(self._key(index.sha256), value, ex=self.settings.document_index_ttl_seconds)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao gravar indice do documento redis_error=%s", exc)
+
+    async def embed_question(self, question: str, embedding: list[float] | None = None) -> np.ndarray:
+        """
+        Embedding normalizado da pergunta. `embedding` reaproveita o da busca do QA geral (mesmo
+        `EMBEDDINGS_MODEL`), sem nova chamada.
+        """
+        if embedding is None:
+            embedding = await embeddings.aembed_query(question)
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        return query / norm if norm else query
+
+    def sections(
+        self, index: AttachmentIndex, query: np.ndarray, *, token_budget: int, purpose: str
+    ) -> tuple[str, float]:
+        """Trechos relevantes para a pergunta (separados por ---) e a maior similaridade."""
+        chosen, best = index.select(query, k=self.settings.document_top_k, token_budget=token_budget)
+        metrics.observe("document_context_tokens", sum(estimate_tokens(chunk) for chunk in chosen), purpose=purpose)
+        return "\n\n---\n\n".join(chosen), best
+
+    async def set_active(self, conversa_id: str, sha256: str) -> None:
+        """Marca o documento como o assunto atual da conversa (perguntas seguintes usam o indice)."""
+        try:
+            await get_redis_client().set(
+                f"{ACTIVE_KEY_PREFIX}{conversa_id}", sha256, ex=self.settings.document_followup_ttl_seconds
+            )
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao marcar documento ativo conversa=%s redis_error=%s", conversa_id, exc)
+
+    async def active(self, conversa_id: str) -> AttachmentIndex | None:
+        try:
+            sha256 = await get_redis_client().get(f"{ACTIVE_KEY_PREFIX}{conversa_id}")
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler documento ativo conversa=%s redis_error=%s", conversa_id, exc)
+            return None
+        return await self.load(sha256) if sha256 else None
+
+
+document_index_service = DocumentIndexService()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import logging
+import threading
+import unicodedata
+import weakref
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.config import get_settings
+from app.utils.cache import get_redis_client
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_KEY_PREFIX = "emb:"
+
+
+def normalize_embedding_text(text: str) -> str:
+    """Normalizacao leve para a chave (NFC, minusculas, espacos colapsados); acentos ficam."""
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings com cache em dois niveis na frente de outro `Embeddings` (ex.: OpenAIEmbeddings):
+    LRU em memoria (float32, tamanho limitado) e Redis (float16 em base64, com TTL), com chave
+    `emb:{modelo}:{sha1 do texto normalizado}`. Lotes consultam os dois niveis e enviam so os
+    textos ausentes ao provedor, em uma unica chamada. Falhas de Redis viram miss.
+
+    `upstream` constroi o cliente do provedor; ele e criado uma vez por event loop porque usa o
+    cliente HTTP compartilhado do loop (`build_openai_embeddings`), que passa pelo governor.
+    """
+
+    def __init__(self, upstream: Callable[[], Embeddings], model: str) -> None:
+        self._build_upstream = upstream
+        self._upstreams: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Embeddings]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.model = model
+        self.settings = get_settings()
+        self._local: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def upstream(self) -> Embeddings:
+        loop = asyncio.get_running_loop()
+        upstream = self._upstreams.get(loop)
+        if upstream is None:
+            upstream = self._upstreams[loop] = self._build_upstream()
+        return upstream
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha1(normalize_embedding_text(text).encode("utf-8")).hexdigest()
+        return f"{EMBEDDING_KEY_PREFIX}{self.model}:{digest}"
+
+    def _local_get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+            return vector
+
+    def _local_put(self, key: str, vector: np.ndarray) -> None:
+        limit = self.settings.embedding_cache_local_size
+        if limit <= 0:
+            return
+        with self._lock:
+            self._local[key] = vector
+            self._local.move_to_end(key)
+            while len(self._local) > limit:
+                self._local.popitem(last=False)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        found: dict[str, np.ndarray] = {}
+        for key in keys:
+            vector = self._local_get(key)
+            if vector is not None:
+                found[key] = vector
+        local_hits = len(found)
+
+        pending = list(dict.fromkeys(key for key in keys if key not in found))
+        if pending:
+            for key, vector in zip(pending, await self._redis_get(pending)):
+                if vector is not None:
+                    found[key] = vector
+                    self._local_put(key, vector)
+        redis_hits = len(found) - local_hits
+
+        misses = list(dict.fromkeys(key for key in keys if key not in found))
+        if misses:
+            text_by_key = dict(zip(keys, texts))
+            fresh = await self.aembed_uncached([text_by_key[key] for key in misses])
+            vectors = [np.asarray(vector, dtype=np.float32) for vector in fresh]
+            for key, vector in zip(misses, vectors):
+                found[key] = vector
+                self._local_put(key, vector)
+            await self._redis_set(dict(zip(misses, vectors)))
+
+        metrics.incr("embedding_cache_total", local_hits, tier="local")
+        metrics.incr("embedding_cache_total", redis_hits, tier="redis")
+        metrics.incr("embedding_cache_total", len(misses), tier="miss")
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_uncached(self, texts: list[str]) -> list[list[float]]:
+        """Chamada direta ao provedor (sem cache); cada requisicao, inclusive retries, passa pelo governor."""
+        return await self.upstream.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Versao sincrona (fora de event loop, ex.: em `asyncio.to_thread`): roda o caminho assincrono
+        em um loop proprio, com os dois niveis de cache e o governor de RPM/TPM.
+        """
+        return asyncio.run(self.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def _redis_get(self, keys: list[str]) -> list[np.ndarray | None]:
+        try:
+            raws = await get_redis_client().mget(keys)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler cache de embeddings redis_error=%s", exc)
+            return [None] * len(keys)
+        return [
+            np.frombuffer(base64.b64decode(raw), dtype=np.float16).astype(np.float32) if raw else None
+            for raw in raws
+        ]
+
+    async def _redis_set(self, vectors: dict[str, np.ndarray]) -> None:
+        ttl = self.settings.embedding_cache_ttl_seconds
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for key, vector in vectors.items():
+                pipe.set(key, base64.b64encode(vector.astype(np.float16).tobytes()).decode("ascii"), ex=ttl)
+            await pipe.execute()
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao gravar cache de embeddings redis_error=%s", exc)
@@ -38,5 +38,47 @@ class ConversationEventsService:
 
         await asyncio.to_thread(_insert)
 
+    async def record_many(self, events: list[dict[str, Any]]) -> None:
+        """
+        Insere varios eventos em um unico insert. Cada item segue os argumentos de `record`.
+        """
+        rows = [
+            {
+                "conversa_id": event["conversa_id"],
+                "event_type": event["event_type"],
+                "payload": event.get("payload") or {},
+                "agent_key": event.get("agent_key"),
+                "mensagem_id": event.get("mensagem_id"),
+            }
+            for event in events
+            if event.get("conversa_id") and event.get("event_type")
+        ]
+        if not rows:
+            return
+
+        def _insert():
+            return self.client.table("conversation_events").insert(rows).execute()
+
+        await asyncio.to_thread(_insert)
+
+    async def fetch_intent_samples(self, limit: int) -> list[dict[str, Any]]:
+        """
+        Eventos `intent_detected` mais recentes com o texto da mensagem (quando vinculada),
+        usados para treinar o classificador local.
+        """
+
+        def _query():
+            return (
+                self.client.table("conversation_events")
+                .select("payload, mensagens(conteudo)")
+                .eq("event_type", "intent_detected")
+                .order("created_at", desc=True)
+                .limit(limit)
+                .execute()
+            )
+
+        res = await asyncio.to_thread(_query)
+        return res.data or []
+
 
 conversation_events_service = ConversationEventsService()
@@ -1,8 +1,12 @@
 import logging
+import time
+from typing import AsyncIterator
 
 import httpx
 
 from app.config import get_settings
+from app.utils.metrics import metrics
+from app.utils.text_chunks import chunk_stream
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -63,6 +67,38 @@ class EvolutionClient:
             raise EvolutionSendError(f"status_{resp.status_code}")
         logger.info("Texto enviado Evolution status=%s destino=%s", resp.status_code, _mask_contact(contato))
 
+    async def send_text_stream(
+        self,
+        contato: str,
+        tokens: AsyncIterator[str],
+        agent: str = "",
+        delivered: list[str] | None = None,
+    ) -> str:
+        """
+        Envia uma resposta gerada em streaming: corta os tokens em fim de frase, em mensagens de
+        ate `reply_chunk_max_chars`, e envia a primeira enquanto o modelo segue gerando.
+        Retorna o texto completo (para registrar uma unica vez em `mensagens`). `delivered`
+        recebe cada trecho ja enviado e continua valido se a chamada for cancelada no meio.
+        """
+        started = time.perf_counter()
+        parts: list[str] = []
+
+        async def _collect() -> AsyncIterator[str]:
+            async for token in tokens:
+                parts.append(token)
+                yield token
+
+        sent = 0
+        async for chunk in chunk_stream(_collect(), settings.reply_chunk_max_chars, settings.reply_chunk_min_chars):
+            await self.send_text(contato, chunk)
+            if delivered is not None:
+                delivered.append(chunk)
+            if not sent:
+                metrics.observe("reply_first_chunk_seconds", time.perf_counter() - started, agent=agent)
+            sent += 1
+        metrics.incr("reply_stream_chunks_total", sent, agent=agent)
+        return "".join(parts).strip()
+
     async def send_media(self, contato: str, media_url: str, media_type: str = "image") -> None:
         if not self.base_url:
             raise EvolutionSendError("base_url_nao_configurada")
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Any
+
+from app.config import get_settings
+from app.services.intent_classifier import normalize_text
+from app.services.lexical_index import tokenize
+from app.utils.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+GUARDRAIL_KEY_PREFIX = "guardrail:"
+
+
+def _profile_terms(company_profile: dict[str, Any]) -> tuple[set[str], list[str]]:
+    topics = {term for topic in company_profile.get("allowed_topics") or [] for term in tokenize(topic)}
+    names = [normalize_text(name) for name in company_profile.get("empreendimentos") or []]
+    return topics, [name for name in names if name]
+
+
+def prefilter_in_scope(question: str, document: str, company_profile: dict[str, Any]) -> bool:
+    """
+    Aprovacao local de casos obvios: a pergunta cita um empreendimento ou um tema permitido e o
+    trecho do documento tambem. Qualquer outro caso (inclusive sem temas configurados) vai ao LLM.
+    """
+    topics, names = _profile_terms(company_profile)
+    if not topics and not names:
+        return False
+
+    def _mentions(text: str) -> bool:
+        normalized = f" {normalize_text(text).replace('?', ' ')} "
+        if any(f" {name} " in normalized for name in names):
+            return True
+        return bool(topics.intersection(tokenize(text)))
+
+    return _mentions(question) and _mentions(document)
+
+
+class GuardrailCache:
+    """
+    Decisoes do guardrail de documentos no Redis, por hash do documento + pergunta normalizada.
+    A chave inclui a versao da config do agente e um hash da politica da empresa (temas,
+    empreendimentos, texto), entao mudancas de politica nao reaproveitam decisoes antigas.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+
+    def key(self, config_version: str, company_profile: dict[str, Any], document_hash: str, question: str) -> str:
+        policy = json.dumps(
+            [
+                company_profile.get("allowed_topics"),
+                company_profile.get("empreendimentos"),
+                company_profile.get("policy_text"),
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        policy_hash = hashlib.sha1(policy.encode("utf-8")).hexdigest()[:8]
+        question_hash = hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()[:16]
+        return f"{GUARDRAIL_KEY_PREFIX}{config_version[:12]}:{policy_hash}:{document_hash}:{question_hash}"
+
+    async def get(self, key: str) -> dict[str, Any] | None:
+        try:
+            raw = await get_redis_client().get(key)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao ler cache do guardrail redis_error=%s", exc)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, decision: dict[str, Any]) -> None:
+        try:
+            await get_redis_client().set(key, json.dumps(decision), ex=self.settings.guardrail_cache_ttl_seconds)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao gravar cache do guardrail redis_error=%s", exc)
+
+
+guardrail_cache = GuardrailCache()
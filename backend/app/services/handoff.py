@@ -13,6 +13,7 @@ from app.chains.handoff_summary import generate_handoff_summary
 from app.config import get_settings
 from app.services.company import company_config_service
 from app.services.events import conversation_events_service
+from app.services.llm_governor import BACKGROUND, priority_scope
 from app.utils.db import get_supabase_client
 
 logger = logging.getLogger(__name__)
@@ -32,7 +33,8 @@ class HandoffService:
         status: str,
     ) -> str | None:
         company = await company_config_service.get_profile()
-        summary = await generate_handoff_summary(history_text, company.model_dump())
+        with priority_scope(BACKGROUND):
+            summary = await generate_handoff_summary(history_text, company.model_dump())
         payload = {
             "lead_nome": lead.get("nome"),
             "lead_contato": lead.get("contato"),
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+from redis.exceptions import ResponseError
+
+from app.config import get_settings
+from app.schemas.evolution import EvolutionMessage
+from app.services.dedupe import webhook_dedupe_service
+from app.utils.cache import acquire_lease, get_redis_client, release_lease, renew_lease
+
+logger = logging.getLogger(__name__)
+
+INGEST_STREAM_PREFIX = "evolution:ingest:"
+INGEST_GROUP = "sdr-ingest"
+INGEST_LEASE_PREFIX = "evolution:ingest:lease:"
+INGEST_WORKERS_KEY = "evolution:ingest:workers"
+INGEST_DEAD_LETTER_KEY = "evolution:ingest:dead"
+
+InboundHandler = Callable[[EvolutionMessage], Awaitable[Any]]
+
+
+class IngestionQueue:
+    """
+    Fila duravel de ingestao (Redis Streams) particionada por contato.
+
+    Cada shard e consumido por um unico worker por vez (lease no Redis), o que preserva a
+    ordem por conversa; o consumer group guarda as entradas pendentes para que o proximo dono
+    do shard reprocesse o que ficou sem ACK. Mais workers dividem os shards entre si.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        self._owned: set[int] = set()
+        self._groups_ready: set[int] = set()
+
+    def shard_for(self, contato: str) -> int:
+        return zlib.crc32(contato.encode("utf-8")) % self.settings.ingest_stream_shards
+
+    def stream_key(self, shard: int) -> str:
+        return f"{INGEST_STREAM_PREFIX}{shard}"
+
+    def _lease_key(self, shard: int) -> str:
+        return f"{INGEST_LEASE_PREFIX}{shard}"
+
+    async def enqueue(self, message: EvolutionMessage) -> str:
+        entry_ids = await self.enqueue_many([message])
+        return entry_ids[0]
+
+    async def enqueue_many(self, messages: list[EvolutionMessage]) -> list[str]:
+        """Publica um lote inteiro em um unico round trip (pipeline)."""
+        client = get_redis_client()
+        async with client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.xadd(
+                    self.stream_key(self.shard_for(message.contato)),
+                    {"payload": message.model_dump_json()},
+                    maxlen=self.settings.ingest_stream_maxlen,
+                    approximate=True,
+                )
+            return await pipe.execute()
+
+    async def _ensure_group(self, shard: int) -> None:
+        if shard in self._groups_ready:
+            return
+        client = get_redis_client()
+        try:
+            await client.xgroup_create(self.stream_key(shard), INGEST_GROUP, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._groups_ready.add(shard)
+
+    async def _acquire_lease(self, shard: int) -> bool:
+        ttl_ms = self.settings.ingest_lease_ttl_seconds * 1000
+        return await acquire_lease(self._lease_key(shard), self.worker_id, ttl_ms)
+
+    async def _renew_lease(self, shard: int) -> bool:
+        ttl_ms = self.settings.ingest_lease_ttl_seconds * 1000
+        return await renew_lease(self._lease_key(shard), self.worker_id, ttl_ms)
+
+    async def _release_lease(self, shard: int) -> None:
+        try:
+            await release_lease(self._lease_key(shard), self.worker_id)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao liberar lease de ingestao shard=%s error=%s", shard, exc)
+
+    async def _fair_share(self) -> int:
+        """Quantos shards este worker deve manter, dado o numero de workers vivos."""
+        client = get_redis_client()
+        now = time.time()
+        stale_before = now - self.settings.ingest_lease_ttl_seconds * 3
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zadd(INGEST_WORKERS_KEY, {self.worker_id: now})
+            pipe.zremrangebyscore(INGEST_WORKERS_KEY, "-inf", stale_before)
+            pipe.zcard(INGEST_WORKERS_KEY)
+            _, _, workers = await pipe.execute()
+        return max(1, math.ceil(self.settings.ingest_stream_shards / max(1, workers)))
+
+    async def run_worker(self, handler: InboundHandler, stop_event: asyncio.Event) -> None:
+        """
+        Loop principal do worker: renova/obtem leases ate a sua fatia justa de shards e mantem
+        uma task de consumo sequencial por shard.
+        """
+        tasks: dict[int, asyncio.Task] = {}
+        interval = max(1.0, self.settings.ingest_lease_ttl_seconds / 3)
+        try:
+            while not stop_event.is_set():
+                try:
+                    await self._rebalance(handler, stop_event, tasks)
+                except Exception as exc:  # pragma: no cover - redis indisponivel
+                    logger.warning("Falha ao balancear shards de ingestao error=%s", exc)
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._owned.clear()
+            if tasks:
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+            for shard in list(tasks):
+                await self._release_lease(shard)
+            try:
+                await get_redis_client().zrem(INGEST_WORKERS_KEY, self.worker_id)
+            except Exception:  # pragma: no cover - best effort
+                pass
+
+    async def _rebalance(
+        self,
+        handler: InboundHandler,
+        stop_event: asyncio.Event,
+        tasks: dict[int, asyncio.Task],
+    ) -> None:
+        for shard, task in list(tasks.items()):
+            if task.done():
+                tasks.pop(shard)
+                self._owned.discard(shard)
+                await self._release_lease(shard)
+            elif not await self._renew_lease(shard):
+                logger.warning("Lease de ingestao perdido shard=%s", shard)
+                self._owned.discard(shard)
+                tasks.pop(shard).cancel()
+
+        share = await self._fair_share()
+        for shard in sorted(self._owned, reverse=True)[: max(0, len(self._owned) - share)]:
+            # devolve o excedente: a task termina apos a entrada atual e libera o lease
+            self._owned.discard(shard)
+
+        for shard in range(self.settings.ingest_stream_shards):
+            if len(self._owned) >= share:
+                break
+            if shard in tasks or not await self._acquire_lease(shard):
+                continue
+            await self._ensure_group(shard)
+            self._owned.add(shard)
+            tasks[shard] = asyncio.create_task(self._consume_shard(shard, handler, stop_event))
+
+    async def _consume_shard(self, shard: int, handler: InboundHandler, stop_event: asyncio.Event) -> None:
+        client = get_redis_client()
+        stream = self.stream_key(shard)
+        # nome fixo por shard: quem assumir o lease herda as pendencias do dono anterior
+        consumer = f"shard-{shard}"
+        read_pending = True
+        while shard in self._owned and not stop_event.is_set():
+            try:
+                if read_pending:
+                    resp = await client.xreadgroup(
+                        INGEST_GROUP, consumer, {stream: "0"}, count=self.settings.ingest_read_count
+                    )
+                else:
+                    resp = await client.xreadgroup(
+                        INGEST_GROUP,
+                        consumer,
+                        {stream: ">"},
+                        count=self.settings.ingest_read_count,
+                        block=self.settings.ingest_block_ms,
+                    )
+            except Exception as exc:  # pragma: no cover - redis indisponivel
+                logger.warning("Falha ao ler stream de ingestao shard=%s error=%s", shard, exc)
+                await asyncio.sleep(1)
+                continue
+            entries = resp[0][1] if resp else []
+            if read_pending and not entries:
+                read_pending = False
+                continue
+            for entry_id, fields in entries:
+                if shard not in self._owned:
+                    break
+                if not await self._handle_entry(stream, entry_id, fields, handler):
+                    # mantem a ordem: nao avanca enquanto a entrada atual nao for concluida
+                    read_pending = True
+                    await asyncio.sleep(self.settings.ingest_retry_backoff_seconds)
+                    break
+        if shard not in self._owned:
+            await self._release_lease(shard)
+
+    async def _handle_entry(
+        self,
+        stream: str,
+        entry_id: str,
+        fields: dict[str, str] | None,
+        handler: InboundHandler,
+    ) -> bool:
+        client = get_redis_client()
+        if not fields or "payload" not in fields:
+            # entrada removida pelo MAXLEN enquanto pendente
+            await client.xack(stream, INGEST_GROUP, entry_id)
+            return True
+        try:
+            message = EvolutionMessage(**json.loads(fields["payload"]))
+        except Exception as exc:
+            logger.error("Entrada de ingestao invalida id=%s error=%s", entry_id, exc)
+            await self._dead_letter(stream, entry_id, fields, str(exc))
+            return True
+        try:
+            await handler(message)
+        except Exception as exc:
+            attempts = await self._delivery_count(stream, entry_id)
+            logger.exception(
+                "Falha ao processar entrada de ingestao id=%s tentativa=%s error=%s", entry_id, attempts, exc
+            )
+            if attempts < self.settings.ingest_max_attempts:
+                return False
+            await self._dead_letter(stream, entry_id, fields, str(exc))
+            await webhook_dedupe_service.release([message.mensagem_id])
+            return True
+        await client.xack(stream, INGEST_GROUP, entry_id)
+        return True
+
+    async def _delivery_count(self, stream: str, entry_id: str) -> int:
+        client = get_redis_client()
+        try:
+            pending = await client.xpending_range(stream, INGEST_GROUP, min=entry_id, max=entry_id, count=1)
+        except Exception:  # pragma: no cover - best effort
+            return 1
+        return int(pending[0]["times_delivered"]) if pending else 1
+
+    async def _dead_letter(self, stream: str, entry_id: str, fields: dict[str, str], error: str) -> None:
+        client = get_redis_client()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                INGEST_DEAD_LETTER_KEY,
+                {"stream": stream, "entry_id": entry_id, "error": error[:500], **fields},
+                maxlen=self.settings.ingest_stream_maxlen,
+                approximate=True,
+            )
+            pipe.xack(stream, INGEST_GROUP, entry_id)
+            await pipe.execute()
+
+
+ingestion_queue = IngestionQueue()
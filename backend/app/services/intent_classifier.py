@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import get_settings
+from app.services.events import conversation_events_service
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTENT_LABELS = ("pergunta", "seguir", "encerrar", "ruido")
+
+# Frases ja normalizadas (minusculas, sem acento, sem pontuacao, letras repetidas colapsadas).
+_PHRASES: dict[str, set[str]] = {
+    "seguir": {
+        "ok", "okay", "sim", "s", "ss", "pode", "pode sim", "pode seguir", "pode mandar", "manda",
+        "claro", "claro que sim", "com certeza", "certo", "beleza", "blz", "bora", "vamos", "quero",
+        "quero sim", "tenho interesse", "tenho sim", "tudo bem", "ta bom", "ta", "show", "perfeito",
+        "combinado", "fechado", "isso", "uhum", "aham", "positivo", "pode continuar", "continua",
+    },
+    "encerrar": {
+        "nao", "n", "nao obrigado", "nao obrigada", "nao tenho interesse", "sem interesse",
+        "nao quero", "nao quero mais", "pare", "parar", "para", "sair", "chega", "remover",
+        "descadastrar", "me tira da lista", "nao me mande mais mensagens", "agora nao", "dispenso",
+        "nao preciso", "ja comprei", "nao estou interessado", "nao estou interessada",
+    },
+    "ruido": {"k", "kk", "haha", "rs", "rsrs", "hm", "hmm", "ah", "eh", "teste"},
+}
+_POSITIVE_EMOJI = {"👍", "👌", "🙏", "✅", "😀", "😃", "😊", "🙂", "👏"}
+
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+_NON_WORD_RE = re.compile(r"[^\w\s?]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Minusculas, sem acentos/pontuacao, letras repetidas colapsadas ("siiiim" -> "sim")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    stripped = _NON_WORD_RE.sub(" ", stripped)
+    stripped = _REPEAT_RE.sub(r"\1", stripped)
+    return _SPACES_RE.sub(" ", stripped).strip()
+
+
+def _features(normalized: str) -> Counter:
+    feats: Counter = Counter()
+    for word in normalized.split():
+        feats[f"w:{word}"] += 1
+        padded = f" {word} "
+        for n in (2, 3, 4):
+            for i in range(len(padded) - n + 1):
+                feats[padded[i : i + n]] += 1
+    if "?" in normalized:
+        feats["has:?"] += 1
+    return feats
+
+
+@dataclass
+class LocalIntent:
+    label: str
+    confidence: float
+    source: str
+
+
+class _NaiveBayesModel:
+    """Naive Bayes multinomial sobre n-gramas de caracteres (suavizacao de Laplace)."""
+
+    def __init__(self, samples: list[tuple[str, str]]) -> None:
+        self.doc_counts: Counter = Counter()
+        self.feature_counts: dict[str, Counter] = defaultdict(Counter)
+        self.totals: Counter = Counter()
+        vocab: set[str] = set()
+        for text, label in samples:
+            feats = _features(text)
+            self.doc_counts[label] += 1
+            self.feature_counts[label].update(feats)
+            self.totals[label] += sum(feats.values())
+            vocab.update(feats)
+        self.vocab_size = max(len(vocab), 1)
+        total_docs = sum(self.doc_counts.values())
+        self.log_priors = {label: math.log(count / total_docs) for label, count in self.doc_counts.items()}
+
+    def predict(self, normalized: str) -> tuple[str, float]:
+        feats = _features(normalized)
+        scores: dict[str, float] = {}
+        for label, prior in self.log_priors.items():
+            counts = self.feature_counts[label]
+            denom = self.totals[label] + self.vocab_size
+            scores[label] = prior + sum(n * math.log((counts.get(f, 0) + 1) / denom) for f, n in feats.items())
+        best = max(scores, key=scores.__getitem__)
+        top = scores[best]
+        norm = sum(math.exp(s - top) for s in scores.values())
+        return best, 1 / norm
+
+
+class LocalIntentClassifier:
+    """
+    Pre-classificador local de intencao. Mensagens triviais ("ok", "nao obrigado", emojis)
+    sao resolvidas por tabela de frases; demais mensagens curtas passam por um Naive Bayes de
+    n-gramas treinado com o historico `intent_detected` decidido pelo LLM. Abaixo do limiar de
+    confianca retorna None e o orquestrador chama o LLM.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._model: _NaiveBayesModel | None = None
+        self._trained_at: float | None = None
+        self._training: asyncio.Task | None = None
+
+    def _record(self, source: str) -> None:
+        metrics.incr("intent_classification_total", source=source)
+        local = metrics.counter("intent_classification_total", source="phrase") + metrics.counter(
+            "intent_classification_total", source="model"
+        )
+        total = local + metrics.counter("intent_classification_total", source="llm")
+        metrics.set_gauge("intent_local_hit_rate", local / total if total else 0.0)
+
+    def record_llm(self) -> None:
+        self._record("llm")
+
+    def _match_phrase(self, text: str, normalized: str) -> str | None:
+        compact = "".join(text.split())
+        if compact and all(ch in _POSITIVE_EMOJI or unicodedata.category(ch) in {"Mn", "Sk"} for ch in compact):
+            return "seguir"
+        if compact and not normalized and "?" not in compact:
+            # apenas emojis/pontuacao
+            return "ruido"
+        for label, phrases in _PHRASES.items():
+            if normalized in phrases:
+                return label
+        return None
+
+    def classify(self, text: str) -> LocalIntent | None:
+        if not self.settings.intent_local_enabled:
+            return None
+        self._maybe_refresh()
+        normalized = normalize_text(text)
+        label = self._match_phrase(text.strip(), normalized)
+        if label:
+            self._record("phrase")
+            return LocalIntent(label=label, confidence=1.0, source="phrase")
+        model = self._model
+        if model is None or len(normalized) > self.settings.intent_local_max_chars:
+            return None
+        label, confidence = model.predict(normalized)
+        if confidence < self.settings.intent_local_threshold:
+            return None
+        self._record("model")
+        return LocalIntent(label=label, confidence=round(confidence, 4), source="model")
+
+    def _maybe_refresh(self) -> None:
+        if self._trained_at is not None and (
+            time.monotonic() - self._trained_at < self.settings.intent_model_refresh_seconds
+        ):
+            return
+        if self._training is not None and not self._training.done():
+            return
+        self._trained_at = time.monotonic()
+        try:
+            self._training = asyncio.get_running_loop().create_task(self.train())
+        except RuntimeError:  # pragma: no cover - fora de event loop
+            self._training = None
+
+    async def train(self) -> int:
+        """Retreina com o historico recente. Retorna quantas amostras foram usadas."""
+        try:
+            rows = await conversation_events_service.fetch_intent_samples(self.settings.intent_model_max_samples)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao carregar historico de intencao error=%s", exc)
+            return 0
+        samples = self._samples_from_rows(rows)
+        if len(samples) < self.settings.intent_model_min_samples:
+            logger.info("Historico insuficiente para o classificador local amostras=%s", len(samples))
+            return len(samples)
+        self._model = await asyncio.to_thread(_NaiveBayesModel, samples)
+        logger.info("Classificador local de intencao treinado amostras=%s", len(samples))
+        return len(samples)
+
+    def _samples_from_rows(self, rows: list[dict[str, Any]]) -> list[tuple[str, str]]:
+        samples: list[tuple[str, str]] = []
+        for row in rows:
+            payload = row.get("payload") or {}
+            label = payload.get("label")
+            if label not in INTENT_LABELS or payload.get("source", "llm") not in {"llm", "router"}:
+                # decisoes locais nao realimentam o treino
+                continue
+            text = payload.get("text") or (row.get("mensagens") or {}).get("conteudo")
+            normalized = normalize_text(text or "")
+            if normalized and len(normalized) <= self.settings.intent_local_max_chars:
+                samples.append((normalized, label))
+        return samples
+
+
+intent_classifier = LocalIntentClassifier()
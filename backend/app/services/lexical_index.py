@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from langchain_core.documents import Document
+
+from app.config import get_settings
+from app.services.answer_cache import answer_cache
+from app.utils.db import get_supabase_client, parse_timestamp
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+ROW_COLUMNS = "id, documento_id, chunk, atualizado_em"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+_STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos", "em", "no",
+    "na", "nos", "nas", "num", "numa", "para", "pra", "por", "pelo", "pela", "com", "sem", "que",
+    "e", "ou", "se", "ao", "aos", "ate", "mais", "menos", "muito", "qual", "quais", "como", "onde",
+    "quando", "quanto", "quanta", "ser", "sao", "esta", "estao", "ter", "tem", "tenho", "voce",
+    "voces", "eu", "me", "meu", "minha", "seu", "sua", "isso", "esse", "essa", "este", "ola", "oi",
+}
+
+
+def _stem(token: str) -> str:
+    """Remove o plural de forma leve (quartos -> quarto, valores -> valor, garagens -> garagem)."""
+    if token.isdigit() or len(token) <= 3:
+        return token
+    for suffix, replacement in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m")):
+        if token.endswith(suffix):
+            return token[: -len(suffix)] + replacement
+    if token.endswith(("res", "zes", "ses")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Tokens para o BM25: minusculas, sem acentos, sem stopwords, plural removido; numeros ficam."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return [_stem(token) for token in _TOKEN_RE.findall(stripped) if token not in _STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[list[Document]], k: int = 60, limit: int = 5) -> list[Document]:
+    """Funde rankings pelo RRF (soma de 1 / (k + posicao)); documentos iguais pelo texto do chunk."""
+    scores: dict[str, float] = defaultdict(float)
+    docs: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.page_content
+            scores[key] += 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.__getitem__, reverse=True)
+    return [docs[key] for key in ordered[:limit]]
+
+
+@dataclass
+class _Chunk:
+    id: str
+    documento_id: str | None
+    text: str
+    terms: Counter
+    length: int
+
+
+class LexicalIndex:
+    """
+    Indice invertido em memoria (BM25) sobre `documentos_embeddings.chunk`. A atualizacao e
+    incremental: quando a versao do corpus muda, baixa so os ids novos e as linhas com
+    `atualizado_em` depois da ultima sincronizacao (chunks editados), e os ids que sumiram saem
+    do indice. Enquanto o primeiro carregamento nao termina, `search` retorna vazio.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.client = get_supabase_client()
+        self._chunks: dict[str, _Chunk] = {}
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self._version: str | None = None
+        # maior `atualizado_em` ja aplicado (texto do PostgREST)
+        self._watermark: str | None = None
+        self._checked_at: float | None = None
+        self._refreshing: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._version is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._chunks)
+
+    def _add(self, row: dict[str, Any]) -> None:
+        terms = Counter(tokenize(row.get("chunk") or ""))
+        chunk = _Chunk(
+            id=row["id"],
+            documento_id=row.get("documento_id"),
+            text=row.get("chunk") or "",
+            terms=terms,
+            length=sum(terms.values()),
+        )
+        self._chunks[chunk.id] = chunk
+        self._total_length += chunk.length
+        for term, tf in terms.items():
+            self._postings[term][chunk.id] = tf
+
+    def _remove(self, chunk_id: str) -> None:
+        chunk = self._chunks.pop(chunk_id)
+        self._total_length -= chunk.length
+        for term in chunk.terms:
+            postings = self._postings[term]
+            postings.pop(chunk_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int = 5) -> list[Document]:
+        self._maybe_refresh()
+        if not self._chunks:
+            return []
+        total = len(self._chunks)
+        avg_length = self._total_length / total or 1.0
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                length = self._chunks[chunk_id].length
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                )
+        best = sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+        return [
+            Document(
+                page_content=self._chunks[chunk_id].text,
+                metadata={
+                    "id": chunk_id,
+                    "documento_id": self._chunks[chunk_id].documento_id,
+                    "bm25": round(scores[chunk_id], 4),
+                },
+            )
+            for chunk_id in best
+        ]
+
+    def _maybe_refresh(self) -> None:
+        if self._checked_at is not None and (
+            time.monotonic() - self._checked_at < self.settings.lexical_index_refresh_seconds
+        ):
+            return
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+        self._checked_at = time.monotonic()
+        try:
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:  # pragma: no cover - fora de event loop
+            self._refreshing = None
+
+    async def refresh(self) -> bool:
+        """Sincroniza com o banco se a versao do corpus mudou. Retorna True se houve mudanca."""
+        version = await answer_cache.corpus_version()
+        if self.ready and version is not None and version == self._version:
+            return False
+        started = time.perf_counter()
+        try:
+            ids = await asyncio.to_thread(self._fetch_ids)
+            known = set(self._chunks)
+            removed = known - set(ids)
+            rows = await asyncio.to_thread(self._fetch_rows, [i for i in ids if i not in known])
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao atualizar indice lexical error=%s", exc)
+            return False
+        for chunk_id in removed:
+            self._remove(chunk_id)
+        for row in rows:
+            if row["id"] in self._chunks:
+                self._remove(row["id"])
+            self._add(row)
+            stamp = row.get("atualizado_em")
+            parsed = parse_timestamp(stamp)
+            current_mark = parse_timestamp(self._watermark)
+            if parsed is not None and (current_mark is None or parsed > current_mark):
+                self._watermark = stamp
+        # sem versao (tabela ausente) o indice ainda funciona, recarregando por diferenca de ids
+        self._version = version or f"ids:{len(ids)}"
+        metrics.set_gauge("lexical_index_chunks", len(self._chunks))
+        metrics.observe("lexical_index_refresh_seconds", time.perf_counter() - started)
+        logger.info("Indice lexical atualizado chunks=%s alterados=%s", len(self._chunks), len(rows))
+        return True
+
+    def _fetch_ids(self) -> list[str]:
+        ids: list[str] = []
+        start = 0
+        while True:
+            res = (
+                self.client.table("documentos_embeddings")
+                .select("id")
+                .order("id")
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = res.data or []
+            ids.extend(row["id"] for row in rows)
+            if len(rows) < PAGE_SIZE:
+                return ids
+            start += PAGE_SIZE
+
+    def _fetch_rows(self, new_ids: list[str]) -> list[dict[str, Any]]:
+        """Linhas alteradas desde a marca da ultima sincronizacao mais as de ids ainda nao vistos."""
+        rows: dict[str, dict[str, Any]] = {}
+        if self._watermark is not None:
+            start = 0
+            while True:
+                res = (
+                    self.client.table("documentos_embeddings")
+                    .select(ROW_COLUMNS)
+                    .gt("atualizado_em", self._watermark)
+                    .order("atualizado_em")
+                    .range(start, start + PAGE_SIZE - 1)
+                    .execute()
+                )
+                page = res.data or []
+                rows.update((row["id"], row) for row in page)
+                if len(page) < PAGE_SIZE:
+                    break
+                start += PAGE_SIZE
+        pending = [i for i in new_ids if i not in rows]
+        # lotes pequenos: a lista de ids vai na query string do PostgREST
+        for start in range(0, len(pending), 200):
+            res = (
+                self.client.table("documentos_embeddings")
+                .select(ROW_COLUMNS)
+                .in_("id", pending[start : start + 200])
+                .execute()
+            )
+            rows.update((row["id"], row) for row in res.data or [])
+        return list(rows.values())
+
+
+lexical_index = LexicalIndex()
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+import httpx
+
+from app.config import get_settings
+from app.services.rate_limit import Bucket, RateLimiter
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# espera entre tentativas de trafego de fundo enquanto ha chamadas interativas na fila do processo
+BACKGROUND_YIELD_SECONDS = 0.05
+MAX_SLEEP_SECONDS = 2.0
+DEFAULT_COMPLETION_TOKENS = 256
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[None]:
+    """Classe de prioridade das chamadas OpenAI feitas no contexto atual (e tasks criadas nele)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def estimate_request_tokens(path: str, content: bytes) -> tuple[str | None, int]:
+    """
+    Modelo e custo em tokens (entrada estimada pelo tamanho do corpo + `max_tokens`) de uma
+    requisicao a API da OpenAI. Transcricoes so contam como requisicao.
+    """
+    if path.endswith("/audio/transcriptions"):
+        return get_settings().whisper_model, 0
+    if not path.endswith(("/chat/completions", "/embeddings")):
+        return None, 0
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return None, 0
+    tokens = len(content) // 4
+    if path.endswith("/chat/completions"):
+        tokens += int(body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+    return body.get("model"), tokens
+
+
+class LLMGovernor:
+    """
+    Orcamento global de requisicoes e tokens por minuto (RPM/TPM) por modelo, compartilhado entre
+    replicas pela janela deslizante do `RateLimiter` no Redis. Trafego interativo (webhook) usa o
+    orcamento inteiro; o de fundo (reengajamento, handoff) so `LLM_GOVERNOR_BACKGROUND_SHARE` dele
+    e, no processo, espera enquanto houver chamadas interativas na fila. Modelos fora de
+    `LLM_GOVERNOR_LIMITS` nao sao limitados.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._limits = self.settings.llm_governor_limits
+        self._waiting: dict[str, int] = defaultdict(int)
+        # um limitador por prioridade: a janela no Redis e a mesma, mas o token bucket local
+        # de cada uma usa o proprio teto (o de fundo e so uma fracao do interativo)
+        self._limiters: dict[str, RateLimiter] = {}
+
+    def _limiter(self, priority: str) -> RateLimiter:
+        limiter = self._limiters.get(priority)
+        if limiter is None:
+            limiter = self._limiters[priority] = RateLimiter(metric_prefix="llm_governor_limit")
+        return limiter
+
+    def _buckets(self, model: str, tokens: int, requests: int, priority: str) -> list[Bucket]:
+        rpm, tpm = self._limits[model]
+        share = 1.0 if priority == INTERACTIVE else self.settings.llm_governor_background_share
+        buckets = []
+        if rpm:
+            limit = max(1, int(rpm * share))
+            buckets.append(Bucket("llm_rpm", model, limit, 60, cost=min(requests, limit)))
+        if tpm and tokens:
+            limit = max(1, int(tpm * share))
+            # pedido maior que o orcamento inteiro nunca caberia: conta como o orcamento cheio
+            buckets.append(Bucket("llm_tpm", model, limit, 60, cost=min(tokens, limit)))
+        return buckets
+
+    async def acquire(self, model: str, tokens: int, *, requests: int = 1) -> None:
+        """Aguarda ate a chamada caber no orcamento do modelo (ou ate `LLM_GOVERNOR_MAX_WAIT_SECONDS`)."""
+        if model not in self._limits:
+            return
+        priority = current_priority()
+        buckets = self._buckets(model, tokens, requests, priority)
+        if not buckets:
+            return
+        started = time.monotonic()
+        result = "allowed"
+        self._waiting[priority] += 1
+        metrics.set_gauge("llm_governor_waiting", self._waiting[priority], priority=priority)
+        try:
+            while True:
+                if priority != INTERACTIVE and self._waiting[INTERACTIVE]:
+                    await asyncio.sleep(BACKGROUND_YIELD_SECONDS)
+                    continue
+                decision = await self._limiter(priority).check(buckets)
+                if decision.allowed:
+                    break
+                waited = time.monotonic() - started
+                if waited + decision.retry_after > self.settings.llm_governor_max_wait_seconds:
+                    # segue mesmo assim: o provedor decide (e o retry do cliente trata um 429)
+                    result = "timeout"
+                    logger.warning("Governor de LLM excedeu espera maxima modelo=%s prioridade=%s", model, priority)
+                    break
+                await asyncio.sleep(min(decision.retry_after, MAX_SLEEP_SECONDS) + random.uniform(0, 0.05))
+        finally:
+            self._waiting[priority] -= 1
+            metrics.set_gauge("llm_governor_waiting", self._waiting[priority], priority=priority)
+        metrics.incr("llm_governor_total", model=model, priority=priority, result=result)
+        metrics.observe("llm_governor_wait_seconds", time.monotonic() - started, model=model, priority=priority)
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """Transporte httpx que passa cada requisicao a OpenAI (inclusive retries) pelo governor."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        content = request.content if request.url.path.endswith(("/chat/completions", "/embeddings")) else b""
+        model, tokens = estimate_request_tokens(request.url.path, content)
+        if model:
+            await llm_governor.acquire(model, tokens)
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+llm_governor = LLMGovernor()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from app.config import get_settings
+from app.utils.cache import get_redis_client
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+# Janela deslizante aproximada (contador da janela atual + peso da anterior) para varios buckets
+# em uma unica chamada. KEYS: para cada bucket, a chave da janela atual e a da anterior (calculadas
+# pelo cliente, todas declaradas). ARGV[1] = quantos buckets iniciais sao obrigatorios (ip/instancia);
+# se algum deles estourar nada e contabilizado. Demais buckets (contatos) sao avaliados um a um.
+# ARGV[2] = agora em ms. Retorno: {request_blocked, retry_ms_1, ..., retry_ms_n}; 0 = permitido.
+_SLIDING_WINDOW_SCRIPT = """
+local required = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local count_buckets = #KEYS / 2
+local state = {}
+for i = 1, count_buckets do
+  local base = 2 + (i - 1) * 3
+  local limit = tonumber(ARGV[base + 1])
+  local window = tonumber(ARGV[base + 2])
+  local cost = tonumber(ARGV[base + 3])
+  local current_key = KEYS[i * 2 - 1]
+  local previous = tonumber(redis.call('GET', KEYS[i * 2]) or '0')
+  local count = tonumber(redis.call('GET', current_key) or '0')
+  local weight = 1 - (now % window) / window
+  local allowed = previous * weight + count + cost <= limit
+  local retry = 0
+  if not allowed then
+    retry = math.max(1, window - (now % window))
+  end
+  state[i] = {current_key, window, cost, retry}
+end
+local out = {0}
+local request_blocked = false
+for i = 1, required do
+  if state[i][4] > 0 then
+    request_blocked = true
+  end
+end
+for i = 1, count_buckets do
+  out[i + 1] = state[i][4]
+  if not request_blocked and state[i][4] == 0 then
+    redis.call('INCRBY', state[i][1], state[i][3])
+    redis.call('PEXPIRE', state[i][1], state[i][2] * 2)
+  end
+end
+if request_blocked then
+  out[1] = 1
+end
+return out
+"""
+
+
+@dataclass
+class Bucket:
+    scope: str
+    identifier: str
+    limit: int
+    window_seconds: int
+    cost: int = 1
+
+    @property
+    def key(self) -> str:
+        return f"{RATE_LIMIT_PREFIX}{self.scope}:{self.identifier}"
+
+    def window_keys(self, now_ms: int) -> list[str]:
+        """Chaves da janela atual e da anterior para o instante `now_ms`."""
+        current = now_ms // (self.window_seconds * 1000)
+        return [f"{self.key}:{current}", f"{self.key}:{current - 1}"]
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0.0
+    blocked_scope: str | None = None
+    blocked_buckets: set[str] = field(default_factory=set)
+
+
+@dataclass
+class _LocalBucket:
+    tokens: float
+    updated_at: float
+    blocked_until: float = 0.0
+
+
+class RateLimiter:
+    """
+    Limitador distribuido com janela deslizante (uma chamada Lua por checagem) e cache local
+    de token bucket: remetentes quentes sao rejeitados no proprio processo, sem ir ao Redis.
+    `metric_prefix` separa as metricas de outros usos (ex.: o governor de LLM).
+    """
+
+    def __init__(self, metric_prefix: str = "rate_limit") -> None:
+        self.settings = get_settings()
+        self.metric_prefix = metric_prefix
+        self._local: OrderedDict[str, _LocalBucket] = OrderedDict()
+        self._script = None
+
+    def _take_local(self, bucket: Bucket, now: float) -> float:
+        """Consome tokens localmente. Retorna 0 se permitido ou os segundos ate liberar."""
+        state = self._local.get(bucket.key)
+        if state is None:
+            state = _LocalBucket(tokens=float(bucket.limit), updated_at=now)
+            self._local[bucket.key] = state
+            while len(self._local) > self.settings.rate_limit_local_cache_size:
+                self._local.popitem(last=False)
+        self._local.move_to_end(bucket.key)
+        if state.blocked_until > now:
+            return state.blocked_until - now
+        rate = bucket.limit / bucket.window_seconds
+        state.tokens = min(float(bucket.limit), state.tokens + (now - state.updated_at) * rate)
+        state.updated_at = now
+        if state.tokens < bucket.cost:
+            return (bucket.cost - state.tokens) / rate
+        state.tokens -= bucket.cost
+        return 0.0
+
+    def _refund_local(self, bucket: Bucket) -> None:
+        """Devolve os tokens locais de uma checagem que nao foi contabilizada no Redis."""
+        state = self._local.get(bucket.key)
+        if state is not None:
+            state.tokens = min(float(bucket.limit), state.tokens + bucket.cost)
+
+    def _block_local(self, bucket: Bucket, until: float) -> None:
+        state = self._local.get(bucket.key)
+        if state is not None:
+            state.blocked_until = max(state.blocked_until, until)
+
+    async def check(self, required: list[Bucket], optional: list[Bucket] | None = None) -> RateLimitDecision:
+        """
+        Avalia buckets obrigatorios (bloqueiam a requisicao inteira) e opcionais (bloqueiam apenas
+        o proprio bucket, ex.: um contato dentro de um lote).
+        """
+        optional = optional or []
+        now = time.monotonic()
+        metrics.incr(f"{self.metric_prefix}_checks_total")
+        for i, bucket in enumerate(required):
+            wait = self._take_local(bucket, now)
+            if wait:
+                for taken in required[:i]:
+                    self._refund_local(taken)
+                metrics.incr(f"{self.metric_prefix}_throttled_total", scope=bucket.scope, tier="local")
+                return RateLimitDecision(allowed=False, retry_after=wait, blocked_scope=bucket.scope)
+        blocked: set[str] = set()
+        remote: list[Bucket] = []
+        for bucket in optional:
+            if self._take_local(bucket, now):
+                metrics.incr(f"{self.metric_prefix}_throttled_total", scope=bucket.scope, tier="local")
+                blocked.add(bucket.identifier)
+            else:
+                remote.append(bucket)
+
+        buckets = required + remote
+        client = get_redis_client()
+        try:
+            if self._script is None:
+                self._script = client.register_script(_SLIDING_WINDOW_SCRIPT)
+            # relogio local (NTP) define a janela: as chaves precisam ser conhecidas antes do script
+            now_ms = int(time.time() * 1000)
+            keys: list[str] = []
+            args: list[int] = [len(required), now_ms]
+            for bucket in buckets:
+                keys.extend(bucket.window_keys(now_ms))
+                args.extend([bucket.limit, bucket.window_seconds * 1000, bucket.cost])
+            result = await self._script(keys=keys, args=args, client=client)
+        except Exception as exc:  # pragma: no cover - best effort
+            metrics.incr(f"{self.metric_prefix}_errors_total")
+            logger.warning("Falha ao aplicar rate limit redis_error=%s", exc)
+            return RateLimitDecision(allowed=True, blocked_buckets=blocked)
+
+        request_blocked = bool(int(result[0]))
+        retries = [int(r) / 1000 for r in result[1:]]
+        for bucket, retry in zip(buckets, retries):
+            if retry:
+                self._block_local(bucket, now + retry)
+            if retry or request_blocked:
+                # o Redis nao contou esta checagem: os tokens locais voltam
+                self._refund_local(bucket)
+        if request_blocked:
+            index = next(i for i, retry in enumerate(retries[: len(required)]) if retry)
+            metrics.incr(f"{self.metric_prefix}_throttled_total", scope=required[index].scope, tier="redis")
+            return RateLimitDecision(allowed=False, retry_after=retries[index], blocked_scope=required[index].scope)
+        for bucket, retry in zip(remote, retries[len(required):]):
+            if retry:
+                metrics.incr(f"{self.metric_prefix}_throttled_total", scope=bucket.scope, tier="redis")
+                blocked.add(bucket.identifier)
+        return RateLimitDecision(allowed=True, blocked_buckets=blocked)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from app.config import get_settings
+from app.utils.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# todas as chaves do buffer compartilham a hash tag `{textbuf}` (um unico slot do Redis Cluster):
+# append, reagendamento e ack tocam a conversa e o sorted set de vencimentos em um so script
+BUFFER_PREFIX = "{textbuf}:"
+BUFFER_DUE_KEY = "{textbuf}:due"
+
+# Acrescenta o texto ao buffer e (re)agenda o flush para agora + delay, pelo relogio do Redis
+# (replicas concordam no vencimento). Com uma reivindicacao em andamento (`claim`) o vencimento
+# nunca desce abaixo da visibilidade dela: os textos novos esperam o ack, que os reagenda.
+# KEYS: texts, payload, claim, due. ARGV: texto, payload, max mensagens, ttl, delay ms, conversa_id.
+_APPEND_SCRIPT = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[4])
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local score = now_ms + tonumber(ARGV[5])
+if redis.call('EXISTS', KEYS[3]) == 1 then
+  local current = tonumber(redis.call('ZSCORE', KEYS[4], ARGV[6]) or '0')
+  score = math.max(score, current)
+end
+redis.call('ZADD', KEYS[4], score, ARGV[6])
+return redis.call('LLEN', KEYS[1])
+"""
+
+# Reivindica conversas vencidas empurrando o vencimento para agora + visibilidade: so uma replica
+# as recebe, e se ela cair antes do ack a conversa volta a vencer e e reprocessada.
+_CLAIM_DUE_SCRIPT = """
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now_ms, 'LIMIT', 0, tonumber(ARGV[1]))
+local score = now_ms + tonumber(ARGV[2])
+local out = {}
+for _, id in ipairs(ids) do
+  redis.call('ZADD', KEYS[1], score, id)
+  table.insert(out, {id, tostring(score)})
+end
+return out
+"""
+
+# Move o buffer para as chaves de processamento (juntando a uma tentativa anterior nao confirmada),
+# grava a reivindicacao dona delas e conta a tentativa. Sem nada a processar, remove o vencimento.
+# KEYS: texts, payload, processing texts, processing payload, attempts, claim, due.
+# ARGV: ttl, claim (score da reivindicacao), conversa_id.
+_TAKE_SCRIPT = """
+local texts = redis.call('LRANGE', KEYS[1], 0, -1)
+if #texts > 0 then
+  redis.call('RPUSH', KEYS[3], unpack(texts))
+  redis.call('DEL', KEYS[1])
+end
+local payload = redis.call('GET', KEYS[2])
+if payload then
+  redis.call('SET', KEYS[4], payload)
+  redis.call('DEL', KEYS[2])
+end
+payload = redis.call('GET', KEYS[4])
+if not payload then
+  redis.call('DEL', KEYS[3], KEYS[5], KEYS[6])
+  local score = redis.call('ZSCORE', KEYS[7], ARGV[3])
+  if score and tonumber(score) == tonumber(ARGV[2]) then
+    redis.call('ZREM', KEYS[7], ARGV[3])
+  end
+  return nil
+end
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+redis.call('EXPIRE', KEYS[4], ARGV[1])
+redis.call('SET', KEYS[6], ARGV[2], 'EX', ARGV[1])
+local attempts = redis.call('INCR', KEYS[5])
+redis.call('EXPIRE', KEYS[5], ARGV[1])
+return {payload, redis.call('LRANGE', KEYS[3], 0, -1), attempts}
+"""
+
+# Confirma uma reivindicacao: so a dona atual (`claim`) apaga as chaves de processamento, entao um
+# ack atrasado nao apaga o lote de uma reivindicacao posterior. Textos que chegaram durante o
+# processamento ficam no buffer e sao reagendados para agora + delay; sem eles sai o vencimento.
+# KEYS: processing texts, processing payload, attempts, claim, texts, due.
+# ARGV: claim, conversa_id, delay ms.
+_ACK_SCRIPT = """
+if redis.call('GET', KEYS[4]) ~= ARGV[1] then
+  return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+if redis.call('LLEN', KEYS[5]) > 0 then
+  local t = redis.call('TIME')
+  local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+  redis.call('ZADD', KEYS[6], now_ms + tonumber(ARGV[3]), ARGV[2])
+else
+  redis.call('ZREM', KEYS[6], ARGV[2])
+end
+return 1
+"""
+
+
+@dataclass
+class BufferedText:
+    conversa_id: str
+    texts: list[str]
+    payload: dict[str, Any]
+    claim_score: str = ""
+    attempts: int = 1
+
+
+class TextBufferService:
+    """
+    Buffer distribuido (Redis) para mensagens "picotadas": uma lista por conversa e um
+    sorted set com o vencimento do debounce. Qualquer replica pode rodar o flusher.
+
+    O buffer reivindicado vai para chaves de processamento e so e apagado depois que o handler
+    termina; se o processo cair (ou o handler falhar), a conversa volta a vencer apos
+    `TEXT_BUFFER_VISIBILITY_SECONDS` e e reprocessada, ate `TEXT_BUFFER_MAX_ATTEMPTS` tentativas.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._scripts: dict[str, Any] = {}
+
+    def _key(self, conversa_id: str, name: str) -> str:
+        return f"{BUFFER_PREFIX}{conversa_id}:{name}"
+
+    def _processing_keys(self, conversa_id: str) -> list[str]:
+        return [
+            self._key(conversa_id, "processing:texts"),
+            self._key(conversa_id, "processing:payload"),
+            self._key(conversa_id, "attempts"),
+            self._key(conversa_id, "claim"),
+        ]
+
+    def _script(self, client, source: str):
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = client.register_script(source)
+        return script
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.text_buffer_delay_seconds > 0
+
+    async def append(self, conversa_id: str, texto: str, payload: dict[str, Any]) -> int:
+        client = get_redis_client()
+        count = await self._script(client, _APPEND_SCRIPT)(
+            keys=[
+                self._key(conversa_id, "texts"),
+                self._key(conversa_id, "payload"),
+                self._key(conversa_id, "claim"),
+                BUFFER_DUE_KEY,
+            ],
+            args=[
+                texto,
+                json.dumps(payload),
+                self.settings.text_buffer_max_messages,
+                self.settings.text_buffer_ttl_seconds,
+                self.settings.text_buffer_delay_seconds * 1000,
+                conversa_id,
+            ],
+            client=client,
+        )
+        return int(count)
+
+    async def claim_due(self, limit: int = 50) -> list[BufferedText]:
+        client = get_redis_client()
+        due = await self._script(client, _CLAIM_DUE_SCRIPT)(
+            keys=[BUFFER_DUE_KEY],
+            args=[limit, self.settings.text_buffer_visibility_seconds * 1000],
+            client=client,
+        )
+        claimed: list[BufferedText] = []
+        for conversa_id, score in due or []:
+            row = await self._script(client, _TAKE_SCRIPT)(
+                keys=[
+                    self._key(conversa_id, "texts"),
+                    self._key(conversa_id, "payload"),
+                    *self._processing_keys(conversa_id),
+                    BUFFER_DUE_KEY,
+                ],
+                args=[self.settings.text_buffer_ttl_seconds, score, conversa_id],
+                client=client,
+            )
+            if not row:
+                # vencimento sem buffer (ja processado ou expirado): o script ja removeu
+                continue
+            item = BufferedText(conversa_id=conversa_id, texts=[], payload={}, claim_score=str(score))
+            raw_payload, texts, attempts = row
+            try:
+                item.payload = json.loads(raw_payload)
+            except ValueError:
+                logger.warning("Payload de buffer invalido descartado conversa=%s", conversa_id)
+                await self.ack(item)
+                continue
+            item.texts = list(texts or [])
+            item.attempts = int(attempts)
+            claimed.append(item)
+        return claimed
+
+    async def ack(self, item: BufferedText) -> None:
+        """
+        Confirma o processamento: apaga as chaves de processamento (se a reivindicacao ainda for a
+        dona) e reagenda os textos que chegaram no meio tempo.
+        """
+        client = get_redis_client()
+        await self._script(client, _ACK_SCRIPT)(
+            keys=[
+                *self._processing_keys(item.conversa_id),
+                self._key(item.conversa_id, "texts"),
+                BUFFER_DUE_KEY,
+            ],
+            args=[item.claim_score, item.conversa_id, self.settings.text_buffer_delay_seconds * 1000],
+            client=client,
+        )
+
+    async def _handle(self, item: BufferedText, handler: Callable[[BufferedText], Awaitable[None]]) -> None:
+        try:
+            await handler(item)
+        except Exception as exc:
+            if item.attempts < self.settings.text_buffer_max_attempts:
+                # fica nas chaves de processamento; volta a vencer apos a visibilidade
+                logger.warning(
+                    "Falha no flush do buffer, nova tentativa conversa=%s tentativa=%s error=%s",
+                    item.conversa_id,
+                    item.attempts,
+                    exc,
+                )
+                return
+            logger.error(
+                "Buffer descartado apos tentativas conversa=%s tentativas=%s", item.conversa_id, item.attempts
+            )
+        try:
+            await self.ack(item)
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao confirmar buffer conversa=%s redis_error=%s", item.conversa_id, exc)
+
+    async def run_flusher(
+        self,
+        handler: Callable[[BufferedText], Awaitable[None]],
+        stop_event: asyncio.Event,
+    ) -> None:
+        """
+        Loop de flush: reivindica buffers vencidos e dispara o handler de cada conversa em paralelo.
+        O buffer so e confirmado quando o handler termina sem erro.
+        """
+        interval = self.settings.text_buffer_poll_interval_ms / 1000
+        in_flight: set[asyncio.Task] = set()
+        while not stop_event.is_set():
+            try:
+                for item in await self.claim_due():
+                    task = asyncio.create_task(self._handle(item, handler))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+            except Exception as exc:  # pragma: no cover - redis indisponivel
+                logger.warning("Falha ao reivindicar buffers de texto redis_error=%s", exc)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+
+text_buffer_service = TextBufferService()
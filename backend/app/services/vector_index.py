@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import get_settings
+from app.services.answer_cache import answer_cache
+from app.utils.db import get_supabase_client, parse_timestamp
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 500
+ROW_COLUMNS = "id, documento_id, chunk, embedding, atualizado_em, documentos(empreendimento)"
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+# arquivo ponteiro com o nome do diretorio do snapshot atual (trocado com um unico os.replace)
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_PREFIX = "snapshot-"
+# snapshots anteriores mantidos para workers que leram o ponteiro antigo e ainda vao abrir os arquivos
+KEEP_SNAPSHOTS = 2
+
+
+def _parse_embedding(value: Any) -> np.ndarray:
+    # PostgREST devolve `vector` como texto ("[0.1,0.2,...]")
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+@dataclass
+class _Snapshot:
+    ids: list[str]
+    meta: list[dict[str, Any]]
+    empreendimentos: np.ndarray
+    matrix: np.ndarray
+    scales: np.ndarray | None
+    watermark: str | None
+    version: str | None
+
+
+class LocalVectorIndex:
+    """
+    Snapshot local de `documentos_embeddings` para busca exata (top-k por um produto matricial).
+
+    Os vetores normalizados ficam em uma matriz contigua float32 ou int8 (escala por linha),
+    gravada em um diretorio versionado dentro de `VECTOR_INDEX_SNAPSHOT_DIR` e aberta com memmap;
+    o arquivo `CURRENT` aponta para o snapshot valido (workers que dividem o diretorio nunca veem
+    vetores e metadados de versoes diferentes). Quando a versao do corpus muda,
+    baixa so as linhas com `atualizado_em` depois da ultima sincronizacao e os ids novos,
+    descarta os removidos e regrava o snapshot. Enquanto nao estiver pronto, o QA usa o RPC.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.client = get_supabase_client()
+        self._dir = Path(self.settings.vector_index_snapshot_dir)
+        # trocado por inteiro a cada sincronizacao: buscas concorrentes veem um estado consistente
+        self._snapshot: _Snapshot | None = None
+        self._checked_at: float | None = None
+        self._refreshing: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._snapshot.ids) if self._snapshot else 0
+
+    def search(self, embedding: list[float], k: int = 5, empreendimento: str | None = None) -> list[Document]:
+        self.maybe_refresh()
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.ids:
+            return []
+        meta = snapshot.meta
+        started = time.perf_counter()
+        scores = snapshot.matrix @ _parse_embedding(embedding)
+        if snapshot.scales is not None:
+            scores = scores * snapshot.scales
+        if empreendimento is not None:
+            mask = snapshot.empreendimentos == empreendimento
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+        k = min(k, len(meta))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        metrics.observe("vector_index_search_seconds", time.perf_counter() - started)
+        return [
+            Document(
+                page_content=meta[i]["chunk"],
+                metadata={
+                    "id": snapshot.ids[i],
+                    "documento_id": meta[i]["documento_id"],
+                    "empreendimento": meta[i]["empreendimento"],
+                    "similarity": round(float(scores[i]), 4),
+                },
+            )
+            for i in top
+        ]
+
+    def maybe_refresh(self) -> None:
+        if self._checked_at is not None and (
+            time.monotonic() - self._checked_at < self.settings.vector_index_refresh_seconds
+        ):
+            return
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+        self._checked_at = time.monotonic()
+        try:
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:  # pragma: no cover - fora de event loop
+            self._refreshing = None
+
+    async def refresh(self) -> bool:
+        """Sincroniza se a versao do corpus mudou. Retorna True se o indice foi regravado."""
+        if self._snapshot is None:
+            await asyncio.to_thread(self._load_snapshot)
+        version = await answer_cache.corpus_version()
+        if self._snapshot is not None and version is not None and version == self._snapshot.version:
+            return False
+        started = time.perf_counter()
+        try:
+            ids = await asyncio.to_thread(self._fetch_ids)
+            known = set(self._snapshot.ids) if self._snapshot else set()
+            rows = await asyncio.to_thread(self._fetch_rows, [i for i in ids if i not in known])
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.warning("Falha ao atualizar indice vetorial local error=%s", exc)
+            return False
+        if not rows and known == set(ids) and self._snapshot is not None and self._snapshot.version == version:
+            return False
+        await asyncio.to_thread(self._apply, ids, rows, version)
+        metrics.set_gauge("vector_index_chunks", self.size)
+        metrics.observe("vector_index_refresh_seconds", time.perf_counter() - started)
+        logger.info("Indice vetorial local atualizado chunks=%s alterados=%s", self.size, len(rows))
+        return True
+
+    def _fetch_ids(self) -> list[str]:
+        ids: list[str] = []
+        start = 0
+        while True:
+            res = (
+                self.client.table("documentos_embeddings")
+                .select("id")
+                .order("id")
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = res.data or []
+            ids.extend(row["id"] for row in rows)
+            if len(rows) < PAGE_SIZE:
+                return ids
+            start += PAGE_SIZE
+
+    def _fetch_rows(self, new_ids: list[str]) -> list[dict[str, Any]]:
+        """Linhas alteradas desde a marca da ultima sincronizacao mais as de ids ainda nao vistos."""
+        rows: dict[str, dict[str, Any]] = {}
+        watermark = self._snapshot.watermark if self._snapshot else None
+        if watermark is not None:
+            start = 0
+            while True:
+                res = (
+                    self.client.table("documentos_embeddings")
+                    .select(ROW_COLUMNS)
+                    .gt("atualizado_em", watermark)
+                    .order("atualizado_em")
+                    .range(start, start + PAGE_SIZE - 1)
+                    .execute()
+                )
+                page = res.data or []
+                rows.update((row["id"], row) for row in page)
+                if len(page) < PAGE_SIZE:
+                    break
+                start += PAGE_SIZE
+        pending = [i for i in new_ids if i not in rows]
+        # lotes pequenos: a lista de ids vai na query string do PostgREST
+        for start in range(0, len(pending), 100):
+            res = (
+                self.client.table("documentos_embeddings")
+                .select(ROW_COLUMNS)
+                .in_("id", pending[start : start + 100])
+                .execute()
+            )
+            rows.update((row["id"], row) for row in res.data or [])
+        return list(rows.values())
+
+    def _apply(self, ids: list[str], rows: list[dict[str, Any]], version: str | None) -> None:
+        current: dict[str, tuple[np.ndarray, dict[str, Any]]] = {}
+        snapshot = self._snapshot
+        watermark = snapshot.watermark if snapshot else None
+        if snapshot is not None:
+            for i, chunk_id in enumerate(snapshot.ids):
+                vector = np.asarray(snapshot.matrix[i], dtype=np.float32)
+                if snapshot.scales is not None:
+                    vector = vector * snapshot.scales[i]
+                current[chunk_id] = (vector, snapshot.meta[i])
+        for row in rows:
+            if row.get("embedding") is None:
+                continue
+            documento = row.get("documentos") or {}
+            current[row["id"]] = (
+                _parse_embedding(row["embedding"]),
+                {
+                    "documento_id": row.get("documento_id"),
+                    "empreendimento": documento.get("empreendimento"),
+                    "chunk": row.get("chunk") or "",
+                },
+            )
+            stamp = row.get("atualizado_em")
+            parsed = parse_timestamp(stamp)
+            current_mark = parse_timestamp(watermark)
+            if parsed is not None and (current_mark is None or parsed > current_mark):
+                watermark = stamp
+        keep = [chunk_id for chunk_id in ids if chunk_id in current]
+        vectors = np.stack([current[i][0] for i in keep]) if keep else np.zeros((0, 0), dtype=np.float32)
+        target = self._write_snapshot(keep, [current[i][1] for i in keep], vectors, watermark, version)
+        self._load_snapshot(target)
+
+    def _write_snapshot(
+        self,
+        ids: list[str],
+        meta: list[dict[str, Any]],
+        vectors: np.ndarray,
+        watermark: str | None,
+        version: str | None,
+    ) -> Path:
+        scales: list[float] | None = None
+        if self.settings.vector_index_dtype == "int8" and len(ids):
+            peak = np.abs(vectors).max(axis=1)
+            peak[peak == 0] = 1.0
+            vectors = np.round(vectors / peak[:, None] * 127).astype(np.int8)
+            scales = (peak / 127).tolist()
+        else:
+            vectors = vectors.astype(np.float32)
+        # cada versao vai para um diretorio proprio; so a troca do ponteiro e visivel aos leitores
+        name = f"{SNAPSHOT_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        target = self._dir / name
+        target.mkdir(parents=True)
+        with open(target / VECTORS_FILE, "wb") as fh:
+            np.save(fh, vectors, allow_pickle=False)
+        (target / META_FILE).write_text(
+            json.dumps({"ids": ids, "meta": meta, "scales": scales, "watermark": watermark, "version": version}),
+            encoding="utf-8",
+        )
+        pointer = self._dir / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+        pointer.write_text(name, encoding="utf-8")
+        os.replace(pointer, self._dir / CURRENT_FILE)
+        self._prune(keep=name)
+        return target
+
+    def _prune(self, keep: str) -> None:
+        """Remove snapshots antigos (memmaps ja abertos seguem validos apos o unlink)."""
+        snapshots = sorted(p for p in self._dir.glob(f"{SNAPSHOT_PREFIX}*") if p.is_dir() and p.name != keep)
+        for path in snapshots[: max(0, len(snapshots) - (KEEP_SNAPSHOTS - 1))]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _load_snapshot(self, target: Path | None = None) -> None:
+        """Abre o snapshot indicado ou, sem `target`, o apontado por `CURRENT`."""
+        pointer = self._dir / CURRENT_FILE
+        if target is None and not pointer.exists():
+            return
+        try:
+            if target is None:
+                target = self._dir / pointer.read_text(encoding="utf-8").strip()
+            meta_path, vectors_path = target / META_FILE, target / VECTORS_FILE
+            data = json.loads(meta_path.read_text(encoding="utf-8"))
+            matrix = np.load(vectors_path, mmap_mode="r", allow_pickle=False)
+        except Exception as exc:  # pragma: no cover - snapshot corrompido
+            logger.warning("Snapshot do indice vetorial invalido error=%s", exc)
+            return
+        if len(data["ids"]) != (matrix.shape[0] if matrix.ndim == 2 else 0):
+            logger.warning("Snapshot do indice vetorial inconsistente, ignorado")
+            return
+        self._snapshot = _Snapshot(
+            ids=data["ids"],
+            meta=data["meta"],
+            empreendimentos=np.asarray([m["empreendimento"] for m in data["meta"]], dtype=object),
+            matrix=matrix,
+            scales=np.asarray(data["scales"], dtype=np.float32) if data.get("scales") else None,
+            watermark=data.get("watermark"),
+            version=data.get("version"),
+        )
+
+
+vector_index = LocalVectorIndex()
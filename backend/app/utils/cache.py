@@ -1,11 +1,29 @@
 from __future__ import annotations
 
+import asyncio
+import weakref
 from functools import lru_cache
 
 from redis.asyncio import Redis
 
 from app.config import get_settings
 
+_LEASE_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_LEASE_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Redis]" = weakref.WeakKeyDictionary()
+
 
 @lru_cache
 def _redis_client() -> Redis:
@@ -14,7 +32,20 @@ def _redis_client() -> Redis:
 
 
 def get_redis_client() -> Redis:
-    return _redis_client()
+    """
+    Cliente Redis do event loop atual. As conexoes do redis.asyncio ficam presas ao loop em que
+    foram abertas, e as tasks Celery criam um loop novo por execucao (`asyncio.run`).
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _redis_client()
+    client = _loop_clients.get(loop)
+    if client is None:
+        settings = get_settings()
+        client = Redis.from_url(settings.redis_url, decode_responses=True)  # type: ignore[arg-type]
+        _loop_clients[loop] = client
+    return client
 
 
 async def set_if_absent(key: str, value: str, ttl_seconds: int) -> bool:
@@ -29,3 +60,27 @@ async def set_if_absent(key: str, value: str, ttl_seconds: int) -> bool:
 async def delete_key(key: str) -> None:
     client = get_redis_client()
     await client.delete(key)
+
+
+async def delete_keys(keys: list[str]) -> None:
+    if not keys:
+        return
+    client = get_redis_client()
+    await client.delete(*keys)
+
+
+async def acquire_lease(key: str, token: str, ttl_ms: int) -> bool:
+    client = get_redis_client()
+    return bool(await client.set(key, token, px=ttl_ms, nx=True))
+
+
+async def renew_lease(key: str, token: str, ttl_ms: int) -> bool:
+    """Renova o lease apenas se ainda pertence a `token`."""
+    client = get_redis_client()
+    return bool(await client.eval(_LEASE_RENEW_SCRIPT, 1, key, token, ttl_ms))
+
+
+async def release_lease(key: str, token: str) -> None:
+    """Remove o lease apenas se ainda pertence a `token`."""
+    client = get_redis_client()
+    await client.eval(_LEASE_RELEASE_SCRIPT, 1, key, token)
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from supabase import create_client, Client
 
 from app.config import get_settings
@@ -8,3 +10,14 @@ def get_supabase_client() -> Client:
     if not settings.supabase_url or not settings.supabase_key:
         raise RuntimeError("Supabase credentials not configured.")
     return create_client(settings.supabase_url, settings.supabase_key)
+
+
+def parse_timestamp(value: str | None) -> datetime | None:
+    """Timestamp do PostgREST (ISO 8601) em UTC; None se ausente ou invalido."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Iterator, TypeVar
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+T = TypeVar("T")
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("reply_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Estagio cancelado por estourar o proprio orcamento ou o prazo total da resposta. `partial`
+    guarda o texto que ja chegou ao lead (resposta em streaming interrompida), se houver.
+    """
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"deadline_excedido:{stage}")
+        self.stage = stage
+        self.partial: str | None = None
+
+
+@contextmanager
+def deadline_scope(seconds: float, *, inherit: bool = True) -> Iterator[None]:
+    """
+    Define o prazo total da resposta para o contexto atual (e tasks criadas a partir dele).
+    Com `inherit`, um prazo externo mais curto prevalece; sem ele o prazo e reiniciado
+    (ex.: processamento de documento em background).
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if inherit and current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def stage_budget(stage: str) -> float:
+    settings = get_settings()
+    return {
+        "intent": settings.stage_budget_intent_seconds,
+        "retrieval": settings.stage_budget_retrieval_seconds,
+        "generation": settings.stage_budget_generation_seconds,
+        "send": settings.stage_budget_send_seconds,
+        "indexing": settings.stage_budget_indexing_seconds,
+    }[stage]
+
+
+async def run_stage(stage: str, awaitable: Awaitable[T], *, ignore_deadline: bool = False) -> T:
+    """
+    Executa um estagio com o menor entre o orcamento do estagio e o tempo restante do prazo.
+    Fora de um `deadline_scope` (jobs em background) apenas aguarda, sem limite.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    timeout = stage_budget(stage) if ignore_deadline else min(stage_budget(stage), left)
+    if timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        metrics.incr("deadline_miss_total", stage=stage)
+        raise DeadlineExceeded(stage)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError as exc:
+        metrics.incr("deadline_miss_total", stage=stage)
+        raise DeadlineExceeded(stage) from exc
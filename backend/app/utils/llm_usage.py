@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.utils.metrics import metrics
+
+
+def _cached_tokens(usage: dict[str, Any]) -> int:
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0)
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """
+    Registra o uso de tokens devolvido pelo provedor por `agent_key`:
+    `llm_tokens_total{agent,kind=prompt|cached|completion}` e a fracao do prompt servida pelo
+    cache de prompt (`llm_prompt_cache_ratio{agent}`, acumulada no processo).
+    """
+
+    # so atualiza contadores em memoria; nao precisa de thread do executor
+    run_inline = True
+
+    def __init__(self, agent_key: str) -> None:
+        self.agent_key = agent_key
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage:
+            # respostas em streaming nao trazem `usage`
+            metrics.incr("llm_usage_missing_total", agent=self.agent_key)
+            return
+        prompt = int(usage.get("prompt_tokens") or 0)
+        cached = _cached_tokens(usage)
+        metrics.incr("llm_tokens_total", prompt, agent=self.agent_key, kind="prompt")
+        metrics.incr("llm_tokens_total", cached, agent=self.agent_key, kind="cached")
+        metrics.incr("llm_tokens_total", int(usage.get("completion_tokens") or 0), agent=self.agent_key, kind="completion")
+        total_prompt = metrics.counter("llm_tokens_total", agent=self.agent_key, kind="prompt")
+        if total_prompt:
+            total_cached = metrics.counter("llm_tokens_total", agent=self.agent_key, kind="cached")
+            metrics.set_gauge("llm_prompt_cache_ratio", total_cached / total_prompt, agent=self.agent_key)
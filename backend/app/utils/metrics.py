@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+from typing import Any
+
+
+SUMMARY_WINDOW = 2048
+
+
+def _label_key(labels: dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Metrics:
+    """
+    Registro de metricas em memoria (por processo), exposto em `/metrics`.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple[tuple[str, str], ...], float]] = defaultdict(dict)
+        self._gauges: dict[str, dict[tuple[tuple[str, str], ...], float]] = defaultdict(dict)
+        self._summaries: dict[str, dict[tuple[tuple[str, str], ...], deque]] = defaultdict(dict)
+        self._summary_counts: dict[str, dict[tuple[tuple[str, str], ...], int]] = defaultdict(dict)
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Registra uma amostra (ex.: latencia) nas ultimas `SUMMARY_WINDOW` observacoes da serie."""
+        key = _label_key(labels)
+        with self._lock:
+            window = self._summaries[name].get(key)
+            if window is None:
+                window = self._summaries[name][key] = deque(maxlen=SUMMARY_WINDOW)
+            window.append(value)
+            counts = self._summary_counts[name]
+            counts[key] = counts.get(key, 0) + 1
+
+    def percentile(self, name: str, q: float, **labels: Any) -> float | None:
+        with self._lock:
+            window = self._summaries.get(name, {}).get(_label_key(labels))
+            values = list(window) if window else []
+        return _percentile(values, q) if values else None
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            gauges = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._gauges.items()
+            }
+            summaries = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": self._summary_counts[name][key],
+                        "p50": _percentile(list(window), 0.5),
+                        "p95": _percentile(list(window), 0.95),
+                        "p99": _percentile(list(window), 0.99),
+                    }
+                    for key, window in series.items()
+                    if window
+                ]
+                for name, series in self._summaries.items()
+            }
+        return {"counters": counters, "gauges": gauges, "summaries": summaries}
+
+
+metrics = Metrics()
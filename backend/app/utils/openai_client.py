@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+
+import httpx
+from langchain_openai import OpenAIEmbeddings
+
+from app.config import get_settings
+from app.services.llm_governor import GovernedTransport
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP assincrono compartilhado por todas as chamadas OpenAI do event loop atual
+    (pool de conexoes e TLS reaproveitados). Um por loop, como o cliente Redis. Cada requisicao
+    passa pelo governor global de RPM/TPM.
+    """
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop)
+    if client is None:
+        settings = get_settings()
+        # com `transport` explicito o AsyncClient ignora `limits`: o pool fica no transporte interno
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_connections,
+            ),
+        )
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.openai_timeout_seconds, connect=5.0),
+            transport=GovernedTransport(transport),
+        )
+        _loop_clients[loop] = client
+    return client
+
+
+def build_openai_embeddings(**kwargs) -> OpenAIEmbeddings:
+    """OpenAIEmbeddings no cliente HTTP do loop atual: toda requisicao (e retry) passa pelo governor."""
+    return OpenAIEmbeddings(http_async_client=get_openai_http_client(), **kwargs)
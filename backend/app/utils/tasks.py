@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TaskSupervisor:
+    """
+    Pool supervisionado de tasks em background: guarda referencia de cada task, limita a
+    concorrencia, recusa trabalho quando a fila passa do limite e drena no shutdown.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._tasks: set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._queued = 0
+        self._running = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queued + self._running
+
+    def _publish(self) -> None:
+        metrics.set_gauge("task_pool_queued", self._queued, pool=self.name)
+        metrics.set_gauge("task_pool_running", self._running, pool=self.name)
+
+    def submit(self, factory: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Agenda o trabalho. Retorna False (backpressure) quando concorrencia + fila estao cheias.
+        """
+        if self.depth >= self.max_concurrency + self.max_queue:
+            metrics.incr("task_pool_shed_total", pool=self.name)
+            return False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._queued += 1
+        self._publish()
+        task = asyncio.create_task(self._run(factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, factory: Callable[[], Awaitable[Any]]) -> None:
+        assert self._semaphore is not None
+        started = False
+        try:
+            async with self._semaphore:
+                self._queued -= 1
+                self._running += 1
+                started = True
+                self._publish()
+                try:
+                    await factory()
+                except Exception as exc:
+                    metrics.incr("task_pool_failed_total", pool=self.name)
+                    logger.exception("Task em background falhou pool=%s error=%s", self.name, exc)
+                finally:
+                    self._running -= 1
+        finally:
+            if not started:
+                # cancelada ainda na fila
+                self._queued -= 1
+            self._publish()
+
+    async def drain(self, timeout: float) -> None:
+        """Aguarda as tasks em andamento ate `timeout` segundos e cancela o restante."""
+        if not self._tasks:
+            return
+        pending = set(self._tasks)
+        logger.info("Drenando pool=%s tasks=%s", self.name, len(pending))
+        done, still_pending = await asyncio.wait(pending, timeout=timeout)
+        for task in still_pending:
+            task.cancel()
+        if still_pending:
+            logger.warning("Pool=%s cancelou tasks=%s apos drain", self.name, len(still_pending))
+            await asyncio.gather(*still_pending, return_exceptions=True)
+
+
+_settings = get_settings()
+document_tasks = TaskSupervisor(
+    "documents",
+    max_concurrency=_settings.document_max_concurrency,
+    max_queue=_settings.document_queue_size,
+)
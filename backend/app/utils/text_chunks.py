@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import re
+from typing import AsyncIterator
+
+# fim de frase (com aspas/parenteses de fechamento opcionais) seguido de espaco, ou quebra de paragrafo
+_SENTENCE_END = re.compile(r"[.!?…][\"')\]]*\s+|\n{2,}")
+
+
+def _cut_point(buffer: str, max_chars: int, min_chars: int, eager: bool) -> int | None:
+    """
+    Posicao de corte do buffer ou None para aguardar mais texto. No modo `eager` (primeira
+    mensagem) corta no primeiro fim de frase apos `min_chars`; depois espera juntar ate
+    `max_chars` e corta no ultimo fim de frase dentro do limite.
+    """
+    boundaries = [m.end() for m in _SENTENCE_END.finditer(buffer) if min_chars <= m.end() <= max_chars]
+    if eager and boundaries:
+        return boundaries[0]
+    if len(buffer) < max_chars:
+        return None
+    if boundaries:
+        return boundaries[-1]
+    space = buffer.rfind(" ", min_chars, max_chars)
+    return space if space > 0 else max_chars
+
+
+async def chunk_stream(tokens: AsyncIterator[str], max_chars: int, min_chars: int) -> AsyncIterator[str]:
+    """Reagrupa um stream de tokens em mensagens de ate `max_chars`, cortando em fim de frase."""
+    buffer = ""
+    first = True
+    async for token in tokens:
+        buffer += token
+        while True:
+            cut = _cut_point(buffer, max_chars, min_chars, eager=first)
+            if cut is None:
+                break
+            chunk, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+            if chunk:
+                first = False
+                yield chunk
+    while len(buffer) > max_chars:
+        cut = _cut_point(buffer, max_chars, min_chars, eager=False) or max_chars
+        chunk, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+        if chunk:
+            yield chunk
+    tail = buffer.strip()
+    if tail:
+        yield tail
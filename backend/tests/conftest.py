@@ -0,0 +1,58 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.utils import cache  # noqa: E402
+
+
+class FakeRedis:
+    """Subconjunto do redis.asyncio usado pelos leases (SET NX PX e os scripts de renovar/liberar)."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, tuple[str, float | None]] = {}
+
+    def _alive(self, key: str) -> str | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    async def get(self, key: str) -> str | None:
+        return self._alive(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key) is not None:
+            return None
+        ttl = px / 1000 if px is not None else ex
+        self.data[key] = (str(value), time.monotonic() + ttl if ttl is not None else None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def eval(self, script: str, numkeys: int, key: str, *args):
+        if self._alive(key) != str(args[0]):
+            return 0
+        if script == cache._LEASE_RENEW_SCRIPT:
+            self.data[key] = (self.data[key][0], time.monotonic() + int(args[1]) / 1000)
+            return 1
+        if script == cache._LEASE_RELEASE_SCRIPT:
+            return await self.delete(key)
+        raise NotImplementedError(script)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, "get_redis_client", lambda: redis)
+    return redis
@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+
+from app.config import get_settings
+from app.services.conversation_executor import ConversationBusyError, ConversationExecutor
+from app.utils.deadline import deadline_scope, remaining
+from app.utils.metrics import metrics
+
+
+def _executor(**overrides) -> ConversationExecutor:
+    executor = ConversationExecutor()
+    executor.settings = get_settings().model_copy(update=overrides)
+    return executor
+
+
+def test_same_conversation_runs_in_order(fake_redis):
+    executor = _executor()
+    order: list[str] = []
+
+    def job(name: str, delay: float):
+        async def _run():
+            order.append(f"start:{name}")
+            await asyncio.sleep(delay)
+            order.append(f"end:{name}")
+            return name
+
+        return _run
+
+    async def main():
+        return await asyncio.gather(
+            executor.run("c1", job("a", 0.05)),
+            executor.run("c1", job("b", 0.0)),
+            executor.run("c1", job("c", 0.01)),
+        )
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert order == ["start:a", "end:a", "start:b", "end:b", "start:c", "end:c"]
+    assert fake_redis.data == {}
+
+
+def test_different_conversations_run_in_parallel(fake_redis):
+    executor = _executor()
+    running: set[str] = set()
+    overlap: list[set[str]] = []
+
+    def job(name: str):
+        async def _run():
+            running.add(name)
+            await asyncio.sleep(0.05)
+            overlap.append(set(running))
+            running.discard(name)
+
+        return _run
+
+    async def main():
+        await asyncio.gather(executor.run("c1", job("a")), executor.run("c2", job("b")))
+
+    asyncio.run(main())
+    assert {"a", "b"} in overlap
+
+
+def test_waits_for_lease_held_elsewhere(fake_redis):
+    executor = _executor()
+
+    async def main():
+        await fake_redis.set("conversation:lease:c1", "other", px=60_000)
+
+        async def release_later():
+            await asyncio.sleep(0.2)
+            await fake_redis.delete("conversation:lease:c1")
+
+        releaser = asyncio.create_task(release_later())
+
+        async def job():
+            return await fake_redis.get("conversation:lease:c1")
+
+        holder = await executor.run("c1", job)
+        await releaser
+        return holder
+
+    before = metrics.counter("conversation_lease_contended_total")
+    holder = asyncio.run(main())
+    assert holder not in (None, "other")
+    assert metrics.counter("conversation_lease_contended_total") == before + 1
+
+
+def test_lease_wait_is_bounded_by_caller_deadline(fake_redis):
+    executor = _executor(conversation_lease_wait_seconds=120)
+
+    async def main():
+        await fake_redis.set("conversation:lease:c1", "other", px=60_000)
+
+        async def job():
+            return "ran"
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with deadline_scope(0.2):
+            with pytest.raises(ConversationBusyError):
+                await executor.run("c1", job)
+        return loop.time() - started
+
+    assert asyncio.run(main()) < 1.0
+
+
+def test_lease_polling_does_not_hold_a_slot(fake_redis):
+    executor = _executor(conversation_max_parallel=1, conversation_lease_wait_seconds=1)
+    done: list[str] = []
+
+    async def main():
+        await fake_redis.set("conversation:lease:busy", "other", px=60_000)
+
+        async def job(name: str):
+            done.append(name)
+
+        blocked = asyncio.create_task(executor.run("busy", lambda: job("busy")))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(executor.run("free", lambda: job("free")), timeout=0.5)
+        with pytest.raises(ConversationBusyError):
+            await blocked
+
+    asyncio.run(main())
+    assert done == ["free"]
+
+
+def test_queued_job_keeps_caller_budget(fake_redis):
+    executor = _executor()
+    seen: list[float | None] = []
+
+    async def main():
+        async def slow():
+            await asyncio.sleep(0.15)
+
+        async def probe():
+            seen.append(remaining())
+
+        with deadline_scope(0.1):
+            first = asyncio.create_task(executor.run("c1", slow))
+            second = asyncio.create_task(executor.run("c1", probe))
+            await asyncio.gather(first, second)
+
+    asyncio.run(main())
+    # o prazo de 0.1s ja teria expirado na fila; o trabalho recebe o orcamento que restava ao enfileirar
+    assert seen[0] is not None and 0 < seen[0] <= 0.1
+
+
+def test_job_without_caller_deadline_is_unbounded(fake_redis):
+    executor = _executor()
+
+    async def main():
+        async def probe():
+            return remaining()
+
+        return await executor.run("c1", probe)
+
+    assert asyncio.run(main()) is None
+
+
+def test_lost_lease_is_reacquired_before_next_job(fake_redis):
+    executor = _executor(conversation_lease_ttl_seconds=1)
+
+    async def main():
+        async def steal():
+            await fake_redis.set("conversation:lease:c1", "other", px=200)
+            await asyncio.sleep(0.5)
+
+        async def probe():
+            return await fake_redis.get("conversation:lease:c1")
+
+        first = asyncio.create_task(executor.run("c1", steal))
+        second = asyncio.create_task(executor.run("c1", probe))
+        await first
+        return await second
+
+    before = metrics.counter("conversation_lease_lost_total")
+    holder = asyncio.run(main())
+    assert metrics.counter("conversation_lease_lost_total") == before + 1
+    assert holder not in (None, "other")
+    assert fake_redis.data == {}
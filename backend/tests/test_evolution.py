@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from app.services.evolution import EvolutionClient
+from app.utils.deadline import DeadlineExceeded, deadline_scope, run_stage
+
+
+def test_stream_reports_chunks_delivered_before_deadline(monkeypatch):
+    client = EvolutionClient()
+    sent: list[str] = []
+
+    async def send_text(contato: str, texto: str) -> None:
+        sent.append(texto)
+
+    monkeypatch.setattr(client, "send_text", send_text)
+
+    async def tokens():
+        yield "Primeira frase da resposta, longa o bastante para sair sozinha no streaming. " * 2
+        yield "Segunda parte "
+        await asyncio.sleep(1)
+        yield "que nunca chega."
+
+    async def main():
+        delivered: list[str] = []
+        with deadline_scope(0.2):
+            with pytest.raises(DeadlineExceeded):
+                await run_stage("generation", client.send_text_stream("55", tokens(), delivered=delivered))
+        return delivered
+
+    delivered = asyncio.run(main())
+    assert delivered == sent and len(delivered) == 1
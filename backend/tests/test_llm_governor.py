@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from app.services import rate_limit
+from app.services.llm_governor import BACKGROUND, INTERACTIVE, LLMGovernor, priority_scope
+from app.utils.metrics import metrics
+
+fakeredis = pytest.importorskip("fakeredis", reason="scripts Lua exigem fakeredis[lua]")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def lua_redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limit, "get_redis_client", lambda: redis)
+    return redis
+
+
+def _governor(**overrides) -> LLMGovernor:
+    governor = LLMGovernor()
+    governor.settings = governor.settings.model_copy(update=overrides)
+    governor._limits = governor.settings.llm_governor_limits
+    return governor
+
+
+def test_priorities_keep_separate_local_buckets(lua_redis):
+    governor = _governor(llm_governor_limits_raw="m=10/0", llm_governor_background_share=0.5)
+
+    async def main():
+        with priority_scope(BACKGROUND):
+            await governor.acquire("m", 0)
+        await governor.acquire("m", 0)
+
+    before = metrics.counter("rate_limit_checks_total")
+    asyncio.run(main())
+    local = {priority: limiter._local["ratelimit:llm_rpm:m"] for priority, limiter in governor._limiters.items()}
+    # cada prioridade comeca com o proprio teto, independente de quem chamou primeiro
+    assert local[BACKGROUND].tokens == pytest.approx(4, abs=0.01)
+    assert local[INTERACTIVE].tokens == pytest.approx(9, abs=0.01)
+    assert metrics.counter("rate_limit_checks_total") == before
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from app.services import rate_limit
+from app.services.rate_limit import Bucket, RateLimiter
+
+fakeredis = pytest.importorskip("fakeredis", reason="scripts Lua exigem fakeredis[lua]")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def lua_redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limit, "get_redis_client", lambda: redis)
+    return redis
+
+
+def test_window_is_shared_through_declared_keys(lua_redis):
+    limiter = RateLimiter()
+    other_replica = RateLimiter()
+
+    async def main():
+        first = await limiter.check([Bucket("ip", "1.2.3.4", 2, 60)])
+        second = await other_replica.check([Bucket("ip", "1.2.3.4", 2, 60)])
+        third = await other_replica.check([Bucket("ip", "1.2.3.4", 2, 60)])
+        return first, second, third, await lua_redis.keys("*")
+
+    first, second, third, keys = asyncio.run(main())
+    assert first.allowed and second.allowed
+    assert not third.allowed and third.blocked_scope == "ip"
+    assert len(keys) == 1 and keys[0].startswith("ratelimit:ip:1.2.3.4:")
+
+
+def test_local_tokens_are_refunded_when_redis_rejects(lua_redis):
+    limiter = RateLimiter()
+    ip = Bucket("ip", "1.2.3.4", 10, 60)
+    instance = Bucket("instance", "main", 1, 60)
+
+    async def main():
+        # outra replica ja gastou o limite da instancia no Redis
+        await RateLimiter().check([Bucket("instance", "main", 1, 60)])
+        return await limiter.check([ip, instance])
+
+    decision = asyncio.run(main())
+    assert not decision.allowed and decision.blocked_scope == "instance"
+    assert limiter._local[ip.key].tokens == pytest.approx(10, abs=0.01)
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.config import get_settings
+from app.services import text_buffer
+from app.services.text_buffer import TextBufferService
+
+fakeredis = pytest.importorskip("fakeredis", reason="scripts Lua exigem fakeredis[lua]")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def lua_redis(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(text_buffer, "get_redis_client", lambda: redis)
+    return redis
+
+
+def _service(**overrides) -> TextBufferService:
+    service = TextBufferService()
+    service.settings = get_settings().model_copy(
+        update={"text_buffer_delay_seconds": 0, "text_buffer_visibility_seconds": 0, **overrides}
+    )
+    return service
+
+
+def test_claimed_buffer_survives_until_ack(lua_redis):
+    service = _service()
+
+    async def main():
+        await service.append("c1", "oi", {"contato": "55"})
+        await service.append("c1", "tudo bem?", {"contato": "55"})
+        first = await service.claim_due()
+        # sem ack (processo caiu): a conversa volta a vencer com os mesmos textos
+        again = await service.claim_due()
+        await service.ack(again[0])
+        return first, again, await service.claim_due(), await lua_redis.keys("*")
+
+    first, again, after_ack, keys = asyncio.run(main())
+    assert [item.texts for item in first] == [["oi", "tudo bem?"]]
+    assert again[0].texts == ["oi", "tudo bem?"] and again[0].attempts == 2
+    assert after_ack == []
+    assert keys == []
+
+
+def test_failed_handler_is_retried_then_dropped(lua_redis):
+    service = _service(text_buffer_max_attempts=2)
+    calls: list[list[str]] = []
+
+    async def handler(item):
+        calls.append(item.texts)
+        raise RuntimeError("falhou")
+
+    async def main():
+        await service.append("c1", "oi", {"contato": "55"})
+        for _ in range(3):
+            for item in await service.claim_due():
+                await service._handle(item, handler)
+        return await lua_redis.keys("*")
+
+    keys = asyncio.run(main())
+    assert calls == [["oi"], ["oi"]]
+    assert keys == []
+
+
+def test_append_during_processing_is_kept(lua_redis):
+    service = _service()
+
+    async def main():
+        await service.append("c1", "oi", {"contato": "55"})
+        [item] = await service.claim_due()
+        await service.append("c1", "quero saber o valor", {"contato": "55"})
+        await service.ack(item)
+        return await service.claim_due()
+
+    [pending] = asyncio.run(main())
+    assert pending.texts == ["quero saber o valor"]
+
+
+def test_append_during_processing_waits_for_ack(lua_redis):
+    service = _service(text_buffer_visibility_seconds=60)
+
+    async def main():
+        await service.append("c1", "oi", {"contato": "55"})
+        [first] = await service.claim_due()
+        await service.append("c1", "valor?", {"contato": "55"})
+        # o lote em andamento nao volta a vencer por causa do append
+        during = await service.claim_due()
+        await service.ack(first)
+        return first, during, await service.claim_due()
+
+    first, during, after = asyncio.run(main())
+    assert first.texts == ["oi"]
+    assert during == []
+    assert [item.texts for item in after] == [["valor?"]]
+
+
+def test_stale_ack_keeps_newer_claim(lua_redis):
+    service = _service()
+
+    async def main():
+        await service.append("c1", "oi", {"contato": "55"})
+        [stale] = await service.claim_due()
+        await asyncio.sleep(0.01)
+        # visibilidade expirou: outra reivindicacao assume o lote
+        [current] = await service.claim_due()
+        await service.ack(stale)
+        return stale, current, await lua_redis.lrange(service._key("c1", "processing:texts"), 0, -1)
+
+    stale, current, processing = asyncio.run(main())
+    assert stale.claim_score != current.claim_score
+    assert processing == ["oi"]
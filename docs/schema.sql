@@ -281,6 +281,7 @@ create table if not exists conversation_events (
 
 create index if not exists idx_conversation_events_conversa on conversation_events(conversa_id, created_at desc);
 create index if not exists idx_conversation_events_agent on conversation_events(agent_key, created_at desc);
+create index if not exists idx_conversation_events_type on conversation_events(event_type, created_at desc);
 
 -- Seeds recomendados para agentes
 insert into ai_agents (key, nome, descricao)
@@ -291,7 +292,8 @@ values
   ('summarizer', 'Sumarizador', 'Resumo de conversas e eventos'),
   ('document_guardrail', 'Guarda de Documentos', 'Filtro de relevancia para anexos'),
   ('document_qa', 'QA de Documento', 'Responde usando PDF/DOCX enviados pelo lead'),
-  ('handoff_summary', 'Resumo para Handoff', 'Gera resumo e payload do lead para envio ao corretor')
+  ('handoff_summary', 'Resumo para Handoff', 'Gera resumo e payload do lead para envio ao corretor'),
+  ('router', 'Roteador', 'Classifica a intencao e responde perguntas em uma unica chamada')
 on conflict (key) do nothing;
 
 -- Indices recomendados
@@ -311,6 +313,115 @@ language sql stable as $$
   limit match_count;
 $$;
 
+-- Registra turnos (mensagem + ultima interacao/status da conversa + evento) em uma transacao.
+-- Cada item de `turns`: conversa_id, autor, tipo, conteudo, evolution_mensagem_id, status,
+-- event_type, event_payload, agent_key. Usado pelo backend via rpc('record_turns').
+-- Idempotente por evolution_mensagem_id: numa reentrega (retry do webhook ou do stream) a mensagem
+-- ja gravada e devolvida como esta, sem repetir o toque da conversa nem o evento.
+create or replace function public.record_turns(turns jsonb)
+returns setof public.mensagens
+language plpgsql as $$
+declare
+  t jsonb;
+  m public.mensagens;
+begin
+  for t in select value from jsonb_array_elements(turns) loop
+    insert into public.mensagens (conversa_id, autor, tipo, conteudo, evolution_mensagem_id)
+    values (
+      (t->>'conversa_id')::uuid,
+      t->>'autor',
+      coalesce(t->>'tipo', 'texto'),
+      t->>'conteudo',
+      nullif(t->>'evolution_mensagem_id', '')
+    )
+    on conflict (evolution_mensagem_id) do nothing
+    returning * into m;
+
+    if not found then
+      select * into m from public.mensagens
+      where evolution_mensagem_id = t->>'evolution_mensagem_id';
+      return next m;
+      continue;
+    end if;
+
+    update public.conversas c
+    set ultima_interacao_em = now(),
+        status = coalesce(nullif(t->>'status', ''), c.status)
+    where c.id = m.conversa_id;
+
+    if coalesce(t->>'event_type', '') <> '' then
+      insert into public.conversation_events (conversa_id, mensagem_id, event_type, agent_key, payload)
+      values (
+        m.conversa_id,
+        m.id,
+        t->>'event_type',
+        nullif(t->>'agent_key', ''),
+        coalesce(t->'event_payload', '{}'::jsonb)
+      );
+    end if;
+
+    return next m;
+  end loop;
+end;
+$$;
+
+-- Versao do corpus de documentos. Qualquer escrita em documentos/documentos_embeddings incrementa
+-- a versao; o backend a usa na chave do cache semantico de respostas do QA (entradas antigas
+-- deixam de ser lidas e expiram no Redis).
+create table if not exists corpus_versions (
+  nome text primary key,
+  versao bigint not null default 0,
+  atualizado_em timestamptz default now()
+);
+insert into corpus_versions (nome) values ('documentos') on conflict (nome) do nothing;
+
+create or replace function public.bump_corpus_version()
+returns trigger
+language plpgsql as $$
+begin
+  update public.corpus_versions set versao = versao + 1, atualizado_em = now() where nome = 'documentos';
+  return null;
+end;
+$$;
+
+drop trigger if exists trg_documentos_corpus_version on documentos;
+create trigger trg_documentos_corpus_version
+  after insert or update or delete or truncate on documentos
+  for each statement execute function public.bump_corpus_version();
+
+drop trigger if exists trg_documentos_embeddings_corpus_version on documentos_embeddings;
+create trigger trg_documentos_embeddings_corpus_version
+  after insert or update or delete or truncate on documentos_embeddings
+  for each statement execute function public.bump_corpus_version();
+
+-- Marca de alteracao por chunk: o indice vetorial local do backend baixa apenas as linhas
+-- alteradas desde a ultima sincronizacao. Mudar o empreendimento de um documento marca seus chunks.
+alter table documentos_embeddings add column if not exists atualizado_em timestamptz default now();
+create index if not exists idx_documentos_embeddings_atualizado on documentos_embeddings(atualizado_em);
+
+create or replace function public.touch_documentos_embeddings()
+returns trigger
+language plpgsql as $$
+begin
+  if tg_table_name = 'documentos_embeddings' then
+    new.atualizado_em = now();
+    return new;
+  end if;
+  update public.documentos_embeddings set atualizado_em = now() where documento_id = new.id;
+  return null;
+end;
+$$;
+
+drop trigger if exists trg_documentos_embeddings_atualizado on documentos_embeddings;
+create trigger trg_documentos_embeddings_atualizado
+  before update on documentos_embeddings
+  for each row execute function public.touch_documentos_embeddings();
+
+drop trigger if exists trg_documentos_empreendimento_atualizado on documentos;
+create trigger trg_documentos_empreendimento_atualizado
+  after update of empreendimento on documentos
+  for each row execute function public.touch_documentos_embeddings();
+
 -- =====================================================================================
 -- RLS (Row Level Security) - Painel Admin
 -- Observação:
@@ -563,6 +674,14 @@ values
     0.1,
     700,
     '{}'::jsonb
+  ),
+  (
+    'router',
+    'Classifique a mensagem do lead em seguir, encerrar, pergunta ou ruido (label). Somente se for pergunta, responda em answer usando apenas o contexto recuperado, em no máximo 4 frases.',
+    'gpt-4o-mini',
+    0,
+    450,
+    '{"enabled": false}'::jsonb
   )
 on conflict (agent_key) do update
 set
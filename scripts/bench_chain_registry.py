@@ -0,0 +1,66 @@
+"""
+Microbenchmark do custo de montar as chains LLM: construcao por chamada (prompt + ChatOpenAI +
+structured output, como era antes) versus lookup no `chain_registry`. Nenhuma chamada a OpenAI e
+feita; a config do agente e servida do cache em memoria do `agent_config_service`.
+
+Uso:
+    python scripts/bench_chain_registry.py --iterations 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+from app.chains import intention, qa  # noqa: E402
+from app.chains.registry import chain_registry  # noqa: E402
+from app.services.agent_config import _CacheEntry, agent_config_service  # noqa: E402
+
+
+def _per_call(module, config) -> None:
+    llm = ChatOpenAI(model=config.model, temperature=config.temperature, max_tokens=config.max_tokens)
+    module._build(config, llm)
+
+
+async def _bench(label: str, iterations: int, fn) -> None:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>28}: {elapsed / iterations * 1_000_000:9.1f}us/chamada")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    for module in (intention, qa):
+        config = module.DEFAULT_CONFIG
+        agent_config_service._cache[config.agent_key] = _CacheEntry(value=config, expires_at=float("inf"))
+
+        async def per_call(module=module, config=config) -> None:
+            _per_call(module, config)
+
+        async def registry(module=module, config=config) -> None:
+            await chain_registry.get(config.agent_key, config, module._build)
+
+        await _bench(f"{config.agent_key} por chamada", args.iterations, per_call)
+        await _bench(f"{config.agent_key} registry", args.iterations, registry)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Compara a latencia de resposta (p50/p95) do orquestrador nos modos sequencial e especulativo.
+
+Os estagios externos sao substituidos por esperas com latencia aleatoria (log-normal) em torno
+das medianas informadas: deteccao de intencao (LLM), embedding, `match_documents` e resposta do
+QA. Persistencia e envio via Evolution viram no-ops. A mistura de intencoes e controlada por
+`--question-ratio`.
+
+Uso:
+    python scripts/bench_speculative_retrieval.py --runs 200 --intent-ms 700 --embed-ms 150 --search-ms 120
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("INTENT_LOCAL_ENABLED", "false")
+
+from app import orchestrator  # noqa: E402
+from app.chains import qa  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.utils.metrics import metrics  # noqa: E402
+
+
+async def _sleep_ms(median_ms: float) -> None:
+    await asyncio.sleep(random.lognormvariate(0, 0.35) * median_ms / 1000)
+
+
+class _Noop:
+    def __getattr__(self, _name: str):
+        async def _call(*args: Any, **kwargs: Any) -> Any:
+            return {"id": "conversa", "status": "aguardando_resposta"}
+
+        return _call
+
+
+def _install_fakes(args: argparse.Namespace) -> None:
+    async def detect_intention(text: str):
+        await _sleep_ms(args.intent_ms)
+        label = "pergunta" if text.endswith("?") else "seguir"
+        return SimpleNamespace(label=label, rationale="bench")
+
+    async def retrieve_context(question: str, embedding: list[float] | None = None):
+        if embedding is None:
+            await _sleep_ms(args.embed_ms)
+            embedding = [0.0]
+        await _sleep_ms(args.search_ms)
+        return qa.QARetrieval(embedding=embedding, docs=[])
+
+    async def run_qa(question: str, retrieval=None) -> str:
+        if retrieval is None:
+            retrieval = await retrieve_context(question)
+        await _sleep_ms(args.answer_ms)
+        return "resposta"
+
+    orchestrator.detect_intention = detect_intention
+    orchestrator.retrieve_context = retrieve_context
+    orchestrator.run_qa = run_qa
+    orchestrator.conversation_service = _Noop()
+    orchestrator.conversations_repo = _Noop()
+    orchestrator.evolution_client = _Noop()
+    orchestrator.conversation_events_service = _Noop()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--question-ratio", type=float, default=0.6)
+    parser.add_argument("--intent-ms", type=float, default=700.0)
+    parser.add_argument("--embed-ms", type=float, default=150.0)
+    parser.add_argument("--search-ms", type=float, default=120.0)
+    parser.add_argument("--answer-ms", type=float, default=900.0)
+    args = parser.parse_args()
+
+    _install_fakes(args)
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _one(index: int) -> None:
+        texto = f"pergunta {index}?" if random.random() < args.question_ratio else f"ok {index}"
+        message = SimpleNamespace(contato="5511999999999", canal="whatsapp", conversa_id="conversa", conteudo=texto)
+        async with semaphore:
+            await orchestrator.process_message(message)
+
+    for mode in ("sequential", "speculative"):
+        settings.speculative_retrieval = mode == "speculative"
+        started = time.perf_counter()
+        await asyncio.gather(*(_one(i) for i in range(args.runs)))
+        elapsed = time.perf_counter() - started
+        for intent in ("pergunta", "seguir"):
+            p50 = metrics.percentile("reply_latency_seconds", 0.5, mode=mode, intent=intent)
+            p95 = metrics.percentile("reply_latency_seconds", 0.95, mode=mode, intent=intent)
+            if p50 is None:
+                continue
+            print(f"{mode:>11} {intent:>8}: p50={p50 * 1000:7.1f}ms  p95={p95 * 1000:7.1f}ms")
+        print(f"{mode:>11}    total: {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
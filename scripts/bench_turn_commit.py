@@ -0,0 +1,73 @@
+"""
+Compara o registro de um turno em chamadas separadas vs a RPC transacional `record_turns`.
+
+Usa o cliente Supabase falso de `bench_webhook_ingestion.py` (latencia por round trip via
+`--rtt-ms`) e mede, por turno de resposta do orquestrador:
+- separado: `log_message` + `touch_conversation` + `conversation_events.record`;
+- rpc: `record_turn` (uma chamada).
+
+Uso:
+    python scripts/bench_turn_commit.py --turns 50 --rtt-ms 25
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from bench_webhook_ingestion import LatencyClient  # noqa: E402  (ajusta o PYTHONPATH do backend)
+
+from app.repos.conversations import ConversationsRepository  # noqa: E402
+from app.services.conversations import ConversationService  # noqa: E402
+from app.services.events import ConversationEventsService  # noqa: E402
+
+
+async def separate(repo, conversations, events) -> None:
+    await repo.log_message("conversa", "sdr", "texto", "resposta")
+    await conversations.touch_conversation("conversa", status="respondendo_pergunta")
+    await events.record("conversa", "answer_sent", payload={"answer": "resposta"}, agent_key="qa")
+
+
+async def rpc(repo, conversations, events) -> None:
+    await repo.record_turn(
+        "conversa",
+        "sdr",
+        "texto",
+        "resposta",
+        status="respondendo_pergunta",
+        event_type="answer_sent",
+        event_payload={"answer": "resposta"},
+        agent_key="qa",
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=25.0)
+    args = parser.parse_args()
+
+    client = LatencyClient(args.rtt_ms)
+    repo = ConversationsRepository()
+    conversations = ConversationService()
+    events = ConversationEventsService()
+    for service in (repo, conversations, events):
+        service.client = client
+
+    for name, fn in (("separado", separate), ("rpc", rpc)):
+        timings: list[float] = []
+        client.calls = 0
+        for _ in range(args.turns):
+            started = time.perf_counter()
+            await fn(repo, conversations, events)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, round(0.95 * (len(timings) - 1)))]
+        print(
+            f"{name:>9}: p50={statistics.median(timings) * 1000:7.1f}ms  p95={p95 * 1000:7.1f}ms  "
+            f"round_trips/turno={client.calls / args.turns:4.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
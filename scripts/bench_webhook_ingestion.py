@@ -0,0 +1,169 @@
+"""
+Compara o custo de persistencia da ingestao por mensagem vs por lote.
+
+Substitui o cliente Supabase dos repositorios por um cliente falso que simula a latencia
+de cada round trip PostgREST (`--rtt-ms`), e mede tempo total e numero de chamadas para:
+- caminho por mensagem: dedupe + conversa + `record_turn` (mensagem, toque e evento), uma a uma;
+- caminho em lote (o do webhook): upsert de dedupe, uma conversa por contato e um `record_turns`.
+
+O cache Redis de conversa (`conversation_cache`) fica desligado: toda resolucao vai ao banco
+falso e o benchmark roda sem Redis.
+
+Uso:
+    python scripts/bench_webhook_ingestion.py --messages 50 --contacts 10 --rtt-ms 25
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+# garante que o pacote backend/app esteja no PYTHONPATH quando rodado fora do uvicorn
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# o benchmark nao toca o Supabase real; valores apenas para construir os clientes
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from app.repos.conversations import ConversationsRepository  # noqa: E402
+from app.services.conversation_cache import conversation_cache  # noqa: E402
+from app.services.conversations import ConversationService  # noqa: E402
+
+
+class _Result:
+    def __init__(self, data: list[dict[str, Any]]) -> None:
+        self.data = data
+
+
+class _FakeQuery:
+    def __init__(self, client: "LatencyClient", table: str) -> None:
+        self.client = client
+        self.table = table
+        self.rows: list[dict[str, Any]] | None = None
+
+    def insert(self, rows: Any) -> "_FakeQuery":
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows: Any, **_: Any) -> "_FakeQuery":
+        return self.insert(rows)
+
+    def __getattr__(self, _name: str):
+        # select/eq/in_/order/limit/update/delete: apenas encadeiam
+        return lambda *args, **kwargs: self
+
+    def execute(self) -> _Result:
+        self.client.calls += 1
+        time.sleep(self.client.rtt)
+        if self.rows is not None:
+            return _Result([{"id": str(uuid.uuid4()), **row} for row in self.rows])
+        if self.table == "leads":
+            return _Result([{"id": "lead", "nome": "Lead"}])
+        if self.table == "conversas":
+            return _Result([{"id": "conversa", "status": "aguardando_resposta"}])
+        return _Result([])
+
+
+class LatencyClient:
+    def __init__(self, rtt_ms: float) -> None:
+        self.rtt = rtt_ms / 1000
+        self.calls = 0
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict[str, Any]) -> _FakeQuery:
+        query = _FakeQuery(self, f"rpc:{name}")
+        if name == "record_turns":
+            query.rows = list(params["turns"])
+        return query
+
+
+def _messages(total: int, contacts: int) -> list[dict[str, str]]:
+    return [
+        {"mensagem_id": uuid.uuid4().hex, "contato": f"55119{i % contacts:08d}", "conteudo": f"mensagem {i}"}
+        for i in range(total)
+    ]
+
+
+async def _no_cache(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+async def per_message(repo, conversations, messages) -> None:
+    for m in messages:
+        await repo.register_incoming_message(m["mensagem_id"])
+        conversa = await conversations.ensure_active_conversation(contato=m["contato"])
+        await repo.record_turn(
+            conversa["id"],
+            "lead",
+            "texto",
+            m["conteudo"],
+            event_type="incoming_message",
+            event_payload={"tipo": "texto"},
+            evolution_mensagem_id=m["mensagem_id"],
+        )
+
+
+async def per_batch(repo, conversations, messages) -> None:
+    await repo.register_incoming_messages([m["mensagem_id"] for m in messages])
+    contacts = list(dict.fromkeys(m["contato"] for m in messages))
+    conversas = await asyncio.gather(*(conversations.ensure_active_conversation(contato=c) for c in contacts))
+    by_contact = {c: conversa["id"] for c, conversa in zip(contacts, conversas)}
+    await repo.record_turns(
+        [
+            {
+                "conversa_id": by_contact[m["contato"]],
+                "autor": "lead",
+                "tipo": "texto",
+                "conteudo": m["conteudo"],
+                "evolution_mensagem_id": m["mensagem_id"],
+                "event_type": "incoming_message",
+                "event_payload": {"tipo": "texto"},
+            }
+            for m in messages
+        ]
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--contacts", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=25.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    client = LatencyClient(args.rtt_ms)
+    repo = ConversationsRepository()
+    conversations = ConversationService()
+    for service in (repo, conversations):
+        service.client = client
+    conversation_cache.get = _no_cache
+    conversation_cache.set = _no_cache
+
+    for name, fn in (("por_mensagem", per_message), ("por_lote", per_batch)):
+        timings: list[float] = []
+        client.calls = 0
+        for _ in range(args.rounds):
+            messages = _messages(args.messages, args.contacts)
+            started = time.perf_counter()
+            await fn(repo, conversations, messages)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        print(
+            f"{name:>13}: melhor={best * 1000:8.1f}ms  por_msg={best * 1000 / args.messages:6.2f}ms  "
+            f"round_trips/lote={client.calls / args.rounds:6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Avalia recall@k e latencia (p50/p95) da busca nos modos vetorial, lexical (BM25 local) e hibrido
+(RRF) contra o Supabase/OpenAI configurados no ambiente.
+
+O arquivo de avaliacao e JSONL, uma pergunta por linha, com os trechos esperados nos chunks
+relevantes (basta um deles aparecer no chunk para contar como acerto):
+
+    {"question": "qual o valor do apto 302?", "expected": ["apto 302", "R$ 450"]}
+
+Uso:
+    python scripts/eval_hybrid_retrieval.py --dataset eval/retrieval.jsonl --k 5
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.chains import qa  # noqa: E402
+from app.services.lexical_index import lexical_index  # noqa: E402
+from app.utils.metrics import metrics  # noqa: E402
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def _hit(docs, expected: list[str]) -> bool:
+    needles = [item.lower() for item in expected]
+    return any(needle in doc.page_content.lower() for doc in docs for needle in needles)
+
+
+async def _search(mode: str, question: str, embedding: list[float]):
+    if mode == "lexical":
+        return lexical_index.search(question, k=qa.RETRIEVER_K)
+    return await qa.search_documents(question, embedding, mode=mode)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--k", type=int, default=qa.RETRIEVER_K)
+    args = parser.parse_args()
+    qa.RETRIEVER_K = args.k
+
+    cases = [json.loads(line) for line in Path(args.dataset).read_text(encoding="utf-8").splitlines() if line.strip()]
+    await lexical_index.refresh()
+    # embeddings fora da medicao: a comparacao e so da busca
+    vectors = await qa.embeddings.aembed_documents([case["question"] for case in cases])
+
+    for mode in MODES:
+        hits = 0
+        for case, embedding in zip(cases, vectors):
+            started = time.perf_counter()
+            docs = await _search(mode, case["question"], embedding)
+            metrics.observe("eval_retrieval_seconds", time.perf_counter() - started, mode=mode)
+            hits += _hit(docs, case["expected"])
+        p50 = metrics.percentile("eval_retrieval_seconds", 0.5, mode=mode) or 0.0
+        p95 = metrics.percentile("eval_retrieval_seconds", 0.95, mode=mode) or 0.0
+        print(
+            f"{mode:>8}: recall@{args.k}={hits / max(1, len(cases)):.3f}  "
+            f"p50={p50 * 1000:7.1f}ms  p95={p95 * 1000:7.1f}ms"
+        )
+    print(f"casos={len(cases)} chunks_indexados={lexical_index.size}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
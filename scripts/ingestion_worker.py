@@ -0,0 +1,32 @@
+import asyncio
+import signal
+import sys
+from pathlib import Path
+
+# garante que o pacote backend/app esteja no PYTHONPATH quando rodado fora do uvicorn
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.config import get_settings
+from app.routes.webhook import handle_inbound_message
+from app.services.ingestion import ingestion_queue
+from app.utils.tasks import document_tasks
+
+
+async def main() -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    print(f"[ingestion] worker {ingestion_queue.worker_id} iniciado")
+    try:
+        await ingestion_queue.run_worker(handle_inbound_message, stop_event)
+    finally:
+        # documentos ja confirmados no stream rodam em background: espera terminarem antes de sair
+        await document_tasks.drain(get_settings().document_drain_timeout_seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())